@@ -0,0 +1,252 @@
+# api.py
+# Service HTTP/JSON local, sans interface : les agrégats de l'app (KPIs, profils horaires,
+# moyennes annuelles/mensuelles, dépassements) pour d'autres tableaux de bord.
+#
+#   python api.py                              # http://127.0.0.1:8765
+#   python api.py --host 0.0.0.0 --port 9000
+#   python api.py --load 500 --concurrency 8   # test de charge contre un service déjà lancé
+#
+# Points d'entrée :
+#   GET  /health                     version des données
+#   GET  /meta                       polluants, années, mois, tables disponibles
+#   GET  /tables?pollutants=NO2,O3&years=2024&months=8,9&hours=6-9&tables=kpis,hourly
+#   POST /batch   {"states": [{"pollutants": ["NO2"], "years": [2024], "hour_range": [6, 9]}, ...]}
+# Réponse JSON par défaut ; Arrow IPC (flux) avec ?format=arrow&table=<table> ou l'en-tête
+# Accept: application/vnd.apache.arrow.stream — une table, une ligne par état et colonne `requete`.
+import argparse
+import hashlib
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.io import read_cube, scan_parquet, data_version
+from utils.prep import build_cube
+from utils.service import AggregationService, parse_state
+
+DATA_PATH = "data/processed/air_quality.parquet"
+DATASET_DIR = "data/processed/air_quality"
+MANIFEST_PATH = "data/processed/manifest.json"
+CUBE_PATH = "data/processed/cube.parquet"
+CUBE_DIR = "data/processed/cube"
+ANALYSIS_COLUMNS = ("date_heure", "pollutant", "value", "station_code", "annee", "mois", "jour", "heure")
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MAX_BODY = 1 << 20      # octets acceptés pour un lot
+
+if Path(DATASET_DIR).is_dir():
+    DATA_PATH = DATASET_DIR
+    CUBE_PATH = CUBE_DIR
+
+log = logging.getLogger("airq.api")
+
+_service = None
+_service_lock = threading.Lock()
+
+def load_service():
+    """Service de la version courante : reconstruit (cube relu) dès que la version change."""
+    global _service
+    version = data_version(DATA_PATH, MANIFEST_PATH)
+    if version is None:
+        raise FileNotFoundError(f"{DATA_PATH} : lancer d'abord python merge_data.py")
+    with _service_lock:
+        if _service is None or _service.version != version:
+            t0 = time.perf_counter()
+            cube = (read_cube(CUBE_PATH) if Path(CUBE_PATH).exists()
+                    else build_cube(scan_parquet(DATA_PATH, ANALYSIS_COLUMNS)))
+            _service = AggregationService(cube, version)
+            log.info("version %s chargée en %.2f s (%d cellules)", version, time.perf_counter() - t0, len(cube))
+        return _service
+
+def _records(table):
+    return table if isinstance(table, dict) else json.loads(table.to_json(orient="records", date_format="iso"))
+
+def _arrow(results, name):
+    """Une table Arrow pour tout le lot : la table `name` de chaque état, colonne `requete`."""
+    parts = [(pd.DataFrame([r[name]]) if name == "kpis" else r[name]).assign(requete=i)
+             for i, r in enumerate(results)]
+    df = pd.concat(parts, ignore_index=True)
+    df = df.astype({c: str for c in df.select_dtypes("category")})
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _list(q, name, cast=str):
+    v = q.get(name)
+    return None if not v else [cast(x) for x in ",".join(v).split(",") if x]
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "airq-api/1"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        log.debug("%s %s", self.address_string(), fmt % args)
+
+    def _send(self, code, body, ctype="application/json", headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code, obj, headers=None):
+        self._send(code, json.dumps(obj, ensure_ascii=False).encode(), headers=headers)
+
+    def _error(self, code, msg):
+        self._json(code, {"error": msg})
+
+    def _answer(self, states, q, raw):
+        """Réponse d'un lot ; ETag = version + requête : 304 sans calcul si le client l'a déjà."""
+        svc = load_service()
+        etag = f'"{svc.version}-{hashlib.sha1(raw).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "X-Data-Version": str(svc.version)}
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        fmt = (q.get("format") or [""])[0] or ("arrow" if ARROW_STREAM in self.headers.get("Accept", "") else "json")
+        states = [parse_state(s) for s in states]
+        if fmt == "arrow":
+            name = (q.get("table") or [""])[0]
+            if not all(name in s["tables"] for s in states):
+                raise ValueError("format arrow : paramètre `table` requis, demandé par chaque état")
+        t0 = time.perf_counter()
+        results = svc.batch(states)
+        headers["X-Compute-Ms"] = f"{(time.perf_counter() - t0) * 1000:.1f}"
+        if fmt == "arrow":
+            self._send(200, _arrow(results, name), ARROW_STREAM, headers)
+        else:
+            self._json(200, {"version": svc.version,
+                             "results": [{t: _records(v) for t, v in r.items()} for r in results]}, headers)
+
+    def _dispatch(self, fn):
+        try:
+            fn()
+        except ValueError as e:
+            self._error(400, str(e))
+        except FileNotFoundError as e:
+            self._error(503, str(e))
+        except Exception as e:      # une requête fautive ne doit pas arrêter le service
+            log.exception("requête %s", self.path)
+            self._error(500, f"{type(e).__name__}: {e}")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        q = parse_qs(url.query)
+        if url.path == "/health":
+            self._dispatch(lambda: self._json(200, {"status": "ok", "version": load_service().version}))
+        elif url.path == "/meta":
+            self._dispatch(lambda: self._json(200, load_service().meta()))
+        elif url.path == "/tables":
+            def run():
+                hours = (q.get("hours") or ["0-23"])[0].split("-")
+                state = {"pollutants": _list(q, "pollutants"), "years": _list(q, "years", int),
+                         "months": _list(q, "months", int), "hour_range": hours,
+                         "regulatory": (q.get("regulatory") or ["0"])[0] == "1"}
+                if _list(q, "tables"):
+                    state["tables"] = _list(q, "tables")
+                self._answer([state], q, url.query.encode())
+            self._dispatch(run)
+        else:
+            self._error(404, f"inconnu : {url.path}")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/batch":
+            return self._error(404, f"inconnu : {url.path}")
+        n = int(self.headers.get("Content-Length") or 0)
+        if n > MAX_BODY:
+            return self._error(413, f"lot limité à {MAX_BODY} octets")
+        raw = self.rfile.read(n)
+
+        def run():
+            try:
+                body = json.loads(raw or b"{}")
+            except json.JSONDecodeError as e:
+                raise ValueError(f"JSON invalide : {e}") from None
+            states = body.get("states") if isinstance(body, dict) else None
+            if not isinstance(states, list) or not states:
+                raise ValueError("`states` : liste non vide d'états de filtres")
+            self._answer(states, parse_qs(url.query), raw + url.query.encode())
+        self._dispatch(run)
+
+# Test de charge : lots aléatoires tirés des valeurs de /meta, latences par requête
+def load_test(url, n, concurrency, batch, seed=0):
+    with urllib.request.urlopen(f"{url}/meta") as r:
+        meta = json.load(r)
+    rng = random.Random(seed)
+
+    def state():
+        h0 = rng.randrange(24)
+        return {"pollutants": rng.sample(meta["pollutants"], k=min(2, len(meta["pollutants"]))),
+                "years": rng.sample(meta["years"], k=rng.randint(1, len(meta["years"]))),
+                "months": rng.sample(meta["months"], k=rng.randint(1, len(meta["months"]))),
+                "hour_range": [h0, rng.randrange(h0, 24)]}
+    bodies = [json.dumps({"states": [state() for _ in range(batch)]}).encode() for _ in range(n)]
+
+    def call(body):
+        req = urllib.request.Request(f"{url}/batch", body, {"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as r:
+                r.read()
+            ok = True
+        except urllib.error.URLError:
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        res = list(pool.map(call, bodies))
+    wall = time.perf_counter() - t0
+    lat = sorted(t for t, ok in res if ok)
+    pct = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))] * 1000 if lat else float("nan")
+    print(f"{n} requêtes × {batch} états, {concurrency} clients : {n / wall:.0f} req/s, "
+          f"{sum(not ok for _, ok in res)} échec(s)")
+    print(f"latence p50 {pct(0.5):.1f} ms · p95 {pct(0.95):.1f} ms · p99 {pct(0.99):.1f} ms"
+          + (f" · moyenne {statistics.mean(lat) * 1000:.1f} ms" if lat else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Service HTTP/JSON local des agrégats qualité de l'air.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--load", type=int, metavar="N", help="test de charge : N requêtes contre --url")
+    parser.add_argument("--url", default=None, help="service testé (défaut : http://<host>:<port>)")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients simultanés du test de charge")
+    parser.add_argument("--batch", type=int, default=4, help="états par requête du test de charge")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    if args.load:
+        load_test(args.url or f"http://{args.host}:{args.port}", args.load, args.concurrency, args.batch)
+        return
+    load_service()      # premier chargement avant d'accepter des requêtes
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Service sur http://{args.host}:{args.port} (Ctrl+C pour arrêter)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Arrêt.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
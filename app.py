@@ -1,30 +1,274 @@
 # app.py
-import streamlit as st
+import hashlib
+import os
+from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from utils.io import (scan_table, read_cube, filter_expression, list_partitions, cube_fragments,
+                      write_ipc, open_ipc, arrow_view, companion_ipc, data_version)
+from utils.prep import combine_cubes, build_cube
+from utils.rangeindex import HourRangeIndex
+from utils.filters import FilterEngine
+from utils.sql import SQLBackend
+from utils.exceedances import ExceedanceEngine
+from utils.correlation import CorrelationEngine
+from utils.rollups import RollupEngine, rollup_grains
+from utils.anomalies import AnomalyEngine
+from utils.catalog import read_catalog, build_catalog
+from utils.quality import read_quality
+from utils.stations import read_stations, station_table, SpatialIndex
+from utils.prefetch import Prefetcher
+from utils.resultcache import ResultCache
+from utils.perf import timed, miss, note, start_run, records, panel as perf_panel
 
 from sections.introduction import render as intro_render
-from sections.overview import sidebar_filters as overview_filters, render as overview_render
-from sections.deep_dives import sidebar_filters as deep_filters, render as deep_render
+from sections.overview import (sidebar_filters as overview_filters, render as overview_render,
+                               prefetch_jobs as overview_prefetch)
+from sections.deep_dives import (sidebar_filters as deep_filters, render as deep_render,
+                                 prefetch_jobs as deep_prefetch)
 from sections.conclusions import render as conclu_render
 
 st.set_page_config(page_title="Air Quality — Data Story", layout="wide")
+start_run()
 
 DATA_PATH = "data/processed/air_quality.parquet"
+DATASET_DIR = "data/processed/air_quality"      # build incrémental (merge_data.py --incremental)
+MANIFEST_PATH = "data/processed/manifest.json"
+CUBE_PATH = "data/processed/cube.parquet"       # cube d'agrégats écrit par merge_data.py
+CUBE_DIR = "data/processed/cube"
+STATIONS_PATH = "data/processed/stations.parquet"   # dimension stations (merge_data.py)
+CATALOG_PATH = "data/processed/catalog.json"        # catalogue (page Introduction)
+QUALITY_PATH = "data/processed/quality.parquet"     # rapport qualité (Overview)
+IPC_DIR = "data/processed/cache"                # tables Arrow IPC mappées en mémoire (cf. load_table)
 
-@st.cache_data(show_spinner=False)
-def load_data(path):
-    """Charge le parquet une seule fois (cache)."""
+# Moteur d'agrégation : "pandas" (en mémoire) ou "duckdb" (SQL hors mémoire sur les Parquet)
+QUERY_ENGINE = os.environ.get("AIRQ_ENGINE", "pandas")
+# Moteurs en mémoire construits depuis le cube ou, à défaut, les lignes (dépassements fenêtrés,
+# corrélations, séries longues, anomalies) : pas en mode duckdb, qui ne charge aucune ligne
+IN_MEMORY_ENGINES = QUERY_ENGINE != "duckdb"
+# Panneau « perf » (temps, lignes, mémoire, cache par étape) ouvert par défaut si AIRQ_PERF=1
+PERF_PANEL = os.environ.get("AIRQ_PERF") == "1"
+# Mode live (python watch.py en parallèle) : AIRQ_LIVE=<secondes> = période de contrôle de la version
+LIVE_EVERY = float(os.environ.get("AIRQ_LIVE") or 0)
+# Préchauffage des états de filtres voisins en arrière-plan (moteur pandas) ; AIRQ_PREFETCH=0 le coupe
+PREFETCH = os.environ.get("AIRQ_PREFETCH", "1") != "0"
+# Cache de résultats sur disque (tables Overview, nuage et dépassements Deep-dives) partagé par les
+# processus / répliques : AIRQ_RESULT_CACHE=<dossier> (volume partagé), "0" le coupe ; taille en Mo
+RESULT_CACHE_DIR = os.environ.get("AIRQ_RESULT_CACHE", "data/processed/cache/results")
+RESULT_CACHE_MB = float(os.environ.get("AIRQ_RESULT_CACHE_MB") or 512)
+PARTITION_CACHE = 2048      # partitions jour / fragments de cube gardés en mémoire (Arrow)
+
+if Path(DATASET_DIR).is_dir():
+    DATA_PATH = DATASET_DIR
+    CUBE_PATH = CUBE_DIR
+
+def _data_version(path):
+    """Jeton de version : change à chaque (ré)ingestion, invalide le cache."""
+    return data_version(path, MANIFEST_PATH)
+
+# Colonnes lues par page : chaque page ne décode que ce qu'elle affiche
+INTRO_COLUMNS = ("date_heure", "pollutant", "value", "unit", "station_code", "station_name",
+                 "annee", "mois", "jour", "heure", "lat", "lon")
+ANALYSIS_COLUMNS = ("date_heure", "pollutant", "value", "station_code", "annee", "mois", "jour", "heure")
+ANALYSIS_MONTHS = (8, 9)    # seuls mois sélectionnables dans les filtres Overview / Deep-dives
+
+@st.cache_resource(show_spinner=False, max_entries=PARTITION_CACHE)
+def load_partition(root, part, token, columns=None):
+    """Une partition jour du dataset incrémental en Arrow, relue seulement quand son jeton
+    change : une ré-ingestion n'invalide que les jours qu'elle a réécrits."""
+    return scan_table(Path(root) / part, columns, partition_base_dir=root)
+
+@st.cache_resource(show_spinner=False, max_entries=PARTITION_CACHE)
+def load_cube_fragment(path, token):
+    """Un fragment de cube (un fichier brut), relu seulement quand son jeton change."""
     return pd.read_parquet(path)
 
-try:
-    df = load_data(DATA_PATH)
-except FileNotFoundError:
-    st.error(f"Fichier introuvable : {DATA_PATH}\n\n"
-             "Lance d’abord : `python merge_data.py` pour créer la base.")
-    st.stop()
-except Exception as e:
-    st.error(f"Impossible de lire {DATA_PATH}\n\nDétail : {e}")
-    st.stop()
+def _scan(path, columns=None, pollutants=None, years=None, months=None, hour_range=None):
+    """Table Arrow d'une sélection : colonnes et prédicats poussés au scanner Arrow ; sur le
+    dataset partitionné, les jours inchangés depuis la version précédente viennent du cache
+    de partitions."""
+    if not Path(path).is_dir():
+        ipc = companion_ipc(path)
+        if ipc is None:
+            return scan_table(path, columns, pollutants, years, months, hour_range)
+        # copie IPC écrite par save_parquet : mappée, filtrée en Arrow, aucun décodage Parquet
+        table = open_ipc(ipc)
+        expr = filter_expression(pollutants, years, months, hour_range)
+        if expr is not None:
+            table = table.filter(expr)
+        return table.select([c for c in columns if c in table.column_names]) if columns is not None else table
+    parts = list_partitions(path, years, months)
+    if not parts:
+        raise FileNotFoundError(path)
+    needed = None if columns is None else tuple(dict.fromkeys(
+        list(columns) + (["pollutant"] if pollutants is not None else [])
+        + (["heure"] if hour_range is not None else [])))
+    table = pa.concat_tables([load_partition(path, part, token, needed) for part, token in parts],
+                             promote_options="permissive")
+    expr = filter_expression(pollutants, None, None, hour_range)
+    if expr is not None:
+        table = table.filter(expr)
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+    note(partitions=len(parts))
+    return table
+
+@timed("load_table", cache=True)
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_table(path, version=None, columns=None, pollutants=None, years=None, months=None, hour_range=None):
+    """Table Arrow partagée d'une sélection, mappée en mémoire depuis un cache IPC.
+
+    Écrit une fois par version (data/processed/cache/<sélection>-<version>.arrow), puis
+    relue sans copie : les sessions — et les autres processus Streamlit — partagent les
+    mêmes pages.
+    """
+    miss()
+    if companion_ipc(path) is not None and (pollutants, years, months, hour_range) == (None,) * 4:
+        return _scan(path, columns)     # simple projection de la copie mappée : rien à écrire
+    key = hashlib.sha1(repr((str(path), columns, pollutants, years, months, hour_range)).encode()).hexdigest()[:16]
+    ipc = Path(IPC_DIR) / f"{key}-{version}.arrow"
+    if not ipc.exists():
+        write_ipc(_scan(path, columns, pollutants, years, months, hour_range), ipc)
+        for old in Path(IPC_DIR).glob(f"{key}-*.arrow"):
+            if old != ipc:
+                try:
+                    old.unlink()
+                except OSError:     # encore mappé (Windows) : supprimé à la prochaine version
+                    pass
+    return open_ipc(ipc)
+
+@timed("load_data", cache=True)
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_data(path, version=None, columns=None, pollutants=None, years=None, months=None, hour_range=None):
+    """DataFrame partagé (une instance par processus, pas une copie par session) sur la table
+    mappée de load_table. Lecture seule : les sections filtrent par vues, sans modification
+    en place."""
+    miss()
+    return arrow_view(load_table(path, version, columns, pollutants, years, months, hour_range))
+
+@timed("load_cube", cache=True)
+@st.cache_data(show_spinner=False)
+def load_cube(path, version=None):
+    """Charge le cube d'agrégats (None s'il n'a pas encore été construit)."""
+    miss()
+    if not Path(path).exists():
+        return None
+    if Path(path).is_dir():
+        frags = cube_fragments(path)
+        if not frags:
+            return None
+        return combine_cubes([load_cube_fragment(f, token) for f, token in frags])
+    return read_cube(path)
+
+@timed("load_index", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_index(path, version=None):
+    """Index plage horaire (sommes préfixes / sparse tables), partagé en lecture seule."""
+    miss()
+    base = load_cube(path, version)
+    return HourRangeIndex(base if base is not None else load_analysis_rows(version))
+
+@timed("load_filter_engine", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_filter_engine(path, version=None):
+    """Moteur de filtres (tri + offsets + LRU), partagé par toutes les sessions."""
+    miss()
+    base = load_cube(path, version)
+    return FilterEngine(base if base is not None else load_analysis_rows(version))
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_result_cache(version=None):
+    """Cache disque des résultats pour la version courante (None s'il est coupé)."""
+    if RESULT_CACHE_DIR in ("", "0"):
+        return None
+    return ResultCache(RESULT_CACHE_DIR, version, max_bytes=int(RESULT_CACHE_MB * (1 << 20)))
+
+@st.cache_resource(show_spinner=False)
+def load_prefetcher():
+    """Pool de préchauffage unique pour le processus (toutes sessions confondues)."""
+    return Prefetcher()
+
+@timed("load_exceedances", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_exceedances(path, version=None):
+    """Table des dépassements (toutes fenêtres, tous polluants), calculée une fois par version."""
+    miss()
+    base = load_cube(path, version)
+    return ExceedanceEngine(base if base is not None else load_analysis_rows(version))
+
+@timed("load_correlations", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_correlations(path, version=None):
+    """Corrélations de toutes les paires de polluants par (annee, mois), une fois par version."""
+    miss()
+    base = load_cube(path, version)
+    return CorrelationEngine(base if base is not None else load_analysis_rows(version))
+
+@timed("load_catalog", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_catalog(path, version=None):
+    """Catalogue du jeu de données (effectifs, disponibilité, dernières mesures, aperçu) ; à
+    défaut (base construite avant le catalogue), calculé une fois depuis les lignes."""
+    miss()
+    cat = read_catalog(path)
+    return cat if cat is not None else build_catalog(load_data(DATA_PATH, version, columns=INTRO_COLUMNS))
+
+@timed("load_quality", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_quality(path, version=None):
+    """Rapport qualité écrit par merge_data.py (None si la base a été construite avant)."""
+    miss()
+    return read_quality(path)
+
+@timed("load_stations", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_stations(path, version=None):
+    """Dimension stations et son index spatial ; à défaut de dimension (base construite
+    avant), dérivée des dernières mesures du catalogue."""
+    miss()
+    dim = read_stations(path)
+    if dim is None:
+        dim = station_table(load_catalog(CATALOG_PATH, version)["dernieres"])
+    return dim, SpatialIndex(dim)
+
+@st.cache_resource(show_spinner=False, max_entries=PARTITION_CACHE)
+def load_rollup_fragment(path, token):
+    """Tables jour/semaine/mois d'un fragment de cube, recalculées seulement s'il change."""
+    return rollup_grains(load_cube_fragment(path, token))
+
+@timed("load_rollups", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_rollups(path, version=None):
+    """Agrégats heure → jour → semaine → mois (séries longues) ; en mode incrémental, seuls
+    les fragments nouveaux ou réécrits sont ré-agrégés."""
+    miss()
+    base = load_cube(path, version)
+    if base is None:
+        return RollupEngine(build_cube(load_analysis_rows(version)))
+    parts = [load_rollup_fragment(f, token) for f, token in cube_fragments(path)] if Path(path).is_dir() else None
+    return RollupEngine(base, parts)
+
+@timed("load_anomalies", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_anomalies(path, version=None):
+    """Références médiane/MAD par station × heure × polluant (août) et scores de septembre."""
+    miss()
+    base = load_cube(path, version)
+    return AnomalyEngine(base if base is not None else load_analysis_rows(version))
+
+@timed("load_sql_backend", cache=True)
+@st.cache_resource(show_spinner=False)
+def load_sql_backend(path, version=None):
+    """Moteur DuckDB sur les fichiers Parquet (mêmes interfaces que filtres + index)."""
+    miss()
+    return SQLBackend(path)
+
+@timed("load_analysis_rows")
+def load_analysis_rows(version):
+    """Lignes brutes des pages d'analyse, à défaut de cube : colonnes utiles, mois filtrables."""
+    return load_data(DATA_PATH, version, columns=ANALYSIS_COLUMNS, months=ANALYSIS_MONTHS)
 
 # Navigation
 st.sidebar.header("Navigation")
@@ -34,24 +278,67 @@ page = st.sidebar.radio(
     index=0,
 )
 
+version = _data_version(DATA_PATH)
+try:
+    if page == "Introduction":
+        catalog = load_catalog(CATALOG_PATH, version)
+    elif page in ("Overview", "Deep-dives") and QUERY_ENGINE == "duckdb":
+        hour_index = filter_engine = load_sql_backend(DATA_PATH, version)
+    elif page in ("Overview", "Deep-dives"):
+        hour_index = load_index(CUBE_PATH, version)
+        filter_engine = load_filter_engine(CUBE_PATH, version)
+except FileNotFoundError:
+    st.error(f"Fichier introuvable : {DATA_PATH}\n\n"
+             "Lance d’abord : `python merge_data.py` pour créer la base.")
+    st.stop()
+except Exception as e:
+    st.error(f"Impossible de lire {DATA_PATH}\n\nDétail : {e}")
+    st.stop()
 
-# Filtres 
-filtered_df = df
-filter_state = {}
 
+# Filtres (sur le cube s'il existe : la latence ne dépend plus du nombre de lignes brutes)
 if page == "Overview":
-    filtered_df, filter_state = overview_filters(df) 
+    filtered_df, filter_state = overview_filters(None, engine=filter_engine)
 elif page == "Deep-dives":
-    filtered_df, filter_state = deep_filters(df) 
+    filtered_df, filter_state = deep_filters(None, engine=filter_engine)
 
 if page == "Introduction":
-    intro_render(df)
+    stations, station_index = load_stations(STATIONS_PATH, version)
+    intro_render(catalog, stations, station_index)
 
 elif page == "Overview":
-    overview_render(filtered_df, filter_state)
+    overview_render(filtered_df, filter_state, index=hour_index,
+                    trends=load_rollups(CUBE_PATH, version) if IN_MEMORY_ENGINES else None,
+                    anomalies=load_anomalies(CUBE_PATH, version) if IN_MEMORY_ENGINES else None,
+                    quality=load_quality(QUALITY_PATH, version), results=load_result_cache(version))
 
 elif page == "Deep-dives":
-    deep_render(filtered_df, filter_state)
+    # mode duckdb : dépassements horaires calculés par SQL (index.range_cube), sans matrice de corrélations
+    deep_render(filtered_df, filter_state, index=hour_index,
+                exceed=load_exceedances(CUBE_PATH, version) if IN_MEMORY_ENGINES else None,
+                corr=load_correlations(CUBE_PATH, version) if IN_MEMORY_ENGINES else None,
+                results=load_result_cache(version))
 
 elif page == "Conclusion":
     conclu_render()
+
+if PREFETCH and QUERY_ENGINE != "duckdb" and page in ("Overview", "Deep-dives"):
+    # Page rendue : on remplit les LRU des moteurs pour les états que l'utilisateur demandera ensuite
+    jobs = (overview_prefetch(filter_state, filter_engine, hour_index) if page == "Overview"
+            else deep_prefetch(filter_state, filter_engine))
+    prefetcher = load_prefetcher()
+    for key, fn in jobs:
+        prefetcher.submit(version, key, fn)
+
+if LIVE_EVERY:
+    # Contrôle périodique du jeton de version (manifeste) : rerun complet dès qu'une ingestion aboutit
+    @st.fragment(run_every=LIVE_EVERY)
+    def _live(seen):
+        if _data_version(DATA_PATH) != seen:
+            st.rerun()
+
+    st.sidebar.caption(f"Mode live : version contrôlée toutes les {LIVE_EVERY:g} s")
+    _live(version)
+
+if st.sidebar.checkbox("Perf", value=PERF_PANEL, help="Temps, lignes, mémoire et cache de chaque étape de ce rerun"):
+    perf_panel(st.sidebar.expander("Mesures", expanded=True), records())
@@ -0,0 +1,362 @@
+# bench.py
+# Usage : python bench.py [--rows 10k 1M ...] [--repeat 3] [--memory] [--seed 0] [--compare data/bench/<run>.json]
+#   --rows    : tailles des jeux E2 synthétiques (suffixes k / M), générés une fois dans data/synth/
+#   --memory  : mesure aussi le pic d'allocation de chaque étape (tracemalloc, passe séparée)
+#   --compare : affiche les écarts de temps avec un run précédent
+# Les résultats (temps, mémoire, contrôles) sont écrits dans data/bench/<horodatage>.json.
+# Code de sortie 1 si un contrôle « golden » échoue.
+import argparse
+import json
+import platform
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from streamlit import config as st_config
+from streamlit.logger import set_log_level
+
+from utils.io import load_from_list
+from utils.perf import peak_rss_mb
+from utils.prep import THRESHOLDS, DEDUP_KEYS, norm_pollutant_key, clean_data, build_cube, make_tables
+from utils.filters import FilterEngine
+from utils.rangeindex import HourRangeIndex
+from utils.exceedances import ExceedanceEngine
+from utils.correlation import CorrelationEngine, ROW_KEYS
+from utils.rollups import RollupEngine
+from utils.anomalies import AnomalyEngine, KEYS as ANOMALY_KEYS
+from utils.quality import build_quality
+from utils.service import AggregationService, parse_state
+from utils.resultcache import ResultCache
+from utils.synth import write_e2
+from sections.overview import sidebar_filters as overview_filters
+from sections.deep_dives import sidebar_filters as deep_filters, _hourly_profile, _exceedances
+
+SYNTH_DIR = Path("data/synth")
+RESULTS_DIR = Path("data/bench")
+
+# États de filtres rejoués (sélections typiques des pages Overview / Deep-dives)
+STATES = [
+    {"pollutants": ["NO2"], "years": [2024, 2025], "months": [8, 9], "hour_range": (0, 23)},
+    {"pollutants": ["PM10"], "years": [2024], "months": [9], "hour_range": (6, 9)},
+    {"pollutants": ["O3", "NO2"], "years": [2025], "months": [8], "hour_range": (12, 18)},
+]
+
+# les widgets Streamlit appelés hors `streamlit run` renvoient leur valeur par défaut (mode « bare ») ;
+# la config est chargée avant de baisser le niveau de log, sinon son chargement le rétablit
+st_config.get_option("logger.level")
+set_log_level("error")
+
+
+# Implémentations pandas d'origine : référence des contrôles « golden »
+def _ref_filter(df, pollutants=None, years=None, months=None, hour_range=None):
+    d = df
+    if pollutants is not None:
+        d = d[d["pollutant"].isin(pollutants)]
+    if years is not None:
+        d = d[d["annee"].isin(years)]
+    if months is not None:
+        d = d[d["mois"].isin(months)]
+    if hour_range is not None:
+        d = d[(d["heure"] >= hour_range[0]) & (d["heure"] <= hour_range[1])]
+    return d
+
+def _ref_tables(df):
+    df = df.assign(value=df["value"].astype("float64"))
+    tables = {"kpis": {
+        "nb_rows": int(len(df)),
+        "nb_days": int(df["jour"].nunique()),
+        "nb_stations": int(df["station_code"].nunique()),
+        "mean": float(df["value"].mean()),
+        "max": float(df["value"].max()),
+    }}
+    tables["hourly"] = (
+        df.groupby(["annee", "heure", "pollutant"], as_index=False, observed=True)["value"].agg(mean="mean", max="max")
+    )
+    tables["year_avg"] = (
+        df.groupby(["annee", "pollutant"], as_index=False, observed=True)["value"].mean()
+          .rename(columns={"value": "moyenne"})
+    )
+    d = df[df["mois"].isin([8, 9])].copy()
+    d["mois_label"] = d["mois"].map({8: "Août", 9: "Septembre"}).fillna(d["mois"].astype(str))
+    tables["month_avg"] = (
+        d.groupby(["annee", "mois_label", "pollutant"], as_index=False, observed=True)["value"].mean()
+         .rename(columns={"value": "moyenne"})
+    )
+    return tables
+
+def _ref_hourly_profile(df, agg):
+    return (
+        df.assign(value=df["value"].astype("float64"))
+          .groupby(["annee", "heure"])["value"].agg(agg).reset_index()
+          .pivot(index="heure", columns="annee", values="value")
+          .sort_index()
+    )
+
+def _ref_exceedances(df, pollutant, years):
+    thr = THRESHOLDS[norm_pollutant_key(pollutant)]
+    d = df[df["pollutant"] == pollutant]
+    out = (d["value"] > thr).groupby(d["annee"]).sum().rename("depassements")
+    return out.reindex(years, fill_value=0).rename_axis("annee").reset_index()
+
+def _ref_corr(df, years, months):
+    d = df[df["annee"].isin(years) & df["mois"].isin(months)]
+    wide = d.pivot_table(index=ROW_KEYS, columns="pollutant", values="value", aggfunc="mean", observed=True)
+    corr = wide.astype("float64").corr(min_periods=3)
+    corr.index, corr.columns = corr.index.astype(str), corr.columns.astype(str)
+    return corr
+
+def _ref_monthly(df, pollutant):
+    d = df[df["pollutant"] == pollutant]
+    return (d["value"].astype("float64").groupby(d["date_heure"].dt.to_period("M").dt.start_time).mean()
+              .rename("mean").rename_axis("periode").reset_index())
+
+
+def _ref_baseline(df):
+    d = df[df["mois"] == 8].assign(value=df["value"].astype("float64"))
+    med = d.groupby(ANOMALY_KEYS, observed=True)["value"].median().rename("mediane").reset_index()
+    d = d.merge(med, on=ANOMALY_KEYS)
+    mad = (d["value"] - d["mediane"]).abs().groupby([d[k] for k in ANOMALY_KEYS], observed=True).median()
+    return med.merge(mad.rename("mad").reset_index(), on=ANOMALY_KEYS)
+
+
+# Mesure
+def _rows(out):
+    if isinstance(out, tuple):
+        out = out[0]
+    return len(out) if hasattr(out, "__len__") and not isinstance(out, dict) else None
+
+def measure(name, fn, repeat=1, memory=False, rows_in=None):
+    """Exécute `fn` `repeat` fois (temps min/médian), puis une passe tracemalloc si `memory`."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    rec = {"stage": name, "rows_in": rows_in, "rows_out": _rows(out),
+           "seconds": round(min(times), 6), "median_s": round(statistics.median(times), 6)}
+    if memory:
+        tracemalloc.start()
+        fn()
+        rec["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024**2, 2)
+        tracemalloc.stop()
+    rec["rss_mb"] = peak_rss_mb()
+    print(f"  {name:<32} {rec['seconds'] * 1000:>10.1f} ms"
+          + (f"  {rec['peak_mb']:>8.1f} Mo" if memory else "")
+          + (f"  ({rows_in:,} → {rec['rows_out']:,} lignes)" if rows_in is not None and rec["rows_out"] is not None else ""))
+    return out, rec
+
+
+# Contrôles « golden »
+def _same_frame(a, b, keys):
+    a = a.astype({k: str for k in keys if k in a.columns}).sort_values(keys).reset_index(drop=True)
+    b = b.astype({k: str for k in keys if k in b.columns}).sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(a[b.columns], b, check_dtype=False, check_categorical=False,
+                                  check_index_type=False, check_column_type=False, rtol=1e-5, atol=1e-6)
+
+def _same_kpis(a, b):
+    assert {k: a[k] for k in ("nb_rows", "nb_days", "nb_stations")} == \
+           {k: b[k] for k in ("nb_rows", "nb_days", "nb_stations")}, (a, b)
+    assert np.isclose(a["mean"], b["mean"], rtol=1e-6) and np.isclose(a["max"], b["max"], rtol=1e-6), (a, b)
+
+def _same_tables(a, b):
+    _same_kpis(a["kpis"], b["kpis"])
+    _same_frame(a["hourly"], b["hourly"], ["annee", "heure", "pollutant"])
+    _same_frame(a["year_avg"], b["year_avg"], ["annee", "pollutant"])
+    _same_frame(a["month_avg"], b["month_avg"], ["annee", "mois_label", "pollutant"])
+
+def _assert(cond, msg):
+    assert cond, msg
+
+def golden_checks(rows, cube, engines):
+    """Compare les chemins optimisés aux implémentations pandas d'origine sur STATES."""
+    filters, index, exceed, corr, trends, anomalies, quality, service, results = engines
+    checks = []
+
+    def check(name, fn):
+        try:
+            fn()
+            checks.append({"check": name, "ok": True})
+        except AssertionError as e:
+            checks.append({"check": name, "ok": False, "detail": str(e)[:500]})
+            print(f"  ÉCHEC {name}: {str(e)[:200]}")
+
+    batch = service.batch([parse_state(s) for s in STATES])
+    for i, s in enumerate(STATES):
+        ref_rows = _ref_filter(rows, **s)
+        key = ["pollutant", "station_code", "jour", "heure"]
+        check(f"filter[{i}]", lambda: _same_frame(
+            filters.filter(**s).drop(columns="source_file", errors="ignore"), ref_rows.drop(columns="source_file", errors="ignore"), key))
+        ref = _ref_tables(ref_rows)
+        check(f"make_tables[{i}]", lambda: _same_tables(make_tables(ref_rows), ref))
+        check(f"index.tables[{i}]", lambda: _same_tables(index.tables(**s), ref))
+        check(f"service.batch[{i}]", lambda: _same_tables(batch[i], ref))
+        check(f"resultcache[{i}]", lambda: _same_tables(results.get("index.tables", s, lambda: index.tables(**s)), ref))
+
+        sub_cube = _ref_filter(cube, **s)
+        for p in s["pollutants"]:
+            for agg in ("mean", "max"):
+                check(f"hourly_profile[{i},{p},{agg}]", lambda: pd.testing.assert_frame_equal(
+                    _hourly_profile(sub_cube[sub_cube["pollutant"] == p], agg),
+                    _ref_hourly_profile(ref_rows[ref_rows["pollutant"] == p], agg),
+                    check_dtype=False, check_names=False, check_column_type=False, check_index_type=False, rtol=1e-5))
+            if norm_pollutant_key(p) in THRESHOLDS:
+                ref_exc = _ref_exceedances(ref_rows, p, s["years"])
+                check(f"exceedances[{i},{p}]", lambda: _same_frame(
+                    _exceedances(sub_cube, p, s["years"])[["annee", "depassements"]], ref_exc, ["annee"]))
+                check(f"exceedance_engine[{i},{p}]", lambda: _same_frame(
+                    exceed.by_year(p, s["years"], s["months"], s["hour_range"])[["annee", "depassements"]],
+                    ref_exc, ["annee"]))
+
+        got = corr.matrix(s["years"], s["months"])
+        want = _ref_corr(rows, s["years"], s["months"])
+        check(f"correlation[{i}]", lambda: pd.testing.assert_frame_equal(
+            got.loc[want.index, want.columns], want, check_names=False, check_index_type=False,
+            check_column_type=False, rtol=1e-6, atol=1e-9))
+
+    for p in sorted({p for s in STATES for p in s["pollutants"]}):
+        check(f"rollups.mois[{p}]", lambda: _same_frame(
+            trends.series([p], grain="mois")[["periode", "mean"]], _ref_monthly(rows, p), ["periode"]))
+    base = anomalies.baseline[anomalies.baseline["n_ref"] > 0][ANOMALY_KEYS + ["mediane", "mad"]]
+    check("anomalies.baseline", lambda: _same_frame(base, _ref_baseline(rows), ANOMALY_KEYS))
+    check("dedup", lambda: _assert(not rows.duplicated(DEDUP_KEYS).any(), "doublons restants"))
+    check("quality.lignes", lambda: _same_frame(
+        quality.groupby("pollutant", observed=True, as_index=False)["lignes"].sum(),
+        rows.groupby("pollutant", observed=True).size().rename("lignes").reset_index(), ["pollutant"]))
+    return checks
+
+
+# Scénario
+def parse_size(s):
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1], 1)
+    return int(float(s[:-1] if s[-1] in "km" else s) * mult)
+
+def synth_files(n_rows, seed):
+    """Fichiers E2 synthétiques de la taille demandée (générés une seule fois puis réutilisés)."""
+    root = SYNTH_DIR / f"{n_rows}-{seed}"
+    done = root / "_SUCCESS"
+    if not done.exists():
+        t0 = time.perf_counter()
+        write_e2(root, n_rows, seed=seed)
+        done.touch()
+        print(f"  généré {root} en {time.perf_counter() - t0:.1f}s")
+    return sorted(root.glob("FR_E2_*.csv"))
+
+def run(n_rows, seed=0, repeat=3, memory=False):
+    print(f"\n== {n_rows:,} lignes ==")
+    paths = synth_files(n_rows, seed)
+    stages = []
+
+    def step(name, fn, rows_in=None, rep=repeat):
+        out, rec = measure(name, fn, rep, memory, rows_in)
+        stages.append(rec)
+        return out
+
+    raw = step("load_from_list", lambda: load_from_list(paths), rep=1)
+    rejects = []
+    rows = step("clean_data", lambda: clean_data(raw, rejects), len(raw), rep=1)
+    n = len(rows)
+    del raw
+
+    step("overview.sidebar_filters", lambda: overview_filters(rows), n)
+    step("deep_dives.sidebar_filters", lambda: deep_filters(rows), n)
+    cube = step("build_cube", lambda: build_cube(rows), n, rep=1)
+    filters = step("FilterEngine", lambda: FilterEngine(cube, maxsize=0), len(cube), rep=1)
+    step("overview.sidebar_filters+engine", lambda: overview_filters(None, engine=filters), len(cube))
+    step("deep_dives.sidebar_filters+engine", lambda: deep_filters(None, engine=filters), len(cube))
+    index = step("HourRangeIndex", lambda: HourRangeIndex(cube, maxsize=0), len(cube), rep=1)
+    exceed = step("ExceedanceEngine", lambda: ExceedanceEngine(cube), len(cube), rep=1)
+    corr = step("CorrelationEngine", lambda: CorrelationEngine(cube), len(cube), rep=1)
+    trends = step("RollupEngine", lambda: RollupEngine(cube), len(cube), rep=1)
+    anomalies = step("AnomalyEngine", lambda: AnomalyEngine(cube), len(cube), rep=1)
+    quality = step("build_quality", lambda: build_quality(rows, rejects), n, rep=1)
+    service = step("AggregationService", lambda: AggregationService(cube, maxsize=0), len(cube), rep=1)
+    step("service.batch", lambda: service.batch([parse_state(s) for s in STATES]), len(cube))
+    # cache disque : première passe écrite, les suivantes relues (comme une autre réplique)
+    results = ResultCache(tempfile.mkdtemp(prefix="airq-results-"), version=n_rows)
+    for i, s in enumerate(STATES):
+        step(f"resultcache.get[{i}]", lambda: results.get("index.tables", s, lambda: index.tables(**s)), len(cube))
+
+    for i, s in enumerate(STATES):
+        sub = _ref_filter(rows, **s)
+        sub_cube = _ref_filter(cube, **s)
+        p = s["pollutants"][0]
+        step(f"make_tables[{i}]", lambda: make_tables(sub), len(sub))
+        step(f"index.tables[{i}]", lambda: index.tables(**s), len(cube))
+        step(f"_hourly_profile[{i}]", lambda: _hourly_profile(sub[sub["pollutant"] == p], "mean"), len(sub))
+        step(f"_hourly_profile.cube[{i}]", lambda: _hourly_profile(sub_cube[sub_cube["pollutant"] == p], "mean"), len(sub_cube))
+        step(f"_exceedances[{i}]", lambda: _exceedances(sub, p, s["years"]), len(sub))
+        step(f"exceedance_engine.by_year[{i}]", lambda: exceed.by_year(p, s["years"], s["months"], s["hour_range"]))
+        step(f"correlation.matrix[{i}]", lambda: corr.matrix(s["years"], s["months"]))
+        step(f"rollups.series[{i}]", lambda: trends.series([p]))
+        step(f"anomalies.top_stations[{i}]", lambda: anomalies.top_stations(p, s["years"], s["hour_range"]))
+
+    print("  contrôles golden...")
+    row_filters = FilterEngine(rows, maxsize=0)
+    checks = golden_checks(rows, cube, (row_filters, index, exceed, corr, trends, anomalies, quality, service, results))
+    print(f"  {sum(c['ok'] for c in checks)}/{len(checks)} contrôles OK")
+    shutil.rmtree(results.root, ignore_errors=True)
+    return {"rows": n_rows, "rows_clean": n, "cube_cells": len(cube), "files": len(paths),
+            "stages": stages, "golden": checks}
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(current, previous_path):
+    """Temps de chaque étape face à un run précédent (mêmes tailles)."""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {r["rows"]: {s["stage"]: s for s in r["stages"]} for r in json.load(f)["runs"]}
+    for r in current["runs"]:
+        before = previous.get(r["rows"])
+        if before is None:
+            continue
+        print(f"\n== {r['rows']:,} lignes : comparaison avec {previous_path} ==")
+        for s in r["stages"]:
+            b = before.get(s["stage"])
+            if b and b["seconds"]:
+                print(f"  {s['stage']:<32} {b['seconds'] * 1000:>10.1f} → {s['seconds'] * 1000:>10.1f} ms"
+                      f"  (×{s['seconds'] / b['seconds']:.2f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks du pipeline sur des données E2 synthétiques.")
+    parser.add_argument("--rows", nargs="+", default=["100k"], help="tailles (ex. 10k 1M 50M)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "runs": [run(parse_size(s), args.seed, args.repeat, args.memory) for s in args.rows],
+    }
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats enregistrés dans {out}")
+
+    if args.compare:
+        compare(result, args.compare)
+    sys.exit(0 if all(c["ok"] for r in result["runs"] for c in r["golden"]) else 1)
@@ -1,6 +1,25 @@
 # merge_data.py
-from utils.io import load_from_list, save_parquet
-from utils.prep import clean_data
+# Usage : python merge_data.py [--stream | --incremental]
+#   --stream      : ingestion en flux (lecture parallèle par blocs, mémoire bornée)
+#   --incremental : n'ingère que les fichiers de data/raw nouveaux ou modifiés (manifeste)
+#                   dans le dataset partitionné data/processed/air_quality/
+#   (ingestion continue d'un dossier de dépôt : python watch.py, qui réutilise ingest_file)
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from utils.io import (
+    load_from_list, save_parquet, stream_to_parquet,
+    load_manifest, save_manifest, needs_ingest, file_fingerprint,
+    drop_partitions, write_partitions, day_fragments, save_cube, save_quarantine,
+)
+from utils.prep import clean_data, enforce_schema, build_cube, combine_cubes, key_hash, reject, DEDUP_KEYS
+from utils.catalog import build_catalog, combine_catalogs, save_catalog, read_catalog
+from utils.quality import build_quality, combine_quality, save_quality, read_quality
+from utils.stations import (
+    read_sites, station_table, combine_stations, attach_coords, save_stations, read_stations,
+)
 
 FILES = [
     "data/raw/FR_E2_2024-08-05.csv",
@@ -9,13 +28,22 @@ FILES = [
     "data/raw/FR_E2_2025-09-01.csv",
 ]
 
-print("Chargement des 4 lundis...")
-df = load_from_list(FILES)
-print(f"Brut : {len(df):,} lignes")
-
-print("Nettoyage/harmonisation...")
-df_clean = clean_data(df)
-print(f"Nettoyé : {len(df_clean):,} lignes, colonnes = {list(df_clean.columns)}")
+RAW_GLOB = "data/raw/FR_E2_*.csv"
+DATASET_DIR = "data/processed/air_quality"
+MANIFEST_PATH = "data/processed/manifest.json"
+CUBE_PATH = "data/processed/cube.parquet"
+CUBE_DIR = "data/processed/cube"
+QUARANTINE_PATH = "data/processed/quarantine.parquet"   # lignes rejetées, avec code `raison`
+QUARANTINE_DIR = "data/processed/quarantine"            # mode incrémental : un fichier par fichier brut
+CATALOG_PATH = "data/processed/catalog.json"           # catalogue lu par la page Introduction
+CATALOG_DIR = "data/processed/catalog"                  # mode incrémental : un catalogue par fichier brut
+QUALITY_PATH = "data/processed/quality.parquet"         # rapport qualité (Overview, « Qualité des données »)
+QUALITY_DIR = "data/processed/quality"                  # mode incrémental : un rapport par fichier brut
+STATIONS_PATH = "data/processed/stations.parquet"       # dimension stations (coordonnées, attributs)
+SITES_PATH = "data/raw/stations.csv"    # optionnel : liste des sites Geod'air (code site, latitude, longitude)
+
+STREAM = "--stream" in sys.argv
+INCREMENTAL = "--incremental" in sys.argv
 
 # Coordonnées par code_zas
 ZAS_COORDS = {
@@ -88,16 +116,132 @@ ZAS_COORDS = {
 }
 
 
-df_clean["lat"] = df_clean["code_zas"].map(lambda c: ZAS_COORDS.get(str(c), (None, None))[0])
-df_clean["lon"] = df_clean["code_zas"].map(lambda c: ZAS_COORDS.get(str(c), (None, None))[1])
-
-
-n_geo = df_clean[["lat", "lon"]].notna().all(axis=1).sum()
-print(f"Coordonnées ZAS ajoutées : {n_geo} lignes géolocalisées.")
-
-
-
-print("Sauvegarde en Parquet...")
-save_parquet(df_clean)
-
-print("Terminé : data/processed/air_quality.parquet")
+SITES = read_sites(SITES_PATH)
+
+
+def add_coords(df, stations=None):
+    """Ajoute lat/lon par station : coordonnées du site si SITES_PATH les donne, sinon
+    centroïde de la ZAS. Jointure vectorisée sur la dimension stations."""
+    if stations is None:
+        stations = station_table(df, ZAS_COORDS, SITES)
+    return enforce_schema(attach_coords(df, stations))
+
+
+def publish_summaries(manifest):
+    """Recombine catalogue et rapport qualité depuis leurs fragments par fichier, puis réécrit
+    le manifeste (nouveau jeton de version : les lecteurs voient la passe entière). Coût
+    proportionnel à l'historique : une fois par passe, pas par fichier."""
+    save_catalog(combine_catalogs([read_catalog(f) for f in sorted(Path(CATALOG_DIR).glob("*.json"))]), CATALOG_PATH)
+    save_quality(combine_quality([read_quality(f) for f in sorted(Path(QUALITY_DIR).glob("*.parquet"))]), QUALITY_PATH)
+    save_manifest(manifest, MANIFEST_PATH)
+
+
+def ingest_file(p, manifest, cascade=True, publish=True):
+    """Ingère (ou ré-ingère) un fichier brut : ses partitions, ses fragments de cube, de
+    quarantaine, de catalogue et de qualité sont remplacés.
+
+    Les heures déjà publiées par un fichier plus récent sont écartées (doublons) ; les fichiers
+    plus anciens qui partagent un jour avec celui-ci sont ré-ingérés pour la même raison.
+    Avec `publish`, publish_summaries suit ; sinon l'appelant l'appelle une fois après sa
+    boucle (un lot interrompu avant est ré-ingéré en entier au lancement suivant).
+    """
+    p = Path(p)
+    rejects = []
+    df_clean = clean_data(load_from_list([p], rejects), rejects)
+    frags = day_fragments(DATASET_DIR, df_clean["jour"].unique())
+    frags.pop(p.stem, None)
+    newer = [f for stem, fs in frags.items() if stem > p.stem for f in fs]
+    if newer:
+        seen = np.concatenate([key_hash(pd.read_parquet(f, columns=DEDUP_KEYS)) for f in newer])
+        df_clean = reject(df_clean, np.isin(key_hash(df_clean), seen), "doublon", rejects)
+    stations = station_table(df_clean, ZAS_COORDS, SITES)
+    df_clean = add_coords(df_clean, stations)
+    drop_partitions(DATASET_DIR, p.name)
+    write_partitions(df_clean, DATASET_DIR, p.name)
+    save_cube(build_cube(df_clean), Path(CUBE_DIR) / f"{p.stem}.parquet")
+    save_quarantine(rejects, Path(QUARANTINE_DIR) / f"{p.stem}.parquet")
+    save_stations(combine_stations([read_stations(STATIONS_PATH), stations]), STATIONS_PATH)
+    save_catalog(build_catalog(df_clean), Path(CATALOG_DIR) / f"{p.stem}.json")
+    save_quality(build_quality(df_clean, rejects), Path(QUALITY_DIR) / f"{p.stem}.parquet")
+    manifest[p.name] = {**file_fingerprint(p), "rows": int(len(df_clean)), "path": str(p)}
+    print(f" {p.name} : {len(df_clean):,} lignes ingérées.")
+    if cascade:
+        for stem in sorted(s for s in frags if s < p.stem):
+            src = next((e.get("path") for n, e in manifest.items() if Path(n).stem == stem), None)
+            if src and Path(src).exists():
+                ingest_file(src, manifest, cascade=False, publish=False)
+            else:
+                print(f" {stem} : fichier brut introuvable, ses heures republiées par {p.name} restent en double.")
+    if publish:
+        publish_summaries(manifest)
+    return len(df_clean)
+
+
+if __name__ == "__main__":
+    if INCREMENTAL:
+        manifest = load_manifest(MANIFEST_PATH)
+        todo = [p for p in sorted(Path().glob(RAW_GLOB)) if needs_ingest(p, manifest)]
+        print(f"Build incrémental : {len(todo)} fichier(s) nouveau(x) ou modifié(s).")
+        for p in todo:
+            ingest_file(p, manifest, publish=False)
+        publish_summaries(manifest)
+        print(f"Terminé : {DATASET_DIR}/")
+
+    elif STREAM:
+        print("Ingestion en flux des 4 lundis...")
+        cubes, dims, cats, quals = [], [], [], []
+
+        def add_coords_and_cube(chunk):
+            dim = station_table(chunk, ZAS_COORDS, SITES)
+            dims.append(dim)
+            chunk = add_coords(chunk, dim)
+            cubes.append(build_cube(chunk))
+            cats.append(build_catalog(chunk))
+            quals.append(build_quality(chunk))
+            return chunk
+
+        rejects = []
+        kept = ([], [], [])     # cube, catalogue, rapport qualité des row groups gardés
+
+        def rebuild(batch):
+            # Parquet réécrit sans les doublons entre blocs : agrégats refaits sur les lignes gardées
+            for out, build in zip(kept, (build_cube, build_catalog, build_quality)):
+                out.append(build(batch))
+
+        stream_to_parquet(FILES, transform=add_coords_and_cube, rejects=rejects, on_rewrite=rebuild)
+        if kept[0]:
+            cubes, cats, quals = kept
+        save_cube(combine_cubes(cubes), CUBE_PATH)
+        save_stations(combine_stations(dims), STATIONS_PATH)
+        save_catalog(combine_catalogs(cats), CATALOG_PATH)
+        save_quarantine(rejects, QUARANTINE_PATH)
+        save_quality(combine_quality(quals + [build_quality(rejects=rejects)]), QUALITY_PATH)
+        print(f"Terminé : data/processed/air_quality.parquet (+ cube {CUBE_PATH})")
+
+    else:
+        print("Chargement des 4 lundis...")
+        rejects = []
+        df = load_from_list(FILES, rejects)
+        print(f"Brut : {len(df):,} lignes")
+
+        print("Nettoyage/harmonisation...")
+        df_clean = clean_data(df, rejects)
+        save_quarantine(rejects, QUARANTINE_PATH)
+        save_quality(build_quality(df_clean, rejects), QUALITY_PATH)
+        print(f"Nettoyé : {len(df_clean):,} lignes, colonnes = {list(df_clean.columns)}")
+
+        stations = station_table(df_clean, ZAS_COORDS, SITES)
+        df_clean = add_coords(df_clean, stations)
+        save_stations(stations, STATIONS_PATH)
+        n_geo = df_clean[["lat", "lon"]].notna().all(axis=1).sum()
+        print(f"Coordonnées ajoutées : {n_geo} lignes géolocalisées "
+              f"({(stations['geo'] == 'site').sum()} stations au site, {(stations['geo'] == 'zas').sum()} au centroïde ZAS).")
+
+        print("Sauvegarde en Parquet...")
+        save_parquet(df_clean)
+
+        print("Cube d'agrégats...")
+        cube = build_cube(df_clean)
+        save_cube(cube, CUBE_PATH)
+        save_catalog(build_catalog(df_clean), CATALOG_PATH)
+        print(f"Terminé : data/processed/air_quality.parquet (+ cube {CUBE_PATH}, {len(cube):,} cellules)")
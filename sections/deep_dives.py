@@ -2,21 +2,25 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from utils.viz import line_chart, bar_chart
+from utils.prep import THRESHOLDS, norm_pollutant_key as _norm_pollutant_key, as_cube, is_cube, rollup
+from utils.viz import line_chart, bar_chart, scatter_chart, heatmap_chart
+from utils.perf import timed, span
+from utils.prefetch import neighbor_states
+from utils.resultcache import cached
 
-THRESHOLDS = {"O3": 180, "NO2": 200, "PM10": 50, "PM2_5": 25, "SO2": 125} 
-
-def _norm_pollutant_key(p):
-    """Uniformise le libellé polluant pour lookup des seuils."""
-    p = (p or "").upper().strip().replace(" ", "").replace("-", "")
-    p = p.replace("PM2.5", "PM2_5").replace("PM25", "PM2_5")
-    return p
+# Libellés des méthodes de CorrelationEngine (Spearman : rangs par période, cf. sa docstring)
+CORR_LABELS = {"pearson": "Pearson", "spearman": "Spearman approx. (rangs par période)"}
 
 # Filtres
-def sidebar_filters(df):
+@timed()
+def sidebar_filters(df, engine=None):
     st.sidebar.markdown("### Filtres")
 
-    pols = sorted(df["pollutant"].dropna().unique().tolist()) if "pollutant" in df.columns else []
+    if engine is not None:
+        pols, years = engine.values("pollutant"), engine.values("annee")
+    else:
+        pols = sorted(df["pollutant"].dropna().unique().tolist()) if "pollutant" in df.columns else []
+        years = sorted(df["annee"].dropna().unique().tolist()) if "annee" in df.columns else []
     default_p1 = "O3" if "O3" in pols else (pols[0] if pols else "—")
     default_p2 = "NO2" if "NO2" in pols else (pols[1] if len(pols) > 1 else default_p1)
 
@@ -26,7 +30,6 @@ def sidebar_filters(df):
     p2 = st.sidebar.selectbox("Polluant B", pols_b if pols_b else ["—"],
                               index=(pols_b.index(default_p2) if default_p2 in pols_b else 0))
 
-    years = sorted(df["annee"].dropna().unique().tolist()) if "annee" in df.columns else []
     y24 = 2024 in years and st.sidebar.checkbox("2024", value=True)
     y25 = 2025 in years and st.sidebar.checkbox("2025", value=True)
     years_sel = [y for y, on in [(2024, y24), (2025, y25)] if on] or years
@@ -40,14 +43,6 @@ def sidebar_filters(df):
     agg = "mean" if metric == "moyenne horaire" else "max"
 
 
-    df_f = df.copy()
-    if "annee" in df_f.columns:
-        df_f = df_f[df_f["annee"].isin(years_sel)]
-    if "mois" in df_f.columns:
-        df_f = df_f[df_f["mois"].isin(months_sel)]
-    if "heure" in df_f.columns:
-        df_f = df_f[(df_f["heure"] >= hour_min) & (df_f["heure"] <= hour_max)]
-
     state = {
         "p1": p1,
         "p2": p2,
@@ -57,21 +52,45 @@ def sidebar_filters(df):
         "metric": metric,
         "agg": agg,
     }
+    if engine is not None:
+        # tranches contiguës du dataset trié, mémorisées par état de filtres (pas de copie complète)
+        return engine.filter([p1, p2] if pols else None, years_sel, months_sel, (hour_min, hour_max)), state
+
+    df_f = df   # vue : chaque filtre produit un nouveau cadre, le dataset partagé n'est pas modifié
+    if "annee" in df_f.columns:
+        df_f = df_f[df_f["annee"].isin(years_sel)]
+    if "mois" in df_f.columns:
+        df_f = df_f[df_f["mois"].isin(months_sel)]
+    if "heure" in df_f.columns:
+        df_f = df_f[(df_f["heure"] >= hour_min) & (df_f["heure"] <= hour_max)]
+
     return df_f, state
 
 
+def prefetch_jobs(state, engine):
+    """Filtres des états voisins (autre polluant B, bascule d'une année, autre mode de mois)
+    à préchauffer en arrière-plan ; mêmes appels que sidebar_filters."""
+    pols = [p for p in engine.values("pollutant") if p != state["p1"]]
+    jobs = []
+    for s in neighbor_states(state, "p2", pols, engine.values("annee")):
+        sel = ([s["p1"], s["p2"]], s["years"], s["months"], s["hour_range"])
+        jobs.append((("filter", repr(sel)), lambda sel=sel: engine.filter(*sel)))
+    return jobs
+
+
+@timed()
 def _hourly_profile(df, agg):
-    """Pivot (index=heure, colonnes=annee) pour un polluant donné."""
+    """Pivot (index=heure, colonnes=annee) pour un polluant donné (cube ou lignes brutes)."""
     if df.empty:
         return pd.DataFrame()
     g = (
-        df.groupby(["annee", "heure"])["value"]
-          .agg(agg).reset_index()
-          .pivot(index="heure", columns="annee", values="value")
+        rollup(as_cube(df), ["annee", "heure"])
+          .pivot(index="heure", columns="annee", values=agg)
           .sort_index()
     )
     return g
 
+@timed()
 def _exceedances(df, pollutant, years_sel=None):
     """Nombre d'heures > seuil par année. Vide si pas de seuil défini."""
     key = _norm_pollutant_key(pollutant)
@@ -85,16 +104,27 @@ def _exceedances(df, pollutant, years_sel=None):
     if d.empty:
         return pd.DataFrame({"annee": years, "depassements": [0]*len(years), "seuil": [thr]*len(years)})
 
-    d = d.copy()
-    d["depasse"] = d["value"] > thr
-    out = d.groupby("annee")["depasse"].sum().rename("depassements").reset_index()
+    out = as_cube(d).groupby("annee", observed=True)["depassements"].sum().reset_index()
     out = out.set_index("annee").reindex(years, fill_value=0).reset_index()
     out["seuil"] = thr
     return out
 
+@timed()
+def _pair_pivot(df, p1, p2):
+    """Moyenne par (date_heure, annee) de deux polluants, en colonnes (cube ou lignes brutes)."""
+    d = df[df["pollutant"].isin([p1, p2])]
+    if is_cube(d):
+        d = rollup(d, ["jour", "heure", "annee", "pollutant"]).rename(columns={"mean": "value"})
+        d["date_heure"] = d["jour"].astype("datetime64[ns]") + pd.to_timedelta(d["heure"], unit="h")
+    return (
+        d.pivot_table(index=["date_heure", "annee"], columns="pollutant", values="value", aggfunc="mean", observed=True)
+         .reset_index()
+    )
+
 
 # Page Deep-dives
-def render(df, state):
+@timed()
+def render(df, state, index=None, exceed=None, corr=None, results=None):
     st.title("Deep-dives — analyses ciblées")
     st.caption("Duel de polluants, corrélation et dépassements de seuils.")
     st.markdown("""Nous allons étudier ici le cas de NO2 et PM10 qui sont les polluants les plus représentatifs de l'activité humaine""")
@@ -109,6 +139,8 @@ def render(df, state):
         if others:
             p2 = others[0]
 
+    # avec l'index : profils et dépassements en O(1) par groupe, sans filtrer de lignes
+    sel = {"years": state["years"], "months": state["months"], "hour_range": state["hour_range"]}
     df_p1 = df[df["pollutant"] == p1]
     df_p2 = df[df["pollutant"] == p2]
 
@@ -118,7 +150,7 @@ def render(df, state):
     for dff, pol, c in [(df_p1, p1, col1), (df_p2, p2, col2)]:
         with c:
             st.markdown(f"**{pol} — {state['metric']} par heure (par année)**")
-            g = _hourly_profile(dff, agg)
+            g = _hourly_profile(index.hourly_cells([pol], **sel) if index is not None else dff, agg)
             if g.empty:
                 st.info(f"Aucune donnée pour {pol}.")
             else:
@@ -139,12 +171,9 @@ def render(df, state):
     "\nCependant cette pollution à diminuer en 1 ans. Cela suit fortement les mentalités actuellement qui consiste à moins conduire et a priorisé les transports plus écologique.")
 
     st.subheader(f"2) Comment {p1} et {p2} évoluent-ils ensemble ?")
-    if {"date_heure", "pollutant", "value", "annee"}.issubset(df.columns):
-        pivot = (
-            df[df["pollutant"].isin([p1, p2])]
-            .pivot_table(index=["date_heure", "annee"], columns="pollutant", values="value", aggfunc="mean")
-            .reset_index()
-        )
+    if is_cube(df) or {"date_heure", "pollutant", "value", "annee"}.issubset(df.columns):
+        with span("deep_dives.pivot", len(df), cache=results is not None):
+            pivot = cached(results, "deep_dives.pair_pivot", {"p1": p1, "p2": p2, **sel}, lambda: _pair_pivot(df, p1, p2))
 
         for col in [p1, p2]:
             if col not in pivot.columns:
@@ -153,21 +182,30 @@ def render(df, state):
         pivot = pivot.dropna(subset=[p1, p2], how="any")
 
         if not pivot.empty:
-            chart = (
-                alt.Chart(pivot).mark_circle(size=60)
-                .encode(
-                    x=alt.X(p1, title=p1),
-                    y=alt.Y(p2, title=p2),
-                    color=alt.Color("annee:N", title="Année"),
-                    tooltip=["date_heure:T", "annee:N", alt.Tooltip(p1, format=".1f"), alt.Tooltip(p2, format=".1f")],
-                )
-                .properties(height=350)
+            # au-delà du budget de points, scatter_chart bascule sur une carte de densité 2D
+            scatter_chart(
+                pivot, x=p1, y=p2, color="annee",
+                tooltip=["date_heure:T", "annee:N", alt.Tooltip(p1, format=".1f"), alt.Tooltip(p2, format=".1f")],
             )
-            st.altair_chart(chart, use_container_width=True)
         else:
             st.info("Pas assez de points communs pour tracer la corrélation avec les filtres actuels (données manquantes pour l’un des deux polluants).")
     else:
         st.info("Colonnes nécessaires manquantes pour le scatter.")
+
+    if corr is not None:
+        # matrice précalculée (toutes paires, par année/mois) : changer de paire ne coûte rien
+        method = st.radio("Corrélation", ["pearson", "spearman"], horizontal=True,
+                          format_func=CORR_LABELS.get)
+        pairs = corr.pairs(state["years"], state["months"], method)
+        pair = pairs[(pairs["polluant_a"] == p1) & (pairs["polluant_b"] == p2)]
+        if not pair.empty:
+            st.caption(" · ".join(
+                f"{r.annee}/{r.mois:02d} : r = {r.r:.2f} (n = {r.n:,})" for r in pair.itertuples() if r.n
+            ) + " — stations × heures, toutes heures confondues.")
+        m = corr.matrix(state["years"], state["months"], method)
+        tidy = m.rename_axis("polluant_a").reset_index().melt(id_vars="polluant_a", var_name="polluant_b", value_name="r")
+        heatmap_chart(tidy.dropna(), x="polluant_b", y="polluant_a", value="r",
+                      title=f"Corrélations ({CORR_LABELS[method]}) — tous polluants", height=360)
     st.markdown("**Août — période estivale**" \
     "\n Les concentrations de NO₂ se situent globalement entre 5 et 15 µg/m³, et celles de PM10 autour de 10 à 14 µg/m³. " \
     "La dispersion importante des points montre une corrélation faible entre les deux polluants : lorsque le NO₂ augmente, le PM10 ne suit pas toujours la même tendance.")
@@ -178,14 +216,30 @@ def render(df, state):
     st.markdown("En août, les polluants évoluent indépendamment : l’activité humaine étant réduite, les émissions sont faibles et dispersées.\n En septembre, la corrélation se renforce : plus le trafic augmente, plus les niveaux de particules et de NO₂ montent ensemble. \n Cette tendance met en évidence un effet saisonnier anthropique, lié aux comportements humains (retour au travail, transport scolaire, chauffage léger).")
 
     st.subheader("3) Observe-t-on des dépassements de seuils de pollution selon les années ?")
+    regulatory = exceed is not None and st.radio(
+        "Fenêtre de calcul", ["horaire", "réglementaire (moy. journalière PM, 8 h glissante O₃)"],
+        horizontal=True,
+    ) != "horaire"
     c1, c2 = st.columns(2)
     for col, pol in [(c1, p1), (c2, p2)]:
-        ex = _exceedances(df, pol, years_sel=state["years"])
+        with span("deep_dives.exceedances", cache=results is not None):
+            if exceed is not None:
+                # table de dépassements précalculée (tous polluants, une fois par version des données)
+                ex = cached(results, "exceedances.by_year", {"pollutant": pol, "regulatory": regulatory, **sel},
+                            lambda: exceed.by_year(pol, state["years"], state["months"], state["hour_range"],
+                                                   regulatory=regulatory))
+            else:
+                ex = cached(results, "deep_dives.exceedances", {"pollutant": pol, **sel},
+                            lambda: _exceedances(index.range_cube(**sel) if index is not None else df, pol,
+                                                 years_sel=state["years"]))
         with col:
             if ex.empty:
                 st.info(f"Pas de seuil indicatif pour **{pol}**.")
                 continue
-            bar_chart(ex, x="annee", y="depassements", title=f"Dépassements — {pol}")
+            bar_chart(ex[["annee", "depassements"]], x="annee", y="depassements", title=f"Dépassements — {pol}")
+            if "fenetre" in ex.columns:
+                st.caption(f"Fenêtre {ex['fenetre'].iloc[0]}, seuil {ex['seuil'].iloc[0]} µg/m³ — "
+                           f"dépassements comptés en {ex['unite'].iloc[0]}.")
             if ex["depassements"].sum() == 0:
                 st.caption("Aucun dépassement observé avec les filtres actuels.")
     st.markdown("Les dépassements de seuils correspondent au nombre d’heures où la concentration d’un polluant dépasse le seuil réglementaire fixé par les autorités sanitaires. Ils permettent d’évaluer l’intensité des épisodes de pollution et de comparer les années entre elles." \
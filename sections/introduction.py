@@ -1,8 +1,48 @@
 # sections/introduction.py
+import numpy as np
 import streamlit as st
-import pandas as pd
-
-def render(df):
+from utils.perf import timed
+from utils.stations import clusters
+
+CLUSTER_CELLS = [0.02, 0.1, 0.25, 0.5, 1.0]     # taille des cases de regroupement (degrés)
+MAP_POINTS = 300                                 # au-delà, regroupement par défaut plus large
+
+@timed()
+def _station_map(stations, index):
+    """Carte des stations regroupées côté serveur (une bulle par case) + voisinage d'une station."""
+    geo = stations.dropna(subset=["lat", "lon"])
+    c1, c2 = st.columns([4, 1])
+    cell = c2.select_slider("Regroupement", options=CLUSTER_CELLS,
+                            value=0.25 if len(geo) > MAP_POINTS else CLUSTER_CELLS[0],
+                            format_func=lambda v: f"{v:g}°")
+    pts = clusters(geo, cell)
+    pts["rayon"] = 2000 + 2500 * np.sqrt(pts["stations"])
+    c1.map(pts[["lat", "lon", "rayon"]], latitude="lat", longitude="lon", size="rayon")
+    c2.caption(f"{len(geo):,} stations géolocalisées → {len(pts):,} points.")
+    n_zas = int((geo["geo"] == "zas").sum()) if "geo" in geo.columns else 0
+    if n_zas:
+        c2.caption(f"{n_zas:,} stations placées au centroïde de leur ZAS "
+                   "(coordonnées des sites : data/raw/stations.csv).")
+
+    with st.expander("Stations voisines"):
+        labels = (index.stations["station_name"].astype(str) + " (" + index.stations["station_code"].astype(str) + ")"
+                  if "station_name" in index.stations.columns else index.stations["station_code"].astype(str))
+        a, b = st.columns([3, 2])
+        i = a.selectbox("Station", options=range(len(labels)), format_func=lambda k: labels.iloc[k])
+        mode = b.radio("Recherche", ["Plus proches", "Dans un rayon"], horizontal=True)
+        lat, lon = index.lat[i], index.lon[i]
+        if mode == "Plus proches":
+            res = index.nearest(lat, lon, b.slider("Nombre", 1, 20, 5) + 1)
+        else:
+            res = index.within(lat, lon, b.slider("Rayon (km)", 5, 200, 25))
+        res = res[res["station_code"].astype(str) != str(index.stations["station_code"].iloc[i])]
+        cols = [c for c in ["station_code", "station_name", "zas", "influence_type", "geo", "distance_km"] if c in res.columns]
+        st.dataframe(res[cols].round({"distance_km": 1}), hide_index=True, use_container_width=True)
+
+@timed()
+def render(catalog, stations=None, index=None):
+    """Page d'introduction, entièrement depuis le catalogue (utils/catalog.py) et la
+    dimension stations : aucune ligne de mesure n'est relue."""
     st.title("Un lundi sous surveillance : comprendre l’air que nous respirons")
     st.caption("Projet EFREI Paris — Module Data Analysis & Visualization")
 
@@ -31,13 +71,8 @@ Le jeu de données provient du **flux E2 (“Up-To-Date”)**, qui regroupe en *
 Jours étudiés : **5 août 2024**, **2 septembre 2024**, **4 août 2025**, **1er septembre 2025**.
     """)
 
-    try:
-        has_o3_2025 = (
-            "annee" in df.columns and "pollutant" in df.columns and
-            (df.query("annee == 2025 and pollutant == 'O3'").shape[0] > 0)
-        )
-    except Exception:
-        has_o3_2025 = False
+    dispo = catalog["disponibilite"]
+    has_o3_2025 = bool(((dispo["annee"] == 2025) & (dispo["pollutant"].astype(str) == "O3")).any())
 
     if not has_o3_2025:
         st.warning(" **Disponibilité des données** : aucune mesure d’**ozone (O₃)** n’a été trouvée pour **2025** "
@@ -63,44 +98,37 @@ Chaque ligne représente **une mesure horaire** d’un polluant pour une station
     """)
 
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Lignes", f"{len(df):,}")
-    c2.metric("Jours", int(df["jour"].nunique()) if "jour" in df.columns else "—")
-    c3.metric("Polluants", int(df["pollutant"].nunique()) if "pollutant" in df.columns else "—")
-    c4.metric("Stations", int(df["station_code"].nunique()) if "station_code" in df.columns else "—")
+    c1.metric("Lignes", f"{catalog['lignes']:,}")
+    c2.metric("Jours", len(catalog["jours"]))
+    c3.metric("Polluants", len(catalog["polluants"]))
+    c4.metric("Stations", len(catalog["dernieres"]))
+    if catalog["debut"]:
+        st.caption(f"Période couverte : {catalog['debut'][:16]} → {catalog['fin'][:16]}")
+
+    if not dispo.empty:
+        with st.expander("Disponibilité par polluant (lignes par année × mois)"):
+            grid = dispo.pivot_table(index="pollutant", columns=["annee", "mois"], values="lignes",
+                                     aggfunc="sum", fill_value=0, observed=True)
+            grid.columns = [f"{y}-{m:02d}" for y, m in grid.columns]
+            st.dataframe(grid, use_container_width=True)
 
     st.divider()
 
     st.subheader("Carte des stations (aperçu)")
-    lat_candidates = [c for c in df.columns if c in ["lat", "latitude", "lat_site", "latitude_site"]]
-    lon_candidates = [c for c in df.columns if c in ["lon", "longitude", "lon_site", "longitude_site"]]
-
-    if lat_candidates and lon_candidates:
-        lat_col = lat_candidates[0]
-        lon_col = lon_candidates[0]
-
-        df_geo = df.copy()
-        if {"station_code", "date_heure"}.issubset(df_geo.columns):
-            df_geo = df_geo.sort_values("date_heure").groupby("station_code", as_index=False).tail(1)
-
-        df_geo = df_geo.rename(columns={lat_col: "lat", lon_col: "lon"})
-        try:
-            df_geo["lat"] = pd.to_numeric(df_geo["lat"], errors="coerce")
-            df_geo["lon"] = pd.to_numeric(df_geo["lon"], errors="coerce")
-        except Exception:
-            pass
-        df_geo = df_geo.dropna(subset=["lat", "lon"])
-
-        if not df_geo.empty:
-            st.map(df_geo[["lat", "lon"]])
-        else:
-            st.info("Aucune coordonnée exploitable après nettoyage.")
+    if index is not None and len(index):
+        _station_map(stations, index)
     else:
-        st.info("Pas de colonnes géographiques détectées (lat/lon). "
-                "Pour afficher la carte, enrichir les données avec les coordonnées des stations.")
+        latest = catalog["dernieres"]
+        geo = latest.dropna(subset=["lat", "lon"]) if {"lat", "lon"}.issubset(latest.columns) else latest.iloc[0:0]
+        if not geo.empty:
+            st.map(geo[["lat", "lon"]])
+        else:
+            st.info("Pas de coordonnées exploitables (lat/lon). "
+                    "Pour afficher la carte, enrichir les données avec les coordonnées des stations.")
 
     st.divider()
 
     st.subheader("Aperçu des données")
-    st.dataframe(df.head(100), use_container_width=True)
+    st.dataframe(catalog["apercu"], use_container_width=True)
 
     st.caption("Source : LCSQA / Geod’air — Données temps réel (flux E2) — Licence Ouverte v2.0.")
@@ -1,18 +1,27 @@
 # sections/overview.py
 import streamlit as st
 import pandas as pd
-from utils.prep import make_tables
+from utils.prep import make_tables, is_cube
 from utils.viz import line_chart, bar_chart
+from utils.perf import timed, span
+from utils.anomalies import Z_ALERT, MIN_REF
+from utils.quality import summary as quality_summary, partitions as quality_partitions, coverage as quality_coverage
+from utils.prefetch import neighbor_states
+from utils.resultcache import cached
 
 
 # Filtres
-def sidebar_filters(df):
+@timed()
+def sidebar_filters(df, engine=None):
     st.sidebar.markdown("### Filtres")
 
-    polluants = sorted(df["pollutant"].dropna().unique().tolist()) if "pollutant" in df.columns else []
+    if engine is not None:
+        polluants, years = engine.values("pollutant"), engine.values("annee")
+    else:
+        polluants = sorted(df["pollutant"].dropna().unique().tolist()) if "pollutant" in df.columns else []
+        years = sorted(df["annee"].dropna().unique().tolist()) if "annee" in df.columns else []
     pollutant = st.sidebar.selectbox("Polluant", polluants if polluants else ["—"])
 
-    years = sorted(df["annee"].dropna().unique().tolist()) if "annee" in df.columns else []
     y24 = 2024 in years and st.sidebar.checkbox("2024", value=True)
     y25 = 2025 in years and st.sidebar.checkbox("2025", value=True)
     years_sel = [y for y, chosen in [(2024, y24), (2025, y25)] if chosen]
@@ -40,7 +49,20 @@ def sidebar_filters(df):
     agg = "mean" if metric == "moyenne horaire" else "max"
 
 
-    df_f = df.copy()
+    state = {
+        "pollutant": pollutant,
+        "years": years_sel,
+        "months": months_sel,
+        "hour_range": (hour_min, hour_max),
+        "metric": metric,
+        "agg": agg,
+    }
+    if engine is not None:
+        # tranches contiguës du dataset trié, mémorisées par état de filtres (pas de copie complète)
+        df_f = engine.filter([pollutant] if polluants else None, years_sel or None, months_sel, (hour_min, hour_max))
+        return df_f, state
+
+    df_f = df   # vue : chaque filtre produit un nouveau cadre, le dataset partagé n'est pas modifié
     if polluants:
         df_f = df_f[df_f["pollutant"] == pollutant]
     if years_sel and "annee" in df_f.columns:
@@ -50,19 +72,25 @@ def sidebar_filters(df):
     if "heure" in df_f.columns:
         df_f = df_f[(df_f["heure"] >= hour_min) & (df_f["heure"] <= hour_max)]
 
-    state = {
-        "pollutant": pollutant,
-        "years": years_sel,
-        "months": months_sel,
-        "hour_range": (hour_min, hour_max),
-        "metric": metric,
-        "agg": agg,
-    }
     return df_f, state
 
 
+def prefetch_jobs(state, engine, index=None):
+    """Requêtes des états de filtres voisins, à préchauffer en arrière-plan (utils/prefetch.py) :
+    mêmes appels que sidebar_filters et render, donc mêmes clés dans les LRU des moteurs."""
+    jobs = []
+    for s in neighbor_states(state, "pollutant", engine.values("pollutant"), engine.values("annee")):
+        sel = ([s["pollutant"]], s["years"] or None, s["months"], s["hour_range"])
+        jobs.append((("filter", repr(sel)), lambda sel=sel: engine.filter(*sel)))
+        if index is not None:
+            tsel = ([s["pollutant"]], s["years"], s["months"], s["hour_range"])
+            jobs.append((("tables", repr(tsel)), lambda tsel=tsel: index.tables(*tsel)))
+    return jobs
+
+
 # OVERVIEW
-def render(df, state):
+@timed()
+def render(df, state, index=None, trends=None, anomalies=None, quality=None, results=None):
     st.title("Overview — Visualiser et comparer")
     st.caption("Tendances horaires, comparaison annuelle, variations Août/Sep.")
 
@@ -70,7 +98,11 @@ def render(df, state):
         st.warning("Aucune donnée pour ces filtres.")
         return
 
-    tables = make_tables(df)
+    # results : cache disque partagé par les répliques (même état + même version → relu, pas recalculé)
+    sel = ([state["pollutant"]], state["years"], state["months"], state["hour_range"])
+    with span("overview.tables", len(df), cache=results is not None):
+        tables = cached(results, "overview.tables", dict(zip(("pollutants", "years", "months", "hour_range"), sel)),
+                        lambda: index.tables(*sel) if index is not None else make_tables(df))
 
     k = tables["kpis"]
     c1, c2, c3, c4 = st.columns(4)
@@ -82,13 +114,6 @@ def render(df, state):
     st.subheader("1) Analyse horaire — évolution au fil de la journée")
     hourly = tables["hourly"]
     col_to_plot = "mean" if state["agg"] == "mean" else "max"
-    hourly_p = (
-        hourly[hourly["pollutant"] == state["pollutant"]]
-        .rename(columns={col_to_plot: "value"})
-        [["heure", "annee", "value"]]
-        .dropna()
-    )
-
     hourly_p = (
         hourly[hourly["pollutant"] == state["pollutant"]]
         .rename(columns={col_to_plot: "value"})
@@ -108,8 +133,59 @@ def render(df, state):
     month_avg_p = month_avg[month_avg["pollutant"] == state["pollutant"]][["annee", "mois_label", "moyenne"]]
     bar_chart(month_avg_p, x="mois_label", y="moyenne", color="annee", title="Août vs Septembre")
 
+    if trends is not None:
+        st.subheader("4) Tendance longue — toute la période")
+        grain = st.radio("Granularité", ["auto", "jour", "semaine", "mois"], horizontal=True,
+                         help="auto : la plus fine qui tient dans la résolution du graphique")
+        serie = trends.series([state["pollutant"]], grain=None if grain == "auto" else grain)
+        serie_p = serie.rename(columns={col_to_plot: "value"})[["periode", "value"]].dropna()
+        line_chart(serie_p, x="periode", y="value", x_type="T",
+                   title=f"{state['pollutant']} — {state['metric']} par {serie.attrs['grain']}")
+        st.caption("Agrégats pré-calculés (heure → jour → semaine → mois), indépendants des filtres mois et heures.")
+
+    if anomalies is not None:
+        st.subheader("5) Effet rentrée station par station — écarts à la référence d'août")
+        years = state["years"] or None
+        top = anomalies.top_stations(state["pollutant"], years, state["hour_range"])
+        if top.empty:
+            st.info(f"Pas de couple août/septembre comparable pour ces filtres (référence d'au moins "
+                    f"{MIN_REF} jours d'août par station, heure et année).")
+        else:
+            c1, c2 = st.columns([3, 2])
+            with c1:
+                bar_chart(anomalies.by_hour(state["pollutant"], years, state["hour_range"])
+                            .assign(part_alerte=lambda d: (100 * d["part_alerte"]).round(1)),
+                          x="heure", y="part_alerte", title=f"% de stations en écart (|score| > {Z_ALERT:g}) par heure")
+            c2.dataframe(top.round({"score": 2, "ecart": 1}), hide_index=True, use_container_width=True)
+            st.caption("Score robuste : (valeur de septembre − médiane d'août de la même station, heure et année) "
+                       f"/ (1,4826 × MAD). Chaque station est jugée contre sa propre référence ; n_ref = jours "
+                       f"de référence (au moins {MIN_REF}, sinon la cellule n'est pas scorée).")
+
     st.subheader("Qualité des données")
-    missing = df["value"].isna().mean() if "value" in df.columns else 0.0
-    duplicates = df.duplicated(subset=["date_heure", "station_code", "pollutant"]).sum() if {"date_heure","station_code","pollutant"}.issubset(df.columns) else 0
-    st.write(f"- Taux de valeurs manquantes (value) : **{missing:.1%}**")
-    st.write(f"- Doublons potentiels (date_heure, station, polluant) : **{duplicates}**")
+    if quality is not None:
+        # rapport écrit à l'ingestion (utils/quality.py) : rien n'est recalculé sur les lignes filtrées
+        sel = ([state["pollutant"]], state["years"] or None, state["months"])
+        q = quality_summary(quality, *sel)
+        st.write(f"- Taux de valeurs manquantes (value) : **{q['taux_manquant']:.1%}** "
+                 f"({q['manquantes']:,} sur {q['recues']:,} lignes reçues)")
+        st.write(f"- Doublons écartés à l'ingestion (date_heure, station, polluant) : **{q['doublons']:,}**")
+        st.write(f"- Mesures non valides (validité ≠ 1) : **{q['non_valides']:,}**")
+        if q["couverture"] is not None:
+            st.write(f"- Couverture horaire moyenne des stations : **{q['couverture']:.1%}**")
+        with st.expander("Rapport par jour et stations les moins couvertes"):
+            c1, c2 = st.columns([3, 2])
+            c1.dataframe(quality_partitions(quality, *sel).round({"couverture": 3}), hide_index=True,
+                         use_container_width=True)
+            c2.dataframe(quality_coverage(quality, *sel).head(10).round({"couverture": 3}), hide_index=True,
+                         use_container_width=True)
+        st.caption("Rapport par jour écrit par merge_data.py : la plage horaire n'y est pas appliquée.")
+    else:
+        if is_cube(df):
+            # clean_data écarte les valeurs manquantes ; une cellule du cube à n lignes compte n-1 doublons
+            missing = 0.0
+            duplicates = int((df["count"] - 1).sum())
+        else:
+            missing = df["value"].isna().mean() if "value" in df.columns else 0.0
+            duplicates = df.duplicated(subset=["date_heure", "station_code", "pollutant"]).sum() if {"date_heure","station_code","pollutant"}.issubset(df.columns) else 0
+        st.write(f"- Taux de valeurs manquantes (value) : **{missing:.1%}**")
+        st.write(f"- Doublons potentiels (date_heure, station, polluant) : **{duplicates}**")
@@ -0,0 +1,102 @@
+# utils/anomalies.py
+# Référence robuste par station (médiane / MAD par heure et polluant) et score de chaque mesure
+# horaire, en passes NumPy groupées (aucune boucle Python par station)
+import numpy as np
+import pandas as pd
+
+from utils.prep import as_cube
+
+KEYS = ["annee", "pollutant", "station_code", "heure"]
+MAD_SCALE = 1.4826      # MAD → écart-type pour une loi normale
+SCALE_FLOOR = 1.0       # échelle minimale (même unité que la mesure) : évite les scores infinis
+Z_ALERT = 3.0           # |score| au-delà duquel une mesure est jugée anormale
+MIN_REF = 3             # jours de référence minimum par (année, station, heure, polluant) : en deçà,
+                        # MAD ≈ 0 et le score n'est plus qu'un écart brut en µg/m³ → cellule non scorée
+
+def grouped_median(g, v, n_groups):
+    """Médiane de `v` par groupe (`g` : identifiants 0..n_groups-1), en un seul tri
+    lexicographique. Retourne (médianes, effectifs) ; NaN pour un groupe vide."""
+    order = np.lexsort((v, g))
+    vs = v[order]
+    counts = np.bincount(g, minlength=n_groups)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    med = np.full(n_groups, np.nan)
+    ok = counts > 0
+    lo = starts[ok] + (counts[ok] - 1) // 2
+    hi = starts[ok] + counts[ok] // 2
+    med[ok] = (vs[lo] + vs[hi]) / 2
+    return med, counts
+
+class AnomalyEngine:
+    """Scores robustes de la période comparée (septembre) face à la période de référence
+    (août) de la même année, station, heure et polluant.
+
+    score = (valeur − médiane de référence) / max(1,4826 × MAD, SCALE_FLOOR). Une station
+    chargée ne masque plus les autres : chaque station est jugée contre sa propre référence.
+    Seules les cellules dont la référence compte au moins MIN_REF jours (`n_ref`) sont
+    scorées ; baseline garde toutes les références, avec leur `n_ref`.
+    """
+
+    def __init__(self, df, baseline_months=(8,), compare_months=(9,)):
+        cube = as_cube(df)
+        cube = cube[cube["mois"].isin(list(baseline_months) + list(compare_months))]
+        grouped = cube.groupby(KEYS, observed=True, sort=True)
+        g = grouped.ngroup().to_numpy()
+        n_groups = grouped.ngroups
+        v = (cube["sum"] / cube["count"]).to_numpy(dtype="float64")
+        base = cube["mois"].isin(baseline_months).to_numpy()
+
+        med, n = grouped_median(g[base], v[base], n_groups)
+        mad, _ = grouped_median(g[base], np.abs(v[base] - med[g[base]]), n_groups)
+        self.baseline = (
+            grouped.size().index.to_frame(index=False)
+              .assign(mediane=med, mad=mad, n_ref=n)
+        )
+
+        cmp_ = ~base & (n[g] >= MIN_REF)
+        scale = np.maximum(MAD_SCALE * mad, SCALE_FLOOR)
+        self.scores = cube.loc[cmp_, KEYS + ["mois", "jour"]].assign(
+            value=v[cmp_], mediane=med[g[cmp_]], score=(v[cmp_] - med[g[cmp_]]) / scale[g[cmp_]],
+            n_ref=n[g[cmp_]],
+        ).reset_index(drop=True)
+
+        s = self.scores
+        self.cells = (
+            s.assign(alerte=s["score"].abs() > Z_ALERT, ecart=s["value"] - s["mediane"])
+             .groupby(KEYS, as_index=False, observed=True)
+             .agg(score=("score", "mean"), ecart=("ecart", "mean"), alertes=("alerte", "sum"), n=("score", "size"),
+                  n_ref=("n_ref", "first"))
+        )
+
+    def _select(self, pollutant, years=None, hour_range=None):
+        c = self.cells[self.cells["pollutant"] == pollutant]
+        if years is not None:
+            c = c[c["annee"].isin(list(years))]
+        if hour_range is not None:
+            c = c[c["heure"].between(*hour_range)]
+        return c
+
+    def top_stations(self, pollutant, years=None, hour_range=None, n=10):
+        """Stations dont les mesures s'écartent le plus de leur référence (score moyen en
+        valeur absolue), avec l'heure la plus déviante de chacune et le plus petit nombre de
+        jours de référence (`n_ref`) de ses cellules."""
+        c = self._select(pollutant, years, hour_range)
+        if c.empty:
+            return pd.DataFrame(columns=["station_code", "score", "ecart", "heure_max", "alertes", "n", "n_ref"])
+        worst = c.loc[c["score"].abs().groupby(c["station_code"], observed=True).idxmax()]
+        out = (
+            c.groupby("station_code", as_index=False, observed=True)
+             .agg(score=("score", "mean"), ecart=("ecart", "mean"), alertes=("alertes", "sum"), n=("n", "sum"),
+                  n_ref=("n_ref", "min"))
+             .merge(worst[["station_code", "heure"]].rename(columns={"heure": "heure_max"}), on="station_code")
+        )
+        return out.reindex(out["score"].abs().sort_values(ascending=False).index).head(n).reset_index(drop=True)
+
+    def by_hour(self, pollutant, years=None, hour_range=None):
+        """Par heure : score moyen des stations et part des stations en alerte (|score moyen| > Z_ALERT)."""
+        c = self._select(pollutant, years, hour_range)
+        return (
+            c.assign(alerte=c["score"].abs() > Z_ALERT)
+             .groupby("heure", as_index=False)
+             .agg(score=("score", "mean"), part_alerte=("alerte", "mean"), stations=("station_code", "nunique"))
+        )
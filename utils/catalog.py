@@ -0,0 +1,85 @@
+# utils/catalog.py
+# Catalogue du jeu de données (fichier annexe JSON écrit par merge_data.py) : la page Introduction
+# s'affiche sans relire les lignes
+import json
+from pathlib import Path
+import pandas as pd
+
+from utils.prep import enforce_schema
+
+PREVIEW_ROWS = 100
+PREVIEW_COLUMNS = ["date_heure", "pollutant", "value", "unit", "station_code", "station_name",
+                   "annee", "mois", "jour", "heure", "lat", "lon"]
+LATEST_COLUMNS = ["station_code", "station_name", "code_zas", "zas", "implantation_type", "influence_type",
+                  "pollutant", "value", "unit", "date_heure", "lat", "lon"]
+TABLES = ("disponibilite", "dernieres", "apercu")
+
+def build_catalog(df):
+    """Catalogue d'un bloc de lignes nettoyées : effectifs, jours, polluants, période,
+    disponibilité polluant × année × mois, dernière mesure de chaque station, aperçu."""
+    jours = df["jour"] if "jour" in df.columns else df["date_heure"].dt.date
+    return {
+        "lignes": int(len(df)),
+        "jours": sorted({str(d) for d in jours.dropna().unique()}),
+        "polluants": sorted(df["pollutant"].dropna().astype(str).unique().tolist()),
+        "debut": str(df["date_heure"].min()) if len(df) else None,
+        "fin": str(df["date_heure"].max()) if len(df) else None,
+        "disponibilite": (df.groupby(["pollutant", "annee", "mois"], observed=True).size()
+                            .rename("lignes").reset_index()),
+        "dernieres": (df[[c for c in LATEST_COLUMNS if c in df.columns]]
+                        .sort_values("date_heure", kind="stable")
+                        .drop_duplicates("station_code", keep="last")
+                        .reset_index(drop=True)),
+        "apercu": df[[c for c in PREVIEW_COLUMNS if c in df.columns]].head(PREVIEW_ROWS).reset_index(drop=True),
+    }
+
+def combine_catalogs(cats):
+    """Fusionne des catalogues partiels (blocs, fichiers) : sommes, unions, dernière mesure
+    la plus récente par station ; l'aperçu est celui du premier catalogue."""
+    cats = [c for c in cats if c is not None and c["lignes"]]
+    if not cats:
+        return None
+    plain = lambda t: t.astype({c: str for c in t.select_dtypes("category")})
+    dispo = pd.concat([plain(c["disponibilite"]) for c in cats], ignore_index=True)
+    return {
+        "lignes": sum(c["lignes"] for c in cats),
+        "jours": sorted(set().union(*(c["jours"] for c in cats))),
+        "polluants": sorted(set().union(*(c["polluants"] for c in cats))),
+        "debut": min(c["debut"] for c in cats),
+        "fin": max(c["fin"] for c in cats),
+        "disponibilite": enforce_schema(dispo.groupby(["pollutant", "annee", "mois"], as_index=False)["lignes"].sum()),
+        "dernieres": enforce_schema(
+            pd.concat([plain(c["dernieres"]) for c in cats], ignore_index=True)
+              .sort_values("date_heure", kind="stable")
+              .drop_duplicates("station_code", keep="last")
+              .reset_index(drop=True)),
+        "apercu": cats[0]["apercu"],
+    }
+
+def save_catalog(cat, path="data/processed/catalog.json"):
+    """Écrit le catalogue en JSON (tables en enregistrements, dates ISO), de façon atomique."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    out = {k: v for k, v in cat.items() if k not in TABLES}
+    for k in TABLES:
+        out[k] = json.loads(cat[k].to_json(orient="records", date_format="iso", date_unit="s"))
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False)
+    tmp.replace(path)
+
+def read_catalog(path="data/processed/catalog.json"):
+    """Relit le catalogue (None s'il n'a pas encore été écrit), tables typées comme à l'écriture."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        cat = json.load(f)
+    for k in TABLES:
+        t = pd.DataFrame(cat[k])
+        if "date_heure" in t.columns:
+            t["date_heure"] = pd.to_datetime(t["date_heure"]).dt.tz_localize(None).astype("datetime64[us]")
+        if "jour" in t.columns:
+            t["jour"] = pd.to_datetime(t["jour"]).dt.date
+        cat[k] = enforce_schema(t)
+    return cat
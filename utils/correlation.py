@@ -0,0 +1,79 @@
+# utils/correlation.py
+import numpy as np
+import pandas as pd
+
+from utils.prep import as_cube
+
+PERIOD = ["annee", "mois"]
+ROW_KEYS = PERIOD + ["station_code", "jour", "heure"]
+MIN_PAIRS = 3   # en dessous, la corrélation n'est pas affichée
+
+def _sufficient_stats(X):
+    """Statistiques suffisantes de Pearson pour toutes les paires de colonnes, sur les
+    observations communes à chaque paire (NaN = absent), en quatre produits matriciels."""
+    m = ~np.isnan(X)
+    x0 = np.where(m, X, 0.0)
+    mf = m.astype("float64")
+    return {"n": mf.T @ mf, "sx": x0.T @ mf, "sxx": (x0 * x0).T @ mf, "sxy": x0.T @ x0}
+
+def _pearson(s):
+    n, sx, sxx = s["n"], s["sx"], s["sxx"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = s["sxy"] - sx * sx.T / n
+        vx = sxx - sx ** 2 / n
+        vy = sxx.T - sx.T ** 2 / n
+        r = cov / np.sqrt(vx * vy)
+    r[n < MIN_PAIRS] = np.nan
+    return np.clip(r, -1, 1)
+
+class CorrelationEngine:
+    """Corrélations de Pearson et Spearman de toutes les paires de polluants, par (annee, mois).
+
+    La matrice large (station × heure) × polluant est construite une fois ; chaque période
+    garde ses statistiques suffisantes (additives), ce qui permet de combiner n'importe quelle
+    sélection d'années/mois sans recalcul.
+
+    Le Spearman est une approximation : Pearson sur des rangs calculés par polluant au sein
+    de chaque période, sur toutes ses observations (pas sur l'intersection propre à chaque
+    paire), puis sommés entre périodes comme Pearson. Il n'est exact que pour une seule
+    période dont les deux polluants sont mesurés sur les mêmes stations et heures.
+    """
+
+    def __init__(self, df):
+        cube = as_cube(df)
+        cube = cube.assign(mean=cube["sum"] / cube["count"])
+        wide = cube.pivot_table(index=ROW_KEYS, columns="pollutant", values="mean",
+                                aggfunc="mean", observed=True)
+        self.pollutants = [str(p) for p in wide.columns]
+        values = wide.to_numpy("float64", na_value=np.nan)
+        ranks = wide.groupby(level=PERIOD).rank().to_numpy("float64", na_value=np.nan)
+
+        self.stats = {}
+        for period, idx in wide.groupby(level=PERIOD).indices.items():
+            self.stats[tuple(int(v) for v in period)] = {
+                "pearson": _sufficient_stats(values[idx]),
+                "spearman": _sufficient_stats(ranks[idx]),
+            }
+
+    def periods(self, years=None, months=None):
+        return sorted(p for p in self.stats
+                      if (years is None or p[0] in years) and (months is None or p[1] in months))
+
+    def matrix(self, years=None, months=None, method="pearson"):
+        """Matrice polluant × polluant pour la sélection (statistiques des périodes sommées)."""
+        periods = self.periods(years, months)
+        if not periods:
+            return pd.DataFrame(index=self.pollutants, columns=self.pollutants, dtype=float)
+        s = {k: sum(self.stats[p][method][k] for p in periods) for k in ["n", "sx", "sxx", "sxy"]}
+        return pd.DataFrame(_pearson(s), index=self.pollutants, columns=self.pollutants)
+
+    def pairs(self, years=None, months=None, method="pearson"):
+        """Forme longue (annee, mois, polluant_a, polluant_b, r, n) de toutes les périodes choisies."""
+        rows = []
+        for annee, mois in self.periods(years, months):
+            s = self.stats[(annee, mois)][method]
+            r = _pearson(s)
+            for i, a in enumerate(self.pollutants):
+                for j, b in enumerate(self.pollutants):
+                    rows.append((annee, mois, a, b, r[i, j], int(s["n"][i, j])))
+        return pd.DataFrame(rows, columns=["annee", "mois", "polluant_a", "polluant_b", "r", "n"])
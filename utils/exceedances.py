@@ -0,0 +1,107 @@
+# utils/exceedances.py
+import numpy as np
+import pandas as pd
+
+from utils.prep import THRESHOLDS, norm_pollutant_key, as_cube
+
+# Fenêtres réglementaires : (fenêtre, seuil µg/m³)
+#  - PM10 / PM2.5 : moyenne journalière
+#  - O3 : maximum journalier de la moyenne glissante sur 8 h (objectif long terme 120 µg/m³)
+REGULATORY = {"PM10": ("journalière", 50), "PM2_5": ("journalière", 25), "O3": ("8h glissante", 120)}
+O3_MIN_HOURS = 6   # une moyenne 8 h n'est valide qu'avec au moins 75 % des heures
+
+KEYS = ["pollutant", "station_code", "annee", "mois"]
+
+def _keyed(cube):
+    """Ajoute la clé de seuil normalisée (par catégorie, pas par ligne)."""
+    pol = pd.Categorical(cube["pollutant"])
+    lut = np.array([norm_pollutant_key(p) for p in pol.categories] + [""], dtype=object)
+    return cube.assign(key=pd.Categorical(lut[pol.codes]))
+
+def exceedance_table(df):
+    """Dépassements de tous les polluants de THRESHOLDS, en une passe vectorisée par fenêtre.
+
+    Une ligne par (pollutant, station_code, annee, mois, fenetre[, heure]) :
+    - "horaire" : heures > THRESHOLDS, détaillées par heure (filtre plage horaire exact) ;
+    - "journalière" : jours dont la moyenne journalière dépasse le seuil réglementaire ;
+    - "8h glissante" : jours dont le max de la moyenne glissante 8 h dépasse le seuil.
+    """
+    cube = _keyed(as_cube(df))
+    cube = cube[cube["key"].isin(THRESHOLDS.keys() | REGULATORY.keys())]
+    parts = []
+
+    hourly = cube[cube["key"].isin(THRESHOLDS.keys())]
+    h = hourly.groupby(KEYS + ["key", "heure"], as_index=False, observed=True)["depassements"].sum()
+    h["fenetre"], h["seuil"], h["unite"] = "horaire", h["key"].map(THRESHOLDS).astype(float), "heures"
+    parts.append(h)
+
+    daily_keys = [k for k, (w, _) in REGULATORY.items() if w == "journalière"]
+    d = (
+        cube[cube["key"].isin(daily_keys)]
+        .groupby(KEYS + ["key", "jour"], as_index=False, observed=True)[["sum", "count"]].sum()
+    )
+    d["seuil"] = d["key"].map({k: REGULATORY[k][1] for k in daily_keys}).astype(float)
+    d["depasse"] = d["sum"] / d["count"] > d["seuil"]
+    d = d.groupby(KEYS + ["key", "seuil"], as_index=False, observed=True)["depasse"].sum()
+    parts.append(d.rename(columns={"depasse": "depassements"}).assign(fenetre="journalière", unite="jours"))
+
+    roll_keys = [k for k, (w, _) in REGULATORY.items() if w == "8h glissante"]
+    o = cube[cube["key"].isin(roll_keys)].copy()
+    if not o.empty:
+        o["mean"] = o["sum"] / o["count"]
+        o["ts"] = o["jour"].astype("datetime64[ns]") + pd.to_timedelta(o["heure"], unit="h")
+        o = o.sort_values(["pollutant", "station_code", "ts"])
+        rolled = (
+            o.groupby(["pollutant", "station_code"], observed=True, sort=False)
+             .rolling("8h", on="ts", min_periods=O3_MIN_HOURS)["mean"].mean()
+        )
+        o["mean_8h"] = rolled.to_numpy()
+        o = o.groupby(KEYS + ["key", "jour"], as_index=False, observed=True)["mean_8h"].max()
+        o["seuil"] = o["key"].map({k: REGULATORY[k][1] for k in roll_keys}).astype(float)
+        o["depasse"] = o["mean_8h"] > o["seuil"]
+        o = o.groupby(KEYS + ["key", "seuil"], as_index=False, observed=True)["depasse"].sum()
+        parts.append(o.rename(columns={"depasse": "depassements"}).assign(fenetre="8h glissante", unite="jours"))
+
+    out = pd.concat(parts, ignore_index=True)
+    out["depassements"] = out["depassements"].astype("int32")
+    return out
+
+class ExceedanceEngine:
+    """Table des dépassements calculée une fois par version du dataset ; chaque rerun ne fait
+    plus qu'un filtre sur un petit résumé sans dimension station."""
+
+    def __init__(self, df):
+        self.table = exceedance_table(df)
+        self.summary = (
+            self.table.groupby(["key", "fenetre", "seuil", "unite", "annee", "mois", "heure"],
+                               as_index=False, observed=True, dropna=False)["depassements"].sum()
+        )
+
+    def totals(self, months=None, hour_range=None):
+        """Dépassements par (key, fenetre, annee) pour des mois et une plage horaire (qui ne
+        filtre que la fenêtre horaire) : commun à tous les polluants d'une même sélection."""
+        s = self.summary
+        if months is not None:
+            s = s[s["mois"].isin(months)]
+        if hour_range is not None:
+            s = s[(s["fenetre"] != "horaire") | s["heure"].between(*hour_range)]
+        return s.groupby(["key", "fenetre", "annee"], as_index=False, observed=True)["depassements"].sum()
+
+    def by_year(self, pollutant, years, months=None, hour_range=None, regulatory=False, totals=None):
+        """Dépassements par année, même forme que deep_dives._exceedances (+ fenetre, unite).
+        `totals` : résultat de totals(months, hour_range) déjà calculé pour cette sélection."""
+        key = norm_pollutant_key(pollutant)
+        if key not in THRESHOLDS and not (regulatory and key in REGULATORY):
+            return pd.DataFrame(columns=["annee", "depassements", "seuil"])
+        fenetre = REGULATORY[key][0] if regulatory and key in REGULATORY else "horaire"
+
+        t = self.totals(months, hour_range) if totals is None else totals
+        s = t[(t["key"] == key) & (t["fenetre"] == fenetre)]
+        seuil = REGULATORY[key][1] if fenetre != "horaire" else THRESHOLDS[key]
+
+        out = s.groupby("annee")["depassements"].sum().reindex(years, fill_value=0).reset_index()
+        out.columns = ["annee", "depassements"]
+        out["seuil"] = seuil
+        out["fenetre"] = fenetre
+        out["unite"] = "heures" if fenetre == "horaire" else "jours"
+        return out
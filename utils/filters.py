@@ -0,0 +1,89 @@
+# utils/filters.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.prep import norm_selection
+
+SORT_KEYS = ["pollutant", "annee", "mois", "heure"]
+
+class FilterEngine:
+    """Moteur de filtres partagé, construit une fois par version du dataset.
+
+    Les lignes sont triées une fois par (pollutant, annee, mois, heure) ; une table d'offsets
+    donne les bornes de chaque groupe. Un état de filtres se résout en tranches contiguës :
+    une seule tranche → vue `iloc` sans copie, plusieurs → un seul `take` sur les positions
+    des tranches (une copie des seules lignes retenues, c'est le cas des sélections
+    multi-polluants, multi-années ou multi-mois avec plage horaire). Les résultats sont
+    mémorisés par état (LRU) et partagés entre sessions : ils sont en lecture seule.
+    """
+
+    def __init__(self, df, maxsize=64):
+        self.df = df.sort_values(SORT_KEYS, kind="stable").reset_index(drop=True)
+        codes = np.column_stack([
+            self.df[c].cat.codes.to_numpy() if isinstance(self.df[c].dtype, pd.CategoricalDtype)
+            else self.df[c].to_numpy()
+            for c in SORT_KEYS
+        ])
+        starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]).any(axis=1)]) if len(codes) else np.array([], dtype=int)
+        self.groups = self.df.loc[starts, SORT_KEYS].reset_index(drop=True)
+        self.groups["start"] = starts
+        self.groups["stop"] = np.r_[starts[1:], len(self.df)]
+
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def values(self, col):
+        """Valeurs distinctes d'une clé de tri, lues dans la table des groupes."""
+        return sorted(self.groups[col].unique().tolist())
+
+    def slices(self, pollutants=None, years=None, months=None, hour_range=None):
+        """Tranches [start, stop) des groupes retenus, fusionnées quand elles se touchent."""
+        g = self.groups
+        m = np.ones(len(g), dtype=bool)
+        for col, values in [("pollutant", pollutants), ("annee", years), ("mois", months)]:
+            if values is not None:
+                m &= g[col].isin(values).to_numpy()
+        if hour_range is not None:
+            m &= g["heure"].between(*hour_range).to_numpy()
+
+        out = []
+        for start, stop in zip(g["start"].to_numpy()[m], g["stop"].to_numpy()[m]):
+            if out and out[-1][1] == start:
+                out[-1][1] = stop
+            else:
+                out.append([start, stop])
+        return [tuple(s) for s in out]
+
+    @staticmethod
+    def positions(parts):
+        """Positions des lignes de tranches [start, stop), en un seul tableau
+        (sans boucle par tranche)."""
+        starts = np.array([a for a, _ in parts], dtype=np.int64)
+        lens = np.array([b - a for a, b in parts], dtype=np.int64)
+        return np.arange(lens.sum()) + np.repeat(starts - np.r_[0, np.cumsum(lens)[:-1]], lens)
+
+    def filter(self, pollutants=None, years=None, months=None, hour_range=None):
+        key = (norm_selection(pollutants), norm_selection(years), norm_selection(months),
+               None if hour_range is None else tuple(hour_range))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        parts = self.slices(pollutants, years, months, hour_range)
+        if len(parts) == 1:
+            out = self.df.iloc[parts[0][0]:parts[0][1]]
+        elif parts:
+            out = self.df.take(self.positions(parts)).reset_index(drop=True)
+        else:
+            out = self.df.iloc[0:0]
+
+        with self._lock:
+            self._cache[key] = out
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return out
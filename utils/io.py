@@ -1,23 +1,607 @@
 # utils/io.py
+import hashlib
+import json
+import operator
+import os
+import threading
+from functools import reduce
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
-def load_from_list(paths):
-    """Charge et concatène une liste explicite de fichiers CSV (séparateur ;)"""
-    dfs = []
+from utils.prep import (
+    clean_data, combine_cubes, enforce_schema, duplicate_mask, reject, SCHEMA, CUBE_SCHEMA,
+    E2_SCHEMA, DATE_FORMATS, DEDUP_KEYS, _norm,
+)
+
+# Lecture typée du flux E2 : schéma déclaré appliqué par le lecteur CSV Arrow
+ROW_BYTES = 256     # taille moyenne d'une ligne E2 (pour convertir un nombre de lignes en octets)
+_NUMBER = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+_ARROW_TYPES = {
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "date": pa.string(),    # analysée ensuite par pc.strptime (formats déclarés)
+    "float": pa.string(),   # analysées ensuite sans exception (valeurs malformées -> quarantaine)
+    "int": pa.string(),
+}
+
+def _e2_columns(path):
+    """En-têtes du fichier à lire (types déclarés), hors colonnes "drop" ou inconnues."""
+    with open(path, encoding="utf-8-sig") as f:
+        header = f.readline().rstrip("\r\n").split(";")
+    return {h: E2_SCHEMA[_norm(h)] for h in header if E2_SCHEMA.get(_norm(h), (None, "drop"))[1] != "drop"}
+
+def _e2_options(path, block_size=None, rejects=None):
+    cols = _e2_columns(path)
+    source = Path(path).name
+
+    def on_invalid(row):
+        if rejects is not None:
+            rejects.append(pd.DataFrame({"source_file": [source], "raison": ["colonnes"], "brut": [row.text]}))
+        return "skip"
+
+    read = pacsv.ReadOptions(block_size=block_size) if block_size else pacsv.ReadOptions()
+    parse = pacsv.ParseOptions(delimiter=";", invalid_row_handler=on_invalid)
+    convert = pacsv.ConvertOptions(
+        include_columns=list(cols),
+        column_types={h: _ARROW_TYPES[kind] for h, (_, kind) in cols.items()},
+        strings_can_be_null=True,
+    )
+    return cols, read, parse, convert
+
+def _typed_e2(table, cols, source):
+    """Table Arrow brute -> table typée (noms normalisés) ; les champs non analysables
+    deviennent nuls, avec leur code `raison` et le texte d'origine dans `brut`."""
+    arrays, names = [], []
+    raison = pa.nulls(table.num_rows, pa.string())
+    brut = pa.nulls(table.num_rows, pa.string())
+    for h, (name, kind) in cols.items():
+        col = table.column(h)
+        if kind == "date":
+            parsed = [pc.strptime(col, format=f, unit="s", error_is_null=True) for f in DATE_FORMATS]
+            typed = pc.cast(pc.coalesce(*parsed) if len(parsed) > 1 else parsed[0], pa.timestamp("us"))
+            code = "date_invalide"
+        elif kind in ("float", "int"):
+            ok = pc.match_substring_regex(col, _NUMBER)
+            typed = pc.cast(pc.if_else(ok, pc.utf8_trim_whitespace(col), pa.scalar(None, pa.string())),
+                            pa.float64() if kind == "float" else pa.int64())
+            code = "valeur_invalide" if name == "value" else None
+        else:
+            arrays.append(col)
+            names.append(name)
+            continue
+        if code is not None:
+            bad = pc.and_(pc.is_valid(col), pc.is_null(typed))
+            first = pc.and_(bad, pc.is_null(raison))
+            raison = pc.if_else(first, pa.scalar(code), raison)
+            brut = pc.if_else(first, col, brut)
+        arrays.append(typed)
+        names.append(name)
+    src = pa.DictionaryArray.from_arrays(pa.array(np.zeros(table.num_rows, dtype="int32")), pa.array([source]))
+    arrays += [raison, brut, src]
+    names += ["raison", "brut", "source_file"]
+    return pa.Table.from_arrays(arrays, names=names)
+
+def read_e2(path, rejects=None):
+    """Lit un CSV E2 (séparateur ;) en DataFrame typé : seules les colonnes utiles sont lues,
+    dates et nombres sont analysés par Arrow (multithread) selon E2_SCHEMA.
+
+    Les lignes au nombre de champs incorrect sont ajoutées à `rejects` (raison "colonnes") ;
+    les champs malformés sont signalés pour clean_data (colonnes `raison` / `brut`).
+    """
+    path = Path(path)
+    cols, read, parse, convert = _e2_options(path, rejects=rejects)
+    table = pacsv.read_csv(path, read_options=read, parse_options=parse, convert_options=convert)
+    return _typed_e2(table, cols, path.name).to_pandas()
+
+def iter_e2(path, chunksize=200_000, rejects=None):
+    """Comme read_e2, par blocs d'environ `chunksize` lignes (lecteur CSV Arrow en flux)."""
+    path = Path(path)
+    cols, read, parse, convert = _e2_options(path, chunksize * ROW_BYTES, rejects)
+    with pacsv.open_csv(path, read_options=read, parse_options=parse, convert_options=convert) as reader:
+        for batch in reader:
+            yield _typed_e2(pa.Table.from_batches([batch]), cols, path.name).to_pandas()
+
+def load_from_list(paths, rejects=None):
+    """Charge et concatène une liste explicite de fichiers CSV E2 (séparateur ;), typés à la lecture.
+
+    La concaténation se fait côté Arrow : une seule conversion pandas, catégories unifiées.
+    """
+    tables = []
     for p in paths:
         p = Path(p)
         if not p.exists():
             raise FileNotFoundError(f"Fichier introuvable: {p}")
-        df = pd.read_csv(p, sep=";", low_memory=False)
-        df["source_file"] = p.name
-        dfs.append(df)
-    return pd.concat(dfs, ignore_index=True)
+        cols, read, parse, convert = _e2_options(p, rejects=rejects)
+        table = pacsv.read_csv(p, read_options=read, parse_options=parse, convert_options=convert)
+        tables.append(_typed_e2(table, cols, p.name))
+    return pa.concat_tables(tables, promote_options="permissive").to_pandas()
 
-def save_parquet(df, path="data/processed/air_quality.parquet"):
+def save_quarantine(rejects, path="data/processed/quarantine.parquet"):
+    """Écrit les lignes rejetées (code `raison`, texte fautif `brut`) ; fichier vide s'il n'y en a pas."""
     path = Path(path)
     path.parent.mkdir(parents=True, exist_ok=True)
+    if rejects:
+        df = pd.concat([r.astype({c: "object" for c in r.columns if isinstance(r[c].dtype, pd.CategoricalDtype)})
+                        for r in rejects], ignore_index=True)
+    else:
+        df = pd.DataFrame({"source_file": [], "raison": [], "brut": []}, dtype="object")
+    df = enforce_schema(df).astype({"raison": "category"})
     df.to_parquet(path, index=False)
-    print(f" Données enregistrées dans {path}")
+    counts = df["raison"].value_counts()
+    print(f" Quarantaine : {len(df):,} lignes dans {path}" + (f" ({counts.to_dict()})" if len(df) else ""))
+    return df
+
+# Disposition du Parquet principal : lignes triées sur les clés des filtres de l'app, row groups
+# petits (statistiques min/max sélectives), codec et encodage choisis par colonne
+SORT_KEYS = ["pollutant", "annee", "mois", "station_code", "date_heure"]
+ROW_GROUP_BYTES = 4 << 20   # taille visée d'un row group décodé (≈ 40 000 lignes ici)
+MIN_ROW_GROUP = 8192
+# Colonnes relues à chaque rerun (filtres, pages d'analyse) : codec rapide à décoder ; les
+# autres (libellés, métadonnées de mesure) : codec plus compact
+HOT_COLUMNS = {"pollutant", "annee", "mois", "jour", "heure", "station_code", "date_heure", "value"}
+
+def sort_for_storage(df):
+    """Trie les lignes sur SORT_KEYS (catégories dans l'ordre lexical, comme les statistiques
+    Parquet) : chaque row group couvre alors une plage étroite de polluant/période/station."""
+    lexical = lambda s: (s.cat.reorder_categories(sorted(s.cat.categories))
+                         if isinstance(s.dtype, pd.CategoricalDtype) else s)
+    keys = [k for k in SORT_KEYS if k in df.columns]
+    return df.sort_values(keys, key=lexical, kind="stable", ignore_index=True) if keys else df
+
+def row_group_rows(table, target_bytes=ROW_GROUP_BYTES):
+    """Nombre de lignes par row group pour viser `target_bytes` décodés."""
+    per_row = table.nbytes / max(table.num_rows, 1)
+    return max(MIN_ROW_GROUP, int(target_bytes / max(per_row, 1)))
+
+def parquet_options(schema):
+    """Options d'écriture par colonne : horodatages en DELTA_BINARY_PACKED (pas de
+    dictionnaire), le reste en dictionnaire — mesures et coordonnées comprises, très
+    répétitives ; lz4 pour HOT_COLUMNS, zstd ailleurs."""
+    compression, encoding, dictionary = {}, {}, []
+    for f in schema:
+        compression[f.name] = "lz4" if f.name in HOT_COLUMNS else "zstd"
+        if pa.types.is_timestamp(f.type):
+            encoding[f.name] = "DELTA_BINARY_PACKED"
+        else:
+            dictionary.append(f.name)
+    return {"compression": compression, "use_dictionary": dictionary, "column_encoding": encoding or None}
+
+def companion_ipc(path):
+    """Copie Arrow IPC écrite à côté du Parquet par save_parquet, si elle est à jour (sinon None)."""
+    path = Path(path)
+    ipc = path.with_suffix(".arrow")
+    try:
+        return ipc if ipc.stat().st_mtime_ns >= path.stat().st_mtime_ns else None
+    except FileNotFoundError:
+        return None
+
+def save_parquet(df, path="data/processed/air_quality.parquet"):
+    """Écrit le Parquet principal (trié, row groups dimensionnés, codecs par colonne) puis sa
+    copie Arrow IPC non compressée, que l'app mappe en mémoire au démarrage à froid au lieu de
+    décoder le Parquet."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = to_arrow(sort_for_storage(df))
+    pq.write_table(table, path, row_group_size=row_group_rows(table), **parquet_options(table.schema))
+    write_ipc(table, path.with_suffix(".arrow"))    # écrite après : plus récente que le Parquet
+    print(f" Données enregistrées dans {path} (+ {path.with_suffix('.arrow').name})")
+
+
+def to_arrow(df):
+    """DataFrame → table Arrow à schéma stable : index des dictionnaires (catégories) élargis
+    en int32, pour que des blocs/fichiers aux catégories différentes restent compatibles."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = [
+        pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type), f.nullable)
+        if pa.types.is_dictionary(f.type) else f
+        for f in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+# Ingestion en flux (gros volumes)
+class _MemoryBudget:
+    """Plafond mémoire partagé : un worker attend avant de lire un bloc tant que le plafond est atteint."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def wait(self):
+        with self._cond:
+            while self.used and self.used >= self.max_bytes:
+                self._cond.wait()
+
+    def add(self, n):
+        """Réserve `n` octets ; retourne l'occupation du budget après réservation."""
+        with self._cond:
+            self.used += n
+            return self.used
+
+    def release(self, n):
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+class _SharedWriter:
+    """ParquetWriter partagé entre workers ; le premier bloc non vide fixe le schéma."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.writer = None
+        self.schema = None
+        self._lock = threading.Lock()
+
+    def write(self, df):
+        with self._lock:
+            if self.writer is None:
+                table = to_arrow(df)
+                self.schema = table.schema
+                self.writer = pq.ParquetWriter(self.path, self.schema, **parquet_options(self.schema))
+            else:
+                table = to_arrow(df.reindex(columns=self.schema.names)).cast(self.schema)
+            self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def _stream_file(path, writer, budget, chunksize, transform, rejects=None):
+    """Lit un CSV par blocs typés, nettoie chaque bloc et l'écrit aussitôt. Retourne les stats
+    du fichier, dont le pic d'occupation du budget mémoire pendant que ses blocs étaient en cours."""
+    t0 = time.perf_counter()
+    rows_in = rows_out = peak = 0
+    reader = iter_e2(path, chunksize, rejects)
+    while True:
+        budget.wait()
+        try:
+            chunk = next(reader)
+        except StopIteration:
+            break
+        n_bytes = int(chunk.memory_usage(deep=True).sum())
+        peak = max(peak, budget.add(n_bytes))
+        try:
+            rows_in += len(chunk)
+            chunk = clean_data(chunk, rejects)
+            if transform is not None:
+                chunk = transform(chunk)
+            if not chunk.empty:
+                writer.write(chunk)
+                rows_out += len(chunk)
+        finally:
+            del chunk
+            budget.release(n_bytes)
+
+    elapsed = time.perf_counter() - t0
+    size_mb = path.stat().st_size / 1024**2
+    return {
+        "file": path.name,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(rows_in / elapsed) if elapsed else None,
+        "mb_per_s": round(size_mb / elapsed, 2) if elapsed else None,
+        "budget_peak_mb": round(peak / 1024**2, 1),
+    }
+
+def dedup_parquet(path, rejects=None, on_batch=None, keys=DEDUP_KEYS):
+    """Doublons entre blocs d'un Parquet écrit en flux (clean_data ne voit qu'un bloc à la fois).
+
+    Une passe sur les seules colonnes clés (+ source_file) de tout le fichier applique
+    duplicate_mask, la même règle que le build complet ; s'il y a des perdants, le fichier est
+    réécrit row group par row group sans eux, les lignes écartées vont dans `rejects` (raison
+    « doublon ») et `on_batch` reçoit chaque row group gardé (pour reconstruire cube, catalogue,
+    rapport qualité). Retourne le nombre de lignes écartées.
+    """
+    path = Path(path)
+    if not path.exists():
+        return 0
+    pf = pq.ParquetFile(path)
+    cols = [c for c in list(keys) + ["source_file"] if c in pf.schema_arrow.names]
+    drop = duplicate_mask(enforce_schema(pf.read(columns=cols).to_pandas()), keys)
+    if not drop.any():
+        return 0
+    tmp = path.with_suffix(".dedup.tmp")
+    start = 0
+    try:
+        with pq.ParquetWriter(tmp, pf.schema_arrow, **parquet_options(pf.schema_arrow)) as writer:
+            for i in range(pf.num_row_groups):
+                table = pf.read_row_group(i)
+                mask = drop[start:start + table.num_rows]
+                start += table.num_rows
+                if mask.any():
+                    lost = enforce_schema(table.filter(pa.array(mask)).to_pandas())
+                    reject(lost, np.ones(len(lost), dtype=bool), "doublon", rejects)
+                    table = table.filter(pa.array(~mask))
+                writer.write_table(table)
+                if on_batch is not None:
+                    on_batch(enforce_schema(table.to_pandas()))
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return int(drop.sum())
+
+def stream_to_parquet(paths, path="data/processed/air_quality.parquet", chunksize=200_000,
+                      max_workers=4, max_memory_mb=1024, transform=None, rejects=None, on_rewrite=None):
+    """Ingestion en flux : fichiers lus en parallèle, nettoyés par blocs et écrits
+    directement dans le Parquet de sortie, sans concaténation en mémoire.
+
+    `max_memory_mb` plafonne la mémoire des blocs en cours de traitement (un dépassement
+    d'au plus un bloc par worker est possible). `transform` est appliqué à chaque bloc
+    nettoyé (ex. ajout des coordonnées) ; les lignes écartées vont dans `rejects` si fourni.
+    Les heures republiées dans d'autres blocs ou fichiers sont écartées ensuite par
+    dedup_parquet (colonnes clés de toutes les lignes en mémoire, ~20 octets par ligne) :
+    si le fichier est réécrit, `on_rewrite` reçoit chaque row group gardé et ce qu'a produit
+    `transform` sur les blocs d'origine est à refaire. Retourne une liste de stats par fichier.
+    """
+    paths = [Path(p) for p in paths]
+    for p in paths:
+        if not p.exists():
+            raise FileNotFoundError(f"Fichier introuvable: {p}")
+
+    out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    writer = _SharedWriter(out)
+    budget = _MemoryBudget(max_memory_mb * 1024**2)
+
+    stats = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_stream_file, p, writer, budget, chunksize, transform, rejects) for p in paths]
+            for fut in futures:
+                s = fut.result()
+                stats.append(s)
+                print(f" {s['file']} : {s['rows_in']:,} → {s['rows_out']:,} lignes en {s['seconds']:.2f}s "
+                      f"({s['rows_per_s']:,} lignes/s, {s['mb_per_s']} Mo/s, "
+                      f"pic budget {s['budget_peak_mb']:.1f}/{max_memory_mb} Mo)")
+    finally:
+        writer.close()
+
+    n_dup = dedup_parquet(out, rejects, on_rewrite)
+    if n_dup:
+        print(f" {n_dup:,} heure(s) republiée(s) entre blocs/fichiers écartée(s) (version du fichier le plus récent gardée)")
+    print(f" Données enregistrées dans {out}")
+    return stats
+
+
+# Build incrémental : manifeste + dataset partitionné
+PARTITIONING = ds.partitioning(
+    pa.schema([("annee", pa.int16()), ("mois", pa.int8()), ("jour", pa.date32())]),
+    flavor="hive",
+)
+
+def file_fingerprint(path, block_size=1 << 20):
+    """Empreinte d'un fichier brut : taille, mtime et hash SHA-256 du contenu."""
+    path = Path(path)
+    st = path.stat()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha256": h.hexdigest()}
+
+def load_manifest(path):
+    """Manifeste des fichiers déjà ingérés ({nom: empreinte}), vide s'il n'existe pas."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp.replace(path)
+
+def data_version(path, manifest_path="data/processed/manifest.json"):
+    """Jeton de version des données : mtime du manifeste pour le dataset incrémental, du
+    fichier sinon. Change à chaque (ré)ingestion ; None si rien n'a été construit."""
+    p = Path(manifest_path) if Path(path).is_dir() and Path(manifest_path).exists() else Path(path)
+    return p.stat().st_mtime_ns if p.exists() else None
+
+def needs_ingest(path, manifest):
+    """True si le fichier est nouveau ou modifié depuis sa dernière ingestion.
+
+    Taille et mtime identiques → inchangé sans relire le fichier ; sinon on compare le hash
+    (un simple `touch` ne déclenche donc pas de ré-ingestion).
+    """
+    path = Path(path)
+    entry = manifest.get(path.name)
+    if entry is None:
+        return True
+    st = path.stat()
+    if st.st_size == entry["size"] and st.st_mtime == entry["mtime"]:
+        return False
+    fp = file_fingerprint(path)
+    if fp["sha256"] == entry["sha256"]:
+        entry["mtime"] = fp["mtime"]
+        return False
+    return True
+
+def drop_partitions(root, source_file):
+    """Supprime les fragments Parquet issus d'un fichier brut (avant ré-ingestion)."""
+    root = Path(root)
+    if not root.exists():
+        return 0
+    stem = Path(source_file).stem
+    removed = 0
+    for frag in root.rglob(f"{stem}-*.parquet"):
+        frag.unlink()
+        removed += 1
+    for d in sorted((p for p in root.rglob("*") if p.is_dir()), key=lambda p: len(p.parts), reverse=True):
+        if not any(d.iterdir()):
+            d.rmdir()
+    return removed
+
+def write_partitions(df, root, source_file):
+    """Écrit les lignes d'un fichier brut dans le dataset partitionné annee/mois/jour.
+
+    Les fragments sont nommés d'après le fichier source, ce qui permet de les remplacer
+    sans toucher aux autres jours.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    table = to_arrow(df)
+    ds.write_dataset(
+        table, root, format="parquet", partitioning=PARTITIONING,
+        basename_template=f"{Path(source_file).stem}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+def read_dataset(root):
+    """Relit le dataset partitionné en DataFrame (colonnes de partition typées)."""
+    return scan_parquet(root)
 
 
+# Lecture sélective : projection de colonnes + prédicats poussés au scanner Arrow
+def filter_expression(pollutants=None, years=None, months=None, hour_range=None):
+    """Expression Arrow pour les filtres de l'app (None = pas de filtre)."""
+    parts = []
+    if pollutants is not None:
+        parts.append(pc.field("pollutant").isin(list(pollutants)))
+    if years is not None:
+        parts.append(pc.field("annee").isin(list(years)))
+    if months is not None:
+        parts.append(pc.field("mois").isin(list(months)))
+    if hour_range is not None:
+        parts.append((pc.field("heure") >= hour_range[0]) & (pc.field("heure") <= hour_range[1]))
+    return reduce(operator.and_, parts) if parts else None
+
+def scan_table(path, columns=None, pollutants=None, years=None, months=None, hour_range=None,
+               partition_base_dir=None):
+    """Comme scan_parquet, mais renvoie la table Arrow (sans conversion pandas).
+
+    `partition_base_dir` : racine du dataset quand `path` n'est qu'une de ses partitions
+    (les colonnes annee/mois/jour sont alors relues depuis le chemin).
+    """
+    path = Path(path)
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING if path.is_dir() else None,
+                         partition_base_dir=str(partition_base_dir) if partition_base_dir else None)
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=filter_expression(pollutants, years, months, hour_range))
+
+def scan_parquet(path, columns=None, pollutants=None, years=None, months=None, hour_range=None):
+    """Lit un Parquet (fichier ou dataset partitionné) en ne décodant que `columns` et les
+    lignes qui passent les filtres.
+
+    Les prédicats sont évalués par le scanner Arrow : dossiers annee/mois écartés sur le
+    dataset partitionné, row groups écartés via leurs statistiques min/max. Les colonnes
+    absentes du fichier sont ignorées.
+    """
+    return enforce_schema(scan_table(path, columns, pollutants, years, months, hour_range).to_pandas())
+
+def _hive_value(name, key):
+    return int(name.split("=", 1)[1]) if name.startswith(f"{key}=") else None
+
+def list_partitions(root, years=None, months=None):
+    """Partitions jour du dataset : [(chemin relatif, jeton)], le jeton (mtime_ns max de ses
+    fragments) ne change que si la partition a été réécrite. Dossiers annee/mois élagués."""
+    root = Path(root)
+    parts = []
+    for y in sorted(root.glob("annee=*")):
+        if years is not None and _hive_value(y.name, "annee") not in years:
+            continue
+        for m in sorted(y.glob("mois=*")):
+            if months is not None and _hive_value(m.name, "mois") not in months:
+                continue
+            for d in sorted(m.glob("jour=*")):
+                try:
+                    token = max(f.stat().st_mtime_ns for f in d.glob("*.parquet"))
+                except (ValueError, FileNotFoundError):   # partition vide ou en cours de remplacement
+                    continue
+                parts.append((d.relative_to(root).as_posix(), token))
+    return parts
+
+def day_fragments(root, days):
+    """Fragments des partitions jour `days` du dataset, par fichier source : {stem: [chemins]}."""
+    root = Path(root)
+    out = {}
+    for d in days:
+        d = pd.Timestamp(d)
+        for f in sorted((root / f"annee={d.year}" / f"mois={d.month}" / f"jour={d:%Y-%m-%d}").glob("*.parquet")):
+            out.setdefault(f.stem.rsplit("-", 1)[0], []).append(f)
+    return out
+
+def cube_fragments(path):
+    """Fragments d'un cube incrémental : [(chemin, mtime_ns)], triés par nom."""
+    return [(str(f), f.stat().st_mtime_ns) for f in sorted(Path(path).glob("*.parquet"))]
+
+
+# Cache Arrow IPC mappé en mémoire : une copie par machine, partagée par sessions et processus
+def _pending_casts(df):
+    """Colonnes de `df` qui ne sont pas encore au type de SCHEMA."""
+    return {c: t for c, t in SCHEMA.items() if c in df.columns and df[c].dtype != t}
+
+def final_table(table):
+    """Table aux types finaux de SCHEMA (dictionnaires, entiers courts, float32, date32) :
+    arrow_view la relit sans conversion. Inchangée si elle y est déjà (écrite par to_arrow)."""
+    df = table.to_pandas(split_blocks=True)
+    casts = _pending_casts(df)
+    return to_arrow(df.astype(casts)) if casts else table
+
+def write_ipc(table, path):
+    """Écrit une table en Arrow IPC (Feather v2) non compressé, de façon atomique : un fichier
+    non compressé peut être mappé en mémoire sans décodage. Les colonnes sont d'abord mises
+    aux types finaux (final_table) : la relecture n'a plus rien à convertir."""
+    # un seul bloc par colonne : un dictionnaire par colonne (exigé par le format fichier) et
+    # des tableaux contigus que to_pandas peut exposer sans les recopier
+    table = final_table(table).combine_chunks()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def open_ipc(path):
+    """Table Arrow mappée sur le fichier IPC : les buffers pointent dans le page cache de l'OS,
+    rien n'est copié dans le tas du processus."""
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+def arrow_view(table):
+    """DataFrame en lecture seule sur une table Arrow. Sur une table aux types finaux (fichiers
+    écrits par write_ipc / save_parquet), aucune conversion : les colonnes numériques, les
+    horodatages et date32 (enveloppe Arrow) sans valeurs manquantes pointent dans les buffers
+    mappés (split_blocks) ; les catégories (codes pandas recopiés depuis les index int32 du
+    dictionnaire) et les colonnes à valeurs manquantes (lat/lon hors sites) restent propres au
+    processus. Sur une table plus ancienne, seules les colonnes qui n'ont pas encore leur type
+    final (chaînes, entiers larges) sont converties. À partager tel quel entre sessions : ne
+    jamais le modifier en place."""
+    df = table.to_pandas(split_blocks=True)
+    casts = _pending_casts(df)
+    return df.astype(casts) if casts else df
+
+# Cube d'agrégats (partiels additifs)
+def save_cube(cube, path="data/processed/cube.parquet"):
+    """Écrit un cube (fichier unique, ou un fragment par fichier brut en mode incrémental)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(to_arrow(cube), path)
+
+def read_cube(path):
+    """Relit un cube : fichier unique ou dossier de fragments (recombinés)."""
+    path = Path(path)
+    if path.is_dir():
+        frags = [pd.read_parquet(f) for f in sorted(path.glob("*.parquet"))]
+        if not frags:
+            raise FileNotFoundError(f"Cube vide: {path}")
+        return combine_cubes(frags)
+    return enforce_schema(pd.read_parquet(path)).astype(CUBE_SCHEMA)
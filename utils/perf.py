@@ -0,0 +1,167 @@
+# utils/perf.py
+# Instrumentation légère des chemins chauds : temps, lignes, mémoire, cache — panneau « perf » + logs JSON
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = logging.getLogger("airq.perf")
+
+# AIRQ_PERF_LOG=chemin : une ligne JSON par mesure, agrégeable entre sessions et processus
+if os.environ.get("AIRQ_PERF_LOG"):
+    _handler = logging.FileHandler(os.environ["AIRQ_PERF_LOG"], encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+
+MAX_RECORDS = 500   # mesures gardées par exécution du script (thread)
+
+# Pic d'allocations par étape (tracemalloc) : seulement en session instrumentée, le traçage
+# ralentit chaque allocation. Compteur global au processus : des sessions concurrentes se mêlent.
+TRACE_MEMORY = os.environ.get("AIRQ_PERF") == "1" or bool(os.environ.get("AIRQ_PERF_LOG"))
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Streamlit exécute chaque rerun d'une session dans son thread : l'état est local au thread
+_local = threading.local()
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo), None si indisponible."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024   # octets sous macOS, Ko ailleurs
+
+def _mem_enter(stack):
+    """Ouvre la fenêtre de pic d'une mesure : le pic courant est reporté sur la mesure parente
+    avant la remise à zéro, pour qu'elle garde son propre maximum. (octets alloués, pic) ou None."""
+    if not TRACE_MEMORY or not tracemalloc.is_tracing():
+        return None
+    cur, peak = tracemalloc.get_traced_memory()
+    if stack and stack[-1].get("_mem"):
+        stack[-1]["_mem"][1] = max(stack[-1]["_mem"][1], peak)
+    tracemalloc.reset_peak()
+    return [cur, cur]
+
+def _mem_exit(mem, stack):
+    """Pic d'allocations de la mesure au-dessus de son point de départ (Mo)."""
+    if mem is None or not tracemalloc.is_tracing():
+        return None
+    peak = max(mem[1], tracemalloc.get_traced_memory()[1])
+    if stack and stack[-1].get("_mem"):
+        stack[-1]["_mem"][1] = max(stack[-1]["_mem"][1], peak)
+    return round((peak - mem[0]) / 1024**2, 1)
+
+def _state():
+    if not hasattr(_local, "records"):
+        _local.records = deque(maxlen=MAX_RECORDS)
+        _local.stack = []
+        _local.run = None
+        _local.t0 = time.perf_counter()
+    return _local
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        return None
+    return ctx.session_id if ctx is not None else None
+
+def _rows(obj):
+    """Nombre de lignes d'un DataFrame (ou du premier élément d'un tuple), None sinon."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    return len(obj) if isinstance(obj, pd.DataFrame) else None
+
+def start_run():
+    """Début d'un rerun : vide les mesures du thread et ouvre un nouvel identifiant d'exécution."""
+    s = _state()
+    s.records.clear()
+    s.stack.clear()
+    s.run = uuid.uuid4().hex[:8]
+    s.t0 = time.perf_counter()
+
+def records():
+    """Mesures de l'exécution en cours, dans l'ordre de début (parents avant enfants)."""
+    return sorted(_state().records, key=lambda r: r["start_ms"])
+
+@contextmanager
+def span(name, rows_in=None, cache=False):
+    """Mesure un bloc : temps, lignes entrée/sortie, pic d'allocations propre au bloc (si
+    TRACE_MEMORY) et, si `cache`, hit/miss du cache Streamlit (cf. miss()). Le dict produit
+    peut être complété par le bloc."""
+    s = _state()
+    rec = {"name": name, "rows_in": rows_in, "rows_out": None, "depth": len(s.stack)}
+    if cache:
+        rec["cache"] = "hit"
+    rec["_mem"] = _mem_enter(s.stack)
+    s.stack.append(rec)
+    t0 = time.perf_counter()
+    rec["start_ms"] = round((t0 - s.t0) * 1000, 2)
+    try:
+        yield rec
+    finally:
+        rec["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        s.stack.pop()
+        rec["mem_peak_mb"] = _mem_exit(rec.pop("_mem"), s.stack)
+        rec.update(run=s.run, session=_session_id(), ts=round(time.time(), 3))
+        s.records.append(rec)
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps(rec, default=str, ensure_ascii=False))
+
+def note(**fields):
+    """Ajoute des champs à la mesure en cours (ex. taille de la charge utile d'un graphique)."""
+    stack = _state().stack
+    if stack:
+        stack[-1].update(fields)
+
+def miss():
+    """À appeler dans le corps d'une fonction mise en cache : il ne s'exécute qu'en cas de miss."""
+    for rec in reversed(_state().stack):
+        if "cache" in rec:
+            rec["cache"] = "miss"
+            return
+
+def timed(name=None, cache=False):
+    """Décorateur : span() autour de chaque appel ; lignes d'entrée lues sur le premier
+    argument DataFrame, lignes de sortie sur le résultat."""
+    def deco(fn):
+        label = name or f"{fn.__module__.split('.')[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rows_in = next((len(a) for a in args if isinstance(a, pd.DataFrame)), None)
+            with span(label, rows_in, cache) as rec:
+                out = fn(*args, **kwargs)
+                if rec["rows_out"] is None:
+                    rec["rows_out"] = _rows(out)
+                return out
+        return wrapper
+    return deco
+
+def panel(container, rows):
+    """Tableau des mesures du rerun (indentées selon l'imbrication)."""
+    if not rows:
+        container.caption("Aucune mesure.")
+        return
+    df = pd.DataFrame(rows)
+    df["name"] = ["· " * d + n for d, n in zip(df["depth"], df["name"])]
+    cols = [c for c in ["name", "ms", "rows_in", "rows_out", "mem_peak_mb", "cache", "payload_bytes"] if c in df.columns]
+    container.dataframe(df[cols], hide_index=True, use_container_width=True)
+    top = df[df["depth"] == 0]["ms"].sum()
+    container.caption(f"Total (niveau 0) : {top:.0f} ms — run {rows[-1]['run']}")
@@ -0,0 +1,89 @@
+# utils/prefetch.py
+# Préchauffage en arrière-plan des caches des moteurs pour les états de filtres voisins
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("airq.prefetch")
+
+WORKERS = 2         # threads de calcul (le rerun en cours garde la main)
+MAX_PENDING = 32    # file bornée : au-delà, les demandes sont ignorées
+
+def neighbor_states(state, key, pollutants, years):
+    """États voisins de `state` dans l'ordre où l'utilisateur les demande le plus souvent :
+    polluant adjacent dans la liste, bascule d'une année, autre mode de mois, autres polluants."""
+    cur = state[key]
+    i = pollutants.index(cur) if cur in pollutants else 0
+    by_distance = sorted((p for p in pollutants if p != cur), key=lambda p: abs(pollutants.index(p) - i))
+    out = [{**state, key: p} for p in by_distance[:2]]
+    for y in (2024, 2025):
+        if y in years:
+            out.append({**state, "years": sorted(set(state["years"]) ^ {y}) or years})
+    out += [{**state, "months": m} for m in ([8, 9], [8], [9]) if m != state["months"]]
+    out += [{**state, key: p} for p in by_distance[2:]]
+    return out
+
+class Prefetcher:
+    """Pool de threads partagé par le processus : exécute des requêtes « probables » pour
+    remplir les LRU des moteurs (FilterEngine.filter, HourRangeIndex.tables).
+
+    File bornée à `max_pending` tâches (les suivantes sont abandonnées), dédoublonnée par
+    clé. Un changement de version annule les tâches en attente ; celles déjà lancées vont au
+    bout mais ne remplissent que les moteurs de l'ancienne version, déjà écartés.
+    """
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="airq-prefetch")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.RLock()    # fut.cancel() rappelle _done dans le même thread
+        self._pending = {}
+        self._version = None
+        self.stats = {"submitted": 0, "dropped": 0, "cancelled": 0, "done": 0, "failed": 0}
+
+    def submit(self, version, key, fn):
+        """Planifie `fn()` pour la version `version` ; False si déjà planifiée ou file pleine."""
+        with self._lock:
+            if version != self._version:
+                self._cancel_locked()
+                self._version = version
+            if key in self._pending:
+                return False
+            if not self._slots.acquire(blocking=False):
+                self.stats["dropped"] += 1
+                return False
+            fut = self._pool.submit(self._run, version, fn)
+            self._pending[key] = fut
+            self.stats["submitted"] += 1
+        fut.add_done_callback(lambda f, key=key: self._done(key, f))
+        return True
+
+    def _run(self, version, fn):
+        if version != self._version:    # version changée entre la planification et le départ
+            return
+        fn()
+
+    def _done(self, key, fut):
+        with self._lock:
+            if self._pending.get(key) is fut:
+                del self._pending[key]
+            if fut.cancelled():
+                self.stats["cancelled"] += 1
+            elif fut.exception() is not None:
+                self.stats["failed"] += 1
+                log.warning("préchauffage %s : %s", key, fut.exception())
+            else:
+                self.stats["done"] += 1
+        self._slots.release()
+
+    def _cancel_locked(self):
+        for fut in list(self._pending.values()):
+            fut.cancel()
+
+    def cancel(self):
+        """Annule toutes les tâches encore en attente."""
+        with self._lock:
+            self._cancel_locked()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
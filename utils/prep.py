@@ -1,41 +1,144 @@
 # utils/prep.py
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import re, unicodedata
 
+# Seuils horaires indicatifs (µg/m³) utilisés pour compter les dépassements
+THRESHOLDS = {"O3": 180, "NO2": 200, "PM10": 50, "PM2_5": 25, "SO2": 125}
+
+def norm_pollutant_key(p):
+    """Uniformise le libellé polluant pour lookup des seuils."""
+    p = (p or "").upper().strip().replace(" ", "").replace("-", "")
+    p = p.replace("PM2.5", "PM2_5").replace("PM25", "PM2_5")
+    return p
+
+def norm_selection(values):
+    """Clé de cache stable pour une sélection multiple (ordre indifférent), None si absente."""
+    return None if values is None else tuple(sorted(values))
+
+# Schéma compact de sortie de clean_data (conservé tel quel par un aller-retour Parquet)
+CATEGORY_COLS = [
+    "pollutant", "station_code", "station_name", "code_zas", "zas", "unit",
+    "organisme", "implantation_type", "influence_type", "source_file",
+    "type_d_evaluation", "procedure_mesure", "value_type", "quality_code", "date_fin",
+]
+SCHEMA = {
+    **{c: "category" for c in CATEGORY_COLS},
+    "jour": pd.ArrowDtype(pa.date32()),
+    "annee": "int16",
+    "mois": "int8",
+    "heure": "int8",
+    "value": "float32",       # mesures E2 à 1 décimale : float32 suffit
+    "value_raw": "float32",
+    "lat": "float64",         # st.map ne sérialise pas le float32
+    "lon": "float64",
+}
+
+def enforce_schema(df):
+    """Applique SCHEMA aux colonnes présentes (les autres sont laissées telles quelles)."""
+    return df.astype({c: t for c, t in SCHEMA.items() if c in df.columns})
+
 def _norm(s):
     """Normalise un nom de colonne : minuscules, sans accents, espaces → underscore."""
     s = unicodedata.normalize("NFKD", s.strip().lower())
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
     return re.sub(r"[^a-z0-9]+", "_", s).strip("_")
 
-def clean_data(df):
+# Schéma déclaré du flux E2 : en-tête normalisé -> (colonne, type). "drop" = jamais lu.
+E2_SCHEMA = {
+    "date_de_debut": ("date_heure", "date"),
+    "date_de_fin": ("date_fin", "category"),
+    "organisme": ("organisme", "category"),
+    "code_zas": ("code_zas", "category"),
+    "zas": ("zas", "category"),
+    "code_site": ("station_code", "category"),
+    "nom_site": ("station_name", "category"),
+    "type_d_implantation": ("implantation_type", "category"),
+    "polluant": ("pollutant", "category"),
+    "type_d_influence": ("influence_type", "category"),
+    "discriminant": ("discriminant", "drop"),
+    "reglementaire": ("reglementaire", "drop"),
+    "type_d_evaluation": ("type_d_evaluation", "category"),
+    "procedure_de_mesure": ("procedure_mesure", "category"),
+    "type_de_valeur": ("value_type", "category"),
+    "valeur": ("value", "float"),
+    "valeur_brute": ("value_raw", "float"),
+    "unite_de_mesure": ("unit", "category"),
+    "taux_de_saisie": ("taux_saisie", "drop"),
+    "couverture_temporelle": ("coverage_time", "drop"),
+    "couverture_de_donnees": ("coverage_data", "drop"),
+    "code_qualite": ("quality_code", "category"),
+    "validite": ("validity", "int"),
+}
+# Formats de date acceptés, essayés dans l'ordre (pas d'inférence de format)
+DATE_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+# Codes de rejet des lignes mises en quarantaine (par ordre de priorité)
+REJECT_REASONS = {
+    "colonnes": "nombre de champs différent de l'en-tête",
+    "date_invalide": "date dans aucun des formats déclarés",
+    "valeur_invalide": "valeur non numérique",
+    "non_valide": "validité différente de 1",
+    "date_manquante": "date absente",
+    "valeur_manquante": "valeur absente",
+    "polluant_manquant": "polluant absent",
+    "doublon": "même heure, station et polluant qu'une ligne d'un fichier plus récent",
+}
+
+# Clé naturelle d'une mesure : le flux republie les heures corrigées dans les fichiers suivants
+DEDUP_KEYS = ["date_heure", "station_code", "pollutant"]
+
+def key_hash(df, keys=DEDUP_KEYS):
+    """Hash 64 bits vectorisé de la clé `keys` de chaque ligne, stable d'un bloc ou d'un fichier
+    à l'autre : catégories hachées par valeur, dates ramenées à la nanoseconde."""
+    k = df[keys]
+    k = k.astype({c: "datetime64[ns]" for c in keys if pd.api.types.is_datetime64_any_dtype(k[c])})
+    return pd.util.hash_pandas_object(k, index=False).to_numpy()
+
+def reject(df, mask, raison, rejects=None):
+    """Écarte les lignes `mask` ; si `rejects` est une liste, elles y vont avec le code `raison`."""
+    if not mask.any():
+        return df
+    if rejects is not None:
+        # mêmes colonnes que les autres rejets (colonnes dérivées de date_heure retirées)
+        rejects.append(enforce_schema(df[mask].drop(columns=["annee", "mois", "jour", "heure"], errors="ignore")
+                                      .assign(raison=raison, brut=None)))
+    return df[~mask]
+
+def duplicate_mask(df, keys=DEDUP_KEYS):
+    """Lignes à écarter : pour chaque clé, seule est gardée la ligne du `source_file` le plus
+    récent (noms E2 datés, ordre lexical = ordre de publication), la dernière à égalité."""
+    h = key_hash(df, keys)
+    if "source_file" in df.columns:
+        order = np.argsort(pd.Categorical(df["source_file"].astype(str)).codes, kind="stable")
+    else:
+        order = np.arange(len(df))
+    dup = np.empty(len(df), dtype=bool)
+    dup[order] = pd.Series(h[order]).duplicated(keep="last").to_numpy()
+    return dup
+
+def parse_dates(s):
+    """Dates texte -> datetime64 selon DATE_FORMATS ; NaT pour tout le reste."""
+    out = pd.to_datetime(s, errors="coerce", format=DATE_FORMATS[0])
+    for fmt in DATE_FORMATS[1:]:
+        todo = out.isna() & s.notna()
+        if not todo.any():
+            break
+        out.loc[todo] = pd.to_datetime(s[todo], errors="coerce", format=fmt)
+    return out
+
+def clean_data(df, rejects=None):
+    """Harmonise et filtre les lignes E2 (brutes ou déjà typées par utils.io.read_e2).
+
+    Les lignes écartées reçoivent un code `raison` (REJECT_REASONS) ; si `rejects` est une
+    liste, elles y sont ajoutées pour la quarantaine au lieu d'être perdues. Les doublons
+    (DEDUP_KEYS) ne gardent que la version du fichier le plus récent.
+    """
     df = df.copy()
     df.columns = [_norm(c) for c in df.columns]
 
-    mapping = {
-        "date_de_debut": "date_heure",
-        "date_de_fin": "date_fin",
-        "polluant": "pollutant",
-        "valeur": "value",
-        "valeur_brute": "value_raw",
-        "unite_de_mesure": "unit",
-        "code_site": "station_code",
-        "nom_site": "station_name",
-        "code_qualite": "quality_code",
-        "validite": "validity",
-        "type_d_implantation": "implantation_type",
-        "type_d_influence": "influence_type",
-        "reglementaire": "reglementaire",
-        "procedure_de_mesure": "procedure_mesure",
-        "type_de_valeur": "value_type",
-        "taux_de_saisie": "taux_saisie",
-        "couverture_temporelle": "coverage_time",
-        "couverture_de_donnees": "coverage_data",
-        "organisme": "organisme",
-        "code_zas": "code_zas",
-        "zas": "zas",
-        "discriminant": "discriminant",
-    }
+    mapping = {k: name for k, (name, _) in E2_SCHEMA.items()}
     df = df.rename(columns={k: v for k, v in mapping.items() if k in df.columns})
 
     if "date_heure" not in df.columns:
@@ -44,72 +147,126 @@ def clean_data(df):
         else:
             raise KeyError("Impossible de trouver une colonne date (ni 'Date de début' ni 'Date de fin').")
 
-    dt = pd.to_datetime(df["date_heure"], errors="coerce", format="%Y/%m/%d %H:%M:%S")
-    if dt.isna().any():
-        mask = dt.isna()
-        dt.loc[mask] = pd.to_datetime(df.loc[mask, "date_heure"], errors="coerce")
-    df["date_heure"] = dt
+    # typage en une passe quand le lecteur ne l'a pas déjà fait (read_e2 fournit raison/brut)
+    raison = df.pop("raison") if "raison" in df.columns else pd.Series(None, index=df.index, dtype="object")
+    brut = df.pop("brut") if "brut" in df.columns else pd.Series(None, index=df.index, dtype="object")
+    raison = raison.astype("object")
+    if not pd.api.types.is_datetime64_any_dtype(df["date_heure"]):
+        text = df["date_heure"].astype("object")
+        df["date_heure"] = parse_dates(text)
+        bad = raison.isna() & text.notna() & df["date_heure"].isna()
+        raison[bad], brut[bad] = "date_invalide", text[bad]
+    if "value" in df.columns and not pd.api.types.is_numeric_dtype(df["value"]):
+        text = df["value"].astype("object")
+        df["value"] = pd.to_numeric(text, errors="coerce")
+        bad = raison.isna() & text.notna() & df["value"].isna()
+        raison[bad], brut[bad] = "valeur_invalide", text[bad]
+    if "value_raw" in df.columns and not pd.api.types.is_numeric_dtype(df["value_raw"]):
+        df["value_raw"] = pd.to_numeric(df["value_raw"], errors="coerce")
 
-    if "value" in df.columns:
-        df["value"] = pd.to_numeric(df["value"], errors="coerce")
     if "validity" in df.columns:
-        df = df[df["validity"] == 1]
+        raison[raison.isna() & (pd.to_numeric(df["validity"], errors="coerce") != 1)] = "non_valide"
+    for col, code in [("date_heure", "date_manquante"), ("value", "valeur_manquante"), ("pollutant", "polluant_manquant")]:
+        if col in df.columns:
+            raison[raison.isna() & df[col].isna()] = code
 
-    df = df.dropna(subset=["date_heure", "value", "pollutant"])
+    keep = raison.isna().to_numpy()
+    if rejects is not None and not keep.all():
+        rejects.append(enforce_schema(df[~keep].assign(raison=raison[~keep], brut=brut[~keep].astype("object"))))
+    df = df[keep]
 
     df["annee"] = df["date_heure"].dt.year
     df["mois"]  = df["date_heure"].dt.month
-    df["jour"]  = df["date_heure"].dt.date
+    df["jour"]  = df["date_heure"].dt.normalize()
     df["heure"] = df["date_heure"].dt.hour
 
-    df["pollutant"] = df["pollutant"].astype(str).str.upper().str.strip()
+    pol = df["pollutant"]
+    if isinstance(pol.dtype, pd.CategoricalDtype):
+        # normalisation sur les catégories (quelques dizaines) plutôt que sur chaque ligne
+        df["pollutant"] = pol.map({c: str(c).upper().strip() for c in pol.cat.categories}).astype("category")
+    else:
+        df["pollutant"] = pol.astype(str).str.upper().str.strip()
+
+    df = reject(df, duplicate_mask(df), "doublon", rejects)
 
-    cols_to_drop = [
-        "reglementaire", "validity", "discriminant",
-        "taux_saisie", "coverage_time", "coverage_data",
-    ]
+    cols_to_drop = [name for name, kind in E2_SCHEMA.values() if kind == "drop"] + ["validity"]
     df = df.drop(columns=[c for c in cols_to_drop if c in df.columns], errors="ignore")
 
-    return df
+    return enforce_schema(df)
 
-def make_tables(df):
-    tables: dict = {}
+# Cube d'agrégats : partiels additifs par (annee, mois, jour, heure, pollutant, station_code)
+CUBE_KEYS = ["annee", "mois", "jour", "heure", "pollutant", "station_code"]
+CUBE_SCHEMA = {"sum": "float64", "count": "int32", "min": "float32", "max": "float32", "depassements": "int32"}
+
+def is_cube(df):
+    return df is not None and set(CUBE_SCHEMA).issubset(df.columns)
+
+def build_cube(df):
+    """Agrège des lignes nettoyées en partiels additifs (somme, effectif, min, max, dépassements).
+
+    Le seuil de chaque ligne est celui de son polluant (THRESHOLDS) ; les partiels se
+    recombinent par simple somme/min/max, cf. combine_cubes et rollup.
+    """
+    pol = pd.Categorical(df["pollutant"])
+    thr = np.array([THRESHOLDS.get(norm_pollutant_key(p), np.nan) for p in pol.categories] + [np.nan])
+    v = df["value"].to_numpy(dtype="float64", na_value=np.nan)
+    d = df[CUBE_KEYS].assign(value=v, depasse=v > thr[pol.codes])
+    cube = (
+        d.groupby(CUBE_KEYS, as_index=False, observed=True, sort=False)
+         .agg(sum=("value", "sum"), count=("value", "count"), min=("value", "min"),
+              max=("value", "max"), depassements=("depasse", "sum"))
+    )
+    return enforce_schema(cube).astype(CUBE_SCHEMA)
+
+def rollup(cube, by):
+    """Ré-agrège le cube selon `by` et ajoute la moyenne (sum / count)."""
+    out = (
+        cube.groupby(by, as_index=False, observed=True)
+            .agg(sum=("sum", "sum"), count=("count", "sum"), min=("min", "min"),
+                 max=("max", "max"), depassements=("depassements", "sum"))
+    )
+    out["mean"] = out["sum"] / out["count"]
+    return out
+
+def combine_cubes(cubes):
+    """Fusionne des cubes partiels (blocs, fichiers) en un cube unique."""
+    cube = rollup(pd.concat(cubes, ignore_index=True), CUBE_KEYS).drop(columns="mean")
+    return enforce_schema(cube).astype(CUBE_SCHEMA)
+
+def as_cube(df):
+    """Le cube tel quel, ou construit à la volée depuis des lignes brutes."""
+    return df if is_cube(df) else build_cube(df)
 
+MOIS_FR = {1: "Janvier", 2: "Février", 3: "Mars", 4: "Avril", 5: "Mai", 6: "Juin", 7: "Juillet",
+           8: "Août", 9: "Septembre", 10: "Octobre", 11: "Novembre", 12: "Décembre"}
+
+def summary_tables(cube):
+    """KPIs, moyennes annuelles et mensuelles depuis un cube quelconque (clés annee, mois,
+    pollutant, station_code ; `jour` optionnel)."""
+    n = int(cube["count"].sum())
+    tables: dict = {}
     tables["kpis"] = {
-        "nb_rows": int(len(df)),
-        "nb_days": int(df["jour"].nunique()) if "jour" in df.columns else None,
-        "nb_stations": int(df["station_code"].nunique()) if "station_code" in df.columns else None,
-        "mean": float(df["value"].mean()) if "value" in df.columns else None,
-        "max": float(df["value"].max()) if "value" in df.columns else None,
+        "nb_rows": n,
+        "nb_days": int(cube["jour"].nunique()) if "jour" in cube.columns else None,
+        "nb_stations": int(cube["station_code"].nunique()),
+        "mean": float(cube["sum"].sum() / n) if n else None,
+        "max": float(cube["max"].max()) if n else None,
     }
 
-    if {"annee", "heure", "pollutant", "value"}.issubset(df.columns):
-        tables["hourly"] = (
-            df.groupby(["annee", "heure", "pollutant"], as_index=False)["value"]
-              .agg(mean="mean", max="max")
-        )
-    else:
-        tables["hourly"] = pd.DataFrame()
-
-    if {"annee", "pollutant", "value"}.issubset(df.columns):
-        tables["year_avg"] = (
-            df.groupby(["annee", "pollutant"], as_index=False)["value"]
-              .mean()
-              .rename(columns={"value": "moyenne"})
-        )
-    else:
-        tables["year_avg"] = pd.DataFrame()
-
-    if {"mois", "annee", "pollutant", "value"}.issubset(df.columns):
-        month_map = {8: "Août", 9: "Septembre"}
-        d = df[df["mois"].isin([8, 9])].copy()
-        d["mois_label"] = d["mois"].map(month_map).fillna(d["mois"].astype(str))
-        tables["month_avg"] = (
-            d.groupby(["annee", "mois_label", "pollutant"], as_index=False)["value"]
-             .mean()
-             .rename(columns={"value": "moyenne"})
-        )
-    else:
-        tables["month_avg"] = pd.DataFrame()
+    tables["year_avg"] = (
+        rollup(cube, ["annee", "pollutant"])[["annee", "pollutant", "mean"]]
+        .rename(columns={"mean": "moyenne"})
+    )
 
+    d = rollup(cube, ["annee", "mois", "pollutant"])
+    d["mois_label"] = d["mois"].map(MOIS_FR).fillna(d["mois"].astype(str))
+    tables["month_avg"] = d[["annee", "mois_label", "pollutant", "mean"]].rename(columns={"mean": "moyenne"})
     return tables
+
+def hourly_table(cube):
+    return rollup(cube, ["annee", "heure", "pollutant"])[["annee", "heure", "pollutant", "mean", "max"]]
+
+def make_tables(df):
+    """KPIs et agrégats de l'Overview, répondus depuis le cube (`df` : cube ou lignes brutes)."""
+    cube = as_cube(df)
+    return {**summary_tables(cube), "hourly": hourly_table(cube)}
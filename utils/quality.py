@@ -0,0 +1,111 @@
+# utils/quality.py
+# Rapport qualité précalculé (écrit par merge_data.py) : par partition jour, polluant et station,
+# lignes gardées, heures couvertes, doublons, valeurs manquantes et mesures non valides
+from pathlib import Path
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils.io import to_arrow
+from utils.prep import enforce_schema
+
+KEYS = ["annee", "mois", "jour", "pollutant", "station_code"]
+COUNTS = ["lignes", "heures", "doublons", "manquantes", "non_valides", "autres_rejets"]
+# raison de quarantaine → colonne du rapport (les autres raisons vont dans autres_rejets)
+REASON_COLUMNS = {"doublon": "doublons", "valeur_manquante": "manquantes", "valeur_invalide": "manquantes",
+                  "non_valide": "non_valides"}
+
+def _keyed(df):
+    """Clés du rapport d'un bloc (lignes nettoyées ou rejetées), sans les lignes non datées."""
+    df = df[df["date_heure"].notna()] if "date_heure" in df.columns else df.iloc[:0]
+    d = df["date_heure"] if "date_heure" in df.columns else pd.Series(dtype="datetime64[ns]")
+    text = lambda c: (df[c].astype("object").str.upper().str.strip() if c == "pollutant" else df[c].astype("object")) \
+        if c in df.columns else None
+    return pd.DataFrame({"annee": d.dt.year, "mois": d.dt.month, "jour": d.dt.normalize(),
+                         "pollutant": text("pollutant"), "station_code": text("station_code"),
+                         "heure": d.dt.hour}, index=df.index)
+
+def _regroup(t):
+    out = t.groupby(KEYS, as_index=False, dropna=False, sort=True)[COUNTS].sum()
+    out[COUNTS] = out[COUNTS].astype("int32")
+    out["heures"] = out["heures"].clip(upper=24)    # même heure gardée dans deux fichiers ingérés séparément
+    return enforce_schema(out)
+
+def build_quality(df=None, rejects=None):
+    """Rapport d'un bloc : `df` = lignes gardées par clean_data, `rejects` = liste de lignes
+    rejetées (colonne `raison`). Partiels additifs, recombinés par combine_quality."""
+    parts = []
+    if df is not None and len(df):
+        k = _keyed(df)
+        parts.append(k.groupby(KEYS, dropna=False).agg(lignes=("heure", "size"), heures=("heure", "nunique"))
+                      .reset_index())
+    r = [x for x in (rejects or []) if len(x)]
+    if r:
+        r = pd.concat([x.astype({c: "object" for c in x.select_dtypes("category")}) for x in r], ignore_index=True)
+        k = _keyed(r).assign(col=r["raison"].map(REASON_COLUMNS).fillna("autres_rejets"))
+        parts.append(k.groupby(KEYS + ["col"], dropna=False).size().unstack("col", fill_value=0).reset_index())
+    if not parts:
+        return None
+    return _regroup(pd.concat(parts, ignore_index=True).reindex(columns=KEYS + COUNTS).fillna(
+        {c: 0 for c in COUNTS}))
+
+def combine_quality(parts):
+    """Fusionne des rapports partiels (blocs, fichiers) par somme des compteurs."""
+    parts = [p for p in parts if p is not None and len(p)]
+    if not parts:
+        return None
+    return _regroup(pd.concat([p.astype({c: "object" for c in p.select_dtypes("category")}) for p in parts],
+                              ignore_index=True))
+
+def save_quality(report, path="data/processed/quality.parquet"):
+    """Écrit le rapport (remplacement atomique) ; sans rapport, supprime l'éventuel ancien."""
+    path = Path(path)
+    if report is None:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(to_arrow(report), tmp)
+    tmp.replace(path)
+
+def read_quality(path="data/processed/quality.parquet"):
+    """Relit le rapport (None s'il n'a pas encore été écrit)."""
+    path = Path(path)
+    return enforce_schema(pd.read_parquet(path)) if path.exists() else None
+
+def _select(report, pollutants=None, years=None, months=None):
+    q = report
+    if pollutants is not None:
+        q = q[q["pollutant"].isin(list(pollutants))]
+    if years is not None:
+        q = q[q["annee"].isin(list(years))]
+    if months is not None:
+        q = q[q["mois"].isin(list(months))]
+    return q
+
+def summary(report, pollutants=None, years=None, months=None):
+    """Indicateurs d'une sélection : totaux, taux de valeurs manquantes (sur les lignes reçues)
+    et couverture horaire moyenne des stations (heures gardées / 24 × jours de la sélection)."""
+    q = _select(report, pollutants, years, months)
+    tot = {c: int(q[c].sum()) for c in COUNTS}
+    recues = tot["lignes"] + tot["doublons"] + tot["manquantes"] + tot["non_valides"] + tot["autres_rejets"]
+    cov = coverage(report, pollutants, years, months)
+    return {**tot, "recues": recues,
+            "taux_manquant": tot["manquantes"] / recues if recues else 0.0,
+            "couverture": float(cov["couverture"].mean()) if len(cov) else None}
+
+def partitions(report, pollutants=None, years=None, months=None):
+    """Une ligne par partition jour (et polluant) : compteurs et nombre de stations."""
+    q = _select(report, pollutants, years, months)
+    out = (q.assign(stations=q["lignes"] > 0)
+            .groupby(["jour", "pollutant"], as_index=False, observed=True)[COUNTS + ["stations"]].sum())
+    out["couverture"] = out["heures"] / (24 * out["stations"]).where(out["stations"] > 0)
+    return out.drop(columns="heures")
+
+def coverage(report, pollutants=None, years=None, months=None):
+    """Couverture horaire par station et polluant sur les jours de la sélection (1 = 24 h/24)."""
+    q = _select(report, pollutants, years, months)
+    q = q[q["lignes"] > 0]
+    days = q.groupby("pollutant", observed=True)["jour"].nunique()
+    out = q.groupby(["station_code", "pollutant"], as_index=False, observed=True)["heures"].sum()
+    out["couverture"] = out["heures"] / (24 * out["pollutant"].map(days).astype("float64"))
+    return out.sort_values("couverture", kind="stable", ignore_index=True)
@@ -0,0 +1,138 @@
+# utils/rangeindex.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.prep import (
+    as_cube, rollup, enforce_schema, summary_tables, hourly_table, norm_selection, CUBE_SCHEMA,
+)
+
+GROUP_KEYS = ["pollutant", "annee", "mois", "station_code"]
+HOURS = 24
+
+class HourRangeIndex:
+    """Index de requêtes par plage horaire sur les 24 tranches de chaque groupe
+    (pollutant, annee, mois, station_code).
+
+    Sommes préfixes pour sum/count/dépassements et tables clairsemées (sparse tables)
+    pour min/max : toute plage [h0, h1] se résout en O(1) par groupe, sans relire de lignes.
+    Les résultats ont la forme d'un cube (cf. utils.prep.rollup), ce qui permet de
+    réutiliser make_tables / _hourly_profile / _exceedances tels quels. Les tables de
+    l'Overview sont mémorisées par état de filtres (LRU, lecture seule, cf. FilterEngine).
+    """
+
+    def __init__(self, df, maxsize=64):
+        cells = rollup(as_cube(df), GROUP_KEYS + ["heure"])
+        grouped = cells.groupby(GROUP_KEYS, observed=True, sort=True)
+        g = grouped.ngroup().to_numpy()
+        h = cells["heure"].to_numpy(dtype="intp")
+        self.keys = grouped.size().reset_index()[GROUP_KEYS]
+        n = len(self.keys)
+
+        self.sum = np.zeros((n, HOURS))
+        self.count = np.zeros((n, HOURS), dtype="int64")
+        self.depassements = np.zeros((n, HOURS), dtype="int64")
+        self.min = np.full((n, HOURS), np.inf, dtype="float32")
+        self.max = np.full((n, HOURS), -np.inf, dtype="float32")
+        self.sum[g, h] = cells["sum"].to_numpy()
+        self.count[g, h] = cells["count"].to_numpy()
+        self.depassements[g, h] = cells["depassements"].to_numpy()
+        self.min[g, h] = cells["min"].to_numpy()
+        self.max[g, h] = cells["max"].to_numpy()
+
+        self._prefix = {
+            name: np.concatenate([np.zeros((n, 1), dtype=a.dtype), a.cumsum(axis=1)], axis=1)
+            for name, a in [("sum", self.sum), ("count", self.count), ("depassements", self.depassements)]
+        }
+        self._sparse = {"min": self._sparse_table(self.min, np.minimum),
+                        "max": self._sparse_table(self.max, np.maximum)}
+
+        # jours disponibles par (pollutant, annee, mois), pour le KPI nb_days
+        self.days = (
+            as_cube(df)[["pollutant", "annee", "mois", "jour"]]
+            .drop_duplicates().reset_index(drop=True)
+        )
+
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sparse_table(a, op):
+        """levels[k][:, i] = op sur les tranches [i, i + 2**k)."""
+        levels = [a]
+        k = 1
+        while 1 << k <= a.shape[1]:
+            prev, half = levels[-1], 1 << (k - 1)
+            width = a.shape[1] - (1 << k) + 1
+            levels.append(op(prev[:, :width], prev[:, half:half + width]))
+            k += 1
+        return levels
+
+    @staticmethod
+    def _mask(frame, pollutants=None, years=None, months=None):
+        """Sélection des groupes (quelques milliers de clés, pas des lignes brutes)."""
+        m = np.ones(len(frame), dtype=bool)
+        for col, values in [("pollutant", pollutants), ("annee", years), ("mois", months)]:
+            if values is not None:
+                m &= frame[col].isin(values).to_numpy()
+        return m
+
+    def mask(self, pollutants=None, years=None, months=None):
+        """Masque des groupes (lignes de self.keys) d'une sélection : à passer à range_arrays."""
+        return self._mask(self.keys, pollutants, years, months)
+
+    def nb_days(self, pollutants=None, years=None, months=None):
+        """Nombre de jours distincts couverts par la sélection."""
+        return int(self.days.loc[self._mask(self.days, pollutants, years, months), "jour"].nunique())
+
+    def range_arrays(self, m, hour_range=(0, HOURS - 1)):
+        """Partiels sur la plage horaire des groupes du masque `m` : {sum, count, depassements,
+        min, max} en tableaux NumPy alignés sur self.keys[m]."""
+        h0, h1 = hour_range
+        out = {name: p[m, h1 + 1] - p[m, h0] for name, p in self._prefix.items()}
+        k = (h1 - h0 + 1).bit_length() - 1
+        for name, levels in self._sparse.items():
+            op = np.minimum if name == "min" else np.maximum
+            out[name] = op(levels[k][m, h0], levels[k][m, h1 - (1 << k) + 1])
+        return out
+
+    def range_cube(self, pollutants=None, years=None, months=None, hour_range=(0, HOURS - 1)):
+        """Partiels agrégés sur la plage horaire, une ligne par groupe sélectionné."""
+        m = self.mask(pollutants, years, months)
+        out = self.keys[m].reset_index(drop=True).assign(**self.range_arrays(m, hour_range))
+        return out[out["count"] > 0].reset_index(drop=True).astype(CUBE_SCHEMA)
+
+    def hourly_cells(self, pollutants=None, years=None, months=None, hour_range=(0, HOURS - 1)):
+        """Partiels par groupe et par heure sur la plage (forme cube, clé `heure` en plus)."""
+        h0, h1 = hour_range
+        m = self.mask(pollutants, years, months)
+        keys = self.keys[m].reset_index(drop=True)
+        hours = np.arange(h0, h1 + 1)
+        out = keys.loc[keys.index.repeat(len(hours))].reset_index(drop=True)
+        out["heure"] = np.tile(hours, len(keys)).astype("int8")
+        for name in ["sum", "count", "depassements", "min", "max"]:
+            out[name] = getattr(self, name)[m][:, h0:h1 + 1].ravel()
+        return enforce_schema(out[out["count"] > 0].reset_index(drop=True)).astype(CUBE_SCHEMA)
+
+    def tables(self, pollutants=None, years=None, months=None, hour_range=(0, HOURS - 1)):
+        """Mêmes sorties que utils.prep.make_tables, sans parcourir de lignes."""
+        key = (norm_selection(pollutants), norm_selection(years), norm_selection(months),
+               None if hour_range is None else tuple(hour_range))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        sel = dict(pollutants=pollutants, years=years, months=months)
+        tables = summary_tables(self.range_cube(hour_range=hour_range, **sel))
+        tables["kpis"]["nb_days"] = self.nb_days(**sel)
+        tables["hourly"] = hourly_table(self.hourly_cells(hour_range=hour_range, **sel))
+
+        with self._lock:
+            self._cache[key] = tables
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return tables
+
@@ -0,0 +1,221 @@
+# utils/resultcache.py
+# Cache de résultats sur disque, adressé par contenu (fonction, état de filtres normalisé,
+# version des données) : fichiers Arrow IPC partagés par les processus / répliques Streamlit
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from utils.perf import miss
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = logging.getLogger("airq.resultcache")
+
+MAX_BYTES = 512 << 20   # taille totale visée du cache (éviction LRU au-delà)
+RESCAN_EVERY = 16       # écritures entre deux relevés complets (les autres processus écrivent aussi)
+_ENTRY = pa.schema([("nom", pa.string()), ("genre", pa.string()), ("ipc", pa.binary())])
+
+def _canon(v):
+    """Forme JSON stable d'une valeur d'état : listes/ensembles triés, tuples → listes, NumPy → Python."""
+    if isinstance(v, dict):
+        return {str(k): _canon(x) for k, x in sorted(v.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(v, (set, frozenset)):
+        return sorted((_canon(x) for x in v), key=repr)
+    if isinstance(v, (list, tuple)):
+        return [_canon(x) for x in v]
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+def normalize_state(state):
+    """État de filtres normalisé : même clé quel que soit l'ordre des sélections multiples
+    (polluants, années, mois) ; l'ordre des bornes (plage horaire) est conservé."""
+    out = {}
+    for k, v in _canon(state).items():
+        if isinstance(v, list) and k != "hour_range" and all(not isinstance(x, list) for x in v):
+            v = sorted(set(v), key=lambda x: (type(x).__name__, x))
+        out[k] = v
+    return out
+
+def result_key(fn, state, version):
+    """Adresse d'un résultat : empreinte de (fonction, état normalisé, version)."""
+    raw = json.dumps([fn, normalize_state(state), str(version)], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+# Sérialisation : un fichier IPC par résultat, une ligne par table (flux IPC imbriqué)
+def _stream(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def _encode(result):
+    """DataFrame, ou dict de DataFrames / de petits dicts scalaires (kpis) → table d'entrée."""
+    parts = result.items() if isinstance(result, dict) else [("", result)]
+    rows = {"nom": [], "genre": [], "ipc": []}
+    for name, v in parts:
+        if isinstance(v, pd.DataFrame):
+            genre, table = "table", pa.Table.from_pandas(v)
+        elif isinstance(v, dict):
+            genre, table = "record", pa.Table.from_pylist([_canon(v)])
+        else:
+            raise TypeError(f"résultat non sérialisable ({name}: {type(v).__name__})")
+        rows["nom"].append(name)
+        rows["genre"].append(genre)
+        rows["ipc"].append(_stream(table).to_pybytes())
+    meta = {b"forme": b"dict" if isinstance(result, dict) else b"frame"}
+    return pa.table(rows, schema=_ENTRY.with_metadata(meta))
+
+def _decode(entry):
+    out = {}
+    for name, genre, ipc in zip(entry["nom"].to_pylist(), entry["genre"].to_pylist(), entry["ipc"]):
+        table = pa.ipc.open_stream(ipc.as_buffer()).read_all()     # sans copie : pointe dans le fichier mappé
+        out[name] = table.to_pylist()[0] if genre == "record" else table.to_pandas()
+    return out if entry.schema.metadata.get(b"forme") == b"dict" else out[""]
+
+class ResultCache:
+    """Résultats calculés une fois pour tous les processus qui partagent `root` (disque local
+    ou volume partagé) : une nouvelle réplique démarre avec le cache des autres.
+
+    Une entrée = un fichier <clé>.arrow, écrit dans un temporaire puis renommé (atomique) :
+    un lecteur ne voit jamais de fichier partiel, deux écrivains du même résultat écrivent le
+    même contenu. La date de modification sert d'horodatage LRU (rafraîchie à chaque lecture) ;
+    au-delà de `max_bytes`, les entrées les moins récemment lues sont supprimées, sous un verrou
+    de fichier (fcntl) pour que deux processus n'évincent pas en même temps. Le dossier n'est
+    relu qu'au dépassement estimé ou toutes les RESCAN_EVERY écritures : la limite peut être
+    franchie d'environ RESCAN_EVERY entrées par processus. Une entrée illisible est supprimée
+    et recalculée.
+    """
+
+    def __init__(self, root, version=None, max_bytes=MAX_BYTES):
+        self.root = Path(root)
+        self.version = version
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._approx = None     # taille estimée : dernier relevé + écritures de ce processus
+        self._writes = 0
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0, "errors": 0}
+
+    def path(self, fn, state):
+        key = result_key(fn, state, self.version)
+        return self.root / key[:2] / f"{key}.arrow"
+
+    def get(self, fn, state, compute):
+        """Résultat de `fn` pour `state` : relu sur disque s'il existe, sinon `compute()` puis écrit."""
+        p = self.path(fn, state)
+        hit = self._read(p)
+        if hit is not None:
+            self._count("hits")
+            return hit
+        self._count("misses")
+        miss()
+        result = compute()
+        try:
+            self._write(p, result)
+        except (OSError, TypeError, pa.ArrowException) as e:   # le cache ne doit jamais casser la page
+            self._count("errors")
+            log.warning("écriture %s : %s", p.name, e)
+        return result
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _read(self, p):
+        try:
+            with pa.memory_map(str(p), "r") as source:
+                entry = pa.ipc.open_file(source).read_all()
+            os.utime(p)     # récence LRU
+            return _decode(entry)
+        except FileNotFoundError:
+            return None
+        except (OSError, pa.ArrowException, KeyError, IndexError) as e:
+            self._count("errors")
+            log.warning("entrée illisible %s : %s", p.name, e)
+            p.unlink(missing_ok=True)
+            return None
+
+    def _write(self, p, result):
+        entry = _encode(result)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, entry.schema) as writer:
+                writer.write_table(entry)
+            tmp.replace(p)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        size = p.stat().st_size
+        with self._lock:
+            self.stats["writes"] += 1
+            self._writes += 1
+            if self._approx is not None and self._writes % RESCAN_EVERY:
+                self._approx += size
+                if self._approx <= self.max_bytes:
+                    return
+        self.evict()
+
+    @contextmanager
+    def _exclusive(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.root / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self):
+        """[(mtime_ns, taille, chemin)] des entrées, des plus anciennes aux plus récentes."""
+        out = []
+        for p in self.root.glob("*/*.arrow"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:   # évincée par un autre processus entre-temps
+                continue
+            out.append((st.st_mtime_ns, st.st_size, p))
+        return sorted(out)
+
+    def size(self):
+        return sum(s for _, s, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        """Supprime les entrées les moins récemment lues jusqu'à repasser sous `max_bytes`."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        with self._exclusive():
+            entries = self.entries()
+            total = sum(s for _, s, _ in entries)
+            n = 0
+            for _, size, p in entries:
+                if total <= limit:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                n += 1
+        with self._lock:
+            self._approx = total
+        if n:
+            self._count("evicted", n)
+        return n
+
+    def clear(self):
+        return self.evict(0)
+
+def cached(cache, fn, state, compute):
+    """`compute()` à travers `cache` s'il est actif (None : calcul direct)."""
+    return compute() if cache is None else cache.get(fn, state, compute)
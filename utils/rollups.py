@@ -0,0 +1,101 @@
+# utils/rollups.py
+# Agrégats multi-granularité (heure → jour → semaine → mois) par station et polluant, et requêtes
+# de séries longues qui choisissent la granularité d'après la période et la résolution du graphique
+import numpy as np
+import pandas as pd
+
+from utils.prep import CUBE_SCHEMA, rollup, enforce_schema
+
+# Durée d'une case par granularité, de la plus fine à la plus grossière (mois : 30 jours, approché)
+GRAINS = {
+    "heure": np.timedelta64(1, "h"),
+    "jour": np.timedelta64(1, "D"),
+    "semaine": np.timedelta64(7, "D"),
+    "mois": np.timedelta64(30, "D"),
+}
+KEYS = ["periode", "pollutant", "station_code"]
+MAX_POINTS = 1000   # résolution par défaut d'une série (cf. viz.MAX_LINE_POINTS)
+
+def bucket(days, grain):
+    """Début de la case (jour, semaine ISO commençant le lundi, mois) de dates datetime64[D]."""
+    days = np.asarray(days, dtype="datetime64[D]")
+    if grain == "semaine":
+        # 1970-01-01 est un jeudi : (n + 3) % 7 = jours écoulés depuis le lundi
+        return days - ((days.astype("int64") + 3) % 7).astype("timedelta64[D]")
+    if grain == "mois":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    return days
+
+def _days(cube):
+    return cube["jour"].astype("datetime64[s]").to_numpy().astype("datetime64[D]")
+
+def _regroup(t):
+    out = rollup(t, KEYS).drop(columns="mean")
+    out["periode"] = out["periode"].astype("datetime64[us]")
+    return enforce_schema(out).astype(CUBE_SCHEMA)
+
+def rollup_grains(cube):
+    """Tables jour, semaine et mois d'un cube (ou d'un fragment de cube) : partiels additifs,
+    recombinables entre fragments par combine_grains. Semaines et mois sont tirés du jour."""
+    day = _regroup(cube.assign(periode=_days(cube)))
+    d = day["periode"].to_numpy().astype("datetime64[D]")
+    return {
+        "jour": day,
+        "semaine": _regroup(day.assign(periode=bucket(d, "semaine"))),
+        "mois": _regroup(day.assign(periode=bucket(d, "mois"))),
+    }
+
+def combine_grains(parts):
+    """Fusionne les tables de plusieurs fragments (sommes, effectifs, min, max par case)."""
+    return {g: _regroup(pd.concat([p[g] for p in parts], ignore_index=True)) for g in ("jour", "semaine", "mois")}
+
+class RollupEngine:
+    """Séries temporelles longues à la granularité adaptée, sans relire les lignes brutes.
+
+    `cube` fournit la table horaire ; `parts` (un dict de rollup_grains par fragment) évite de
+    recalculer les tables jour/semaine/mois des fragments inchangés après une ingestion.
+    """
+    def __init__(self, cube, parts=None):
+        days = _days(cube).astype("datetime64[h]")
+        hourly = cube.assign(periode=(days + cube["heure"].to_numpy().astype("int64").astype("timedelta64[h]"))
+                             .astype("datetime64[us]"))
+        self.tables = {"heure": hourly[KEYS + list(CUBE_SCHEMA)],
+                       **combine_grains(parts if parts else [rollup_grains(cube)])}
+        periode = self.tables["heure"]["periode"]
+        self.start = periode.min() if len(periode) else None
+        self.end = periode.max() if len(periode) else None
+
+    def pick_grain(self, start=None, end=None, max_points=MAX_POINTS):
+        """La plus fine granularité dont le nombre de cases sur [start, end] tient dans
+        `max_points` : toute granularité plus fine dépasserait la résolution du graphique."""
+        start, end = start or self.start, end or self.end
+        if start is None:
+            return "jour"
+        span = np.datetime64(pd.Timestamp(end), "h") - np.datetime64(pd.Timestamp(start), "h") + GRAINS["heure"]
+        for grain, step in GRAINS.items():
+            if span / step <= max_points:
+                return grain
+        return "mois"
+
+    def series(self, pollutants=None, start=None, end=None, stations=None, grain=None,
+               by_station=False, max_points=MAX_POINTS):
+        """Série (periode, pollutant[, station_code]) avec sum, count, min, max, dépassements
+        et moyenne. `grain=None` : choisie par pick_grain ; la granularité retenue est dans
+        `out.attrs["grain"]`. Les cases à cheval sur `start` sont gardées entières."""
+        grain = grain or self.pick_grain(start, end, max_points)
+        t = self.tables[grain]
+        mask = np.ones(len(t), dtype=bool)
+        if pollutants is not None:
+            mask &= t["pollutant"].isin(list(pollutants)).to_numpy()
+        if stations is not None:
+            mask &= t["station_code"].isin(list(stations)).to_numpy()
+        if start is not None:
+            first = pd.Timestamp(start).floor("h") if grain == "heure" else \
+                pd.Timestamp(bucket([np.datetime64(pd.Timestamp(start), "D")], grain)[0])
+            mask &= (t["periode"] >= first).to_numpy()
+        if end is not None:
+            mask &= (t["periode"] <= pd.Timestamp(end)).to_numpy()
+        keys = ["periode", "pollutant"] + (["station_code"] if by_station else [])
+        out = rollup(t[mask], keys).sort_values(keys, ignore_index=True)
+        out.attrs["grain"] = grain
+        return out
@@ -0,0 +1,187 @@
+# utils/service.py
+# Agrégats de l'app (KPIs, profils horaires, moyennes annuelles/mensuelles, dépassements) hors
+# Streamlit : requêtes par lots, calcul groupé par sélection, cache par version (cf. api.py)
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.prep import MOIS_FR
+from utils.rangeindex import HourRangeIndex, HOURS
+from utils.exceedances import ExceedanceEngine
+
+TABLES = ("kpis", "hourly", "year_avg", "month_avg", "exceedances")
+MAX_BATCH = 256         # états par requête
+CACHE_SIZE = 1024       # réponses gardées par version (LRU)
+
+def parse_state(state):
+    """État de filtres normalisé (listes triées, plage horaire bornée) ; ValueError si invalide.
+
+    {"pollutants": ["NO2"], "years": [2024], "months": [8, 9], "hour_range": [0, 23],
+     "tables": ["kpis", "hourly"], "regulatory": false} — seul `pollutants` est obligatoire.
+    """
+    if not isinstance(state, dict):
+        raise ValueError("état de filtres : objet attendu")
+    unknown = set(state) - {"pollutants", "years", "months", "hour_range", "tables", "regulatory"}
+    if unknown:
+        raise ValueError(f"clés inconnues : {sorted(unknown)}")
+    # une chaîne nue est itérable : sans ce contrôle, "NO2" deviendrait ("2", "N", "O")
+    for k in ("pollutants", "years", "months", "tables"):
+        if state.get(k) is not None and not isinstance(state[k], list):
+            raise ValueError(f"`{k}` : liste attendue")
+    if not isinstance(state.get("hour_range", ()), (list, tuple)):
+        raise ValueError("`hour_range` : liste [h0, h1] attendue")
+    pollutants = state.get("pollutants")
+    if not pollutants or not all(isinstance(p, str) for p in pollutants):
+        raise ValueError("`pollutants` : liste non vide de libellés")
+    try:
+        years = None if state.get("years") is None else tuple(sorted({int(y) for y in state["years"]}))
+        months = None if state.get("months") is None else tuple(sorted({int(m) for m in state["months"]}))
+        h0, h1 = (int(h) for h in state.get("hour_range", (0, HOURS - 1)))
+    except (TypeError, ValueError):
+        raise ValueError("`years`, `months`, `hour_range` : entiers attendus") from None
+    if not 0 <= h0 <= h1 < HOURS:
+        raise ValueError(f"`hour_range` : 0 ≤ h0 ≤ h1 ≤ {HOURS - 1}")
+    tables = tuple(state.get("tables", TABLES))
+    if set(tables) - set(TABLES):
+        raise ValueError(f"`tables` : parmi {list(TABLES)}")
+    return {"pollutants": tuple(sorted(set(pollutants))), "years": years, "months": months,
+            "hour_range": (h0, h1), "tables": tables, "regulatory": bool(state.get("regulatory", False))}
+
+def _key(state):
+    return tuple(sorted(state.items()))
+
+def _codes(frame, cols):
+    """Identifiant de groupe de chaque ligne de `frame` sur `cols`, et les clés des groupes."""
+    g = frame.groupby(cols, observed=True, sort=True)
+    return g.ngroup().to_numpy(), g.size().reset_index()[cols]
+
+def _sum_by(ids, n, values):
+    """Sommes par groupe ; `values` 1-D ou 2-D (une colonne par heure)."""
+    out = np.zeros((n,) + values.shape[1:], dtype=values.dtype)
+    np.add.at(out, ids, values)
+    return out
+
+def _max_by(ids, n, values):
+    out = np.full((n,) + values.shape[1:], -np.inf, dtype=values.dtype)
+    np.maximum.at(out, ids, values)
+    return out
+
+class AggregationService:
+    """Réponses des états de filtres sur un cube, pour une version du dataset.
+
+    batch() regroupe les états par (années, mois, plage horaire) : pour chaque groupe, les
+    partiels de la plage (HourRangeIndex) sont réduits une fois par (année, polluant),
+    (année, mois, polluant) et (année, heure, polluant) pour l'union de ses polluants — en
+    sommes NumPy groupées —, les dépassements une fois par (clé, fenêtre, année), puis chaque
+    état n'en garde que ses polluants. Les réponses sont
+    mémorisées (LRU) : en lecture seule.
+    """
+
+    def __init__(self, cube, version=None, maxsize=CACHE_SIZE):
+        self.version = version
+        self.index = HourRangeIndex(cube, maxsize=0)
+        self.exceed = ExceedanceEngine(cube)
+        keys = self.index.keys
+        self._year = _codes(keys, ["annee", "pollutant"])
+        self._month = _codes(keys, ["annee", "mois", "pollutant"])
+        self._month[1]["mois_label"] = self._month[1]["mois"].map(MOIS_FR).fillna(self._month[1]["mois"].astype(str))
+        self._station = pd.factorize(keys["station_code"])[0]
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def meta(self):
+        k = self.index.keys
+        return {"version": self.version,
+                "pollutants": sorted(k["pollutant"].astype(str).unique().tolist()),
+                "years": sorted(int(y) for y in k["annee"].unique()),
+                "months": sorted(int(m) for m in k["mois"].unique()),
+                "tables": list(TABLES)}
+
+    def batch(self, states):
+        """Réponses (dict de tables) des états, dans l'ordre ; `states` déjà passés par parse_state."""
+        if len(states) > MAX_BATCH:
+            raise ValueError(f"au plus {MAX_BATCH} états par lot")
+        out = [None] * len(states)
+        todo = {}
+        with self._lock:
+            for i, s in enumerate(states):
+                k = _key(s)
+                if k in self._cache:
+                    self._cache.move_to_end(k)
+                    out[i] = self._cache[k]
+                else:
+                    todo.setdefault(k, (s, []))[1].append(i)
+
+        groups = {}
+        for k, (s, _) in todo.items():
+            groups.setdefault((s["years"], s["months"], s["hour_range"]), []).append(k)
+        for (years, months, hour_range), keys in groups.items():
+            pols = sorted({p for k in keys for p in todo[k][0]["pollutants"]})
+            wanted = {t for k in keys for t in todo[k][0]["tables"]}
+            shared = self._reduce(pols, years, months, hour_range, wanted)
+            for k in keys:
+                s, where = todo[k]
+                res = self._answer(s, shared)
+                for i in where:
+                    out[i] = res
+                with self._lock:
+                    self._cache[k] = res
+                    while len(self._cache) > self.maxsize:
+                        self._cache.popitem(last=False)
+        return out
+
+    def _reduce(self, pollutants, years, months, hour_range, wanted=TABLES):
+        """Calcul commun à un groupe d'états : partiels par groupe de l'index, tables par
+        polluant (annuelle, mensuelle, horaire) de tous les polluants du groupe, totaux des
+        dépassements ; seulement ce que `wanted` demande."""
+        idx = self.index
+        m = idx.mask(pollutants, years, months)
+        r = idx.range_arrays(m, hour_range)
+        h0, h1 = hour_range
+        tables = {}
+        for name, (ids, labels) in (("year_avg", self._year), ("month_avg", self._month)):
+            if name in wanted or (name == "year_avg" and "exceedances" in wanted):
+                n = len(labels)
+                s, c = _sum_by(ids[m], n, r["sum"]), _sum_by(ids[m], n, r["count"])
+                t = labels.assign(moyenne=s / np.where(c > 0, c, 1))
+                tables[name] = t[c > 0].reset_index(drop=True)
+        if "hourly" in wanted:
+            ids, labels = self._year
+            n = len(labels)
+            hs = _sum_by(ids[m], n, idx.sum[m, h0:h1 + 1])
+            hc = _sum_by(ids[m], n, idx.count[m, h0:h1 + 1])
+            hm = _max_by(ids[m], n, idx.max[m, h0:h1 + 1])
+            keep = hc > 0
+            g, h = np.nonzero(keep)
+            tables["hourly"] = labels.iloc[g].reset_index(drop=True).assign(
+                heure=(h + h0).astype("int8"), mean=hs[keep] / hc[keep], max=hm[keep]
+            )[["annee", "heure", "pollutant", "mean", "max"]]
+        return {"mask": m, "range": r, "pollutant": idx.keys["pollutant"].to_numpy()[m], "tables": tables,
+                "exceedances": self.exceed.totals(months, hour_range) if "exceedances" in wanted else None}
+
+    def _answer(self, s, shared):
+        ps = list(s["pollutants"])
+        cols = {"hourly": ["annee", "heure", "pollutant", "mean", "max"], "year_avg": ["annee", "pollutant", "moyenne"],
+                "month_avg": ["annee", "mois_label", "pollutant", "moyenne"]}
+        res = {t: v.loc[v["pollutant"].isin(ps), cols[t]].reset_index(drop=True)
+               for t, v in shared["tables"].items()}
+        if "kpis" in s["tables"]:
+            r = shared["range"]
+            sel = np.isin(shared["pollutant"], ps) & (r["count"] > 0)
+            n = int(r["count"][sel].sum())
+            res["kpis"] = {
+                "nb_rows": n,
+                "nb_days": self.index.nb_days(ps, s["years"], s["months"]),
+                "nb_stations": int(np.unique(self._station[shared["mask"]][sel]).size),
+                "mean": float(r["sum"][sel].sum() / n) if n else None,
+                "max": float(r["max"][sel].max()) if n else None,
+            }
+        if "exceedances" in s["tables"]:
+            years = list(s["years"]) if s["years"] is not None else sorted(res["year_avg"]["annee"].unique().tolist())
+            res["exceedances"] = pd.concat(
+                [self.exceed.by_year(p, years, regulatory=s["regulatory"], totals=shared["exceedances"])
+                   .assign(pollutant=p) for p in ps], ignore_index=True)
+        return {t: res[t] for t in s["tables"]}
@@ -0,0 +1,104 @@
+# utils/sql.py
+from pathlib import Path
+
+from utils.prep import THRESHOLDS, norm_pollutant_key, enforce_schema, summary_tables, hourly_table, CUBE_SCHEMA
+
+try:
+    import duckdb
+except ImportError:  # moteur optionnel : pip install duckdb
+    duckdb = None
+
+class SQLBackend:
+    """Moteur d'agrégation hors mémoire : requêtes DuckDB multi-threadées, en flux, sur les
+    fichiers Parquet (fichier unique ou dataset partitionné), sans charger les lignes brutes.
+
+    Même interface que FilterEngine (values / filter) et HourRangeIndex (range_cube /
+    hourly_cells / tables) : les sections l'utilisent sans changement. Seuls les agrégats
+    (au plus une ligne par station × heure de la sélection) remontent en pandas.
+    """
+
+    def __init__(self, path, threads=None, memory_limit="2GB", temp_directory=None):
+        if duckdb is None:
+            raise ImportError("Le moteur SQL nécessite duckdb : pip install duckdb")
+        path = Path(path)
+        hive = path.is_dir()
+        files = str(path / "**" / "*.parquet") if hive else str(path)
+        self.con = duckdb.connect()
+        if threads:
+            self.con.execute(f"SET threads TO {int(threads)}")
+        self.con.execute(f"SET memory_limit = '{memory_limit}'")
+        if temp_directory:
+            self.con.execute(f"SET temp_directory = '{temp_directory}'")
+        self.con.execute(
+            f"CREATE VIEW mesures AS SELECT * FROM read_parquet('{files}', hive_partitioning = {str(hive).lower()})"
+        )
+        pols = [r[0] for r in self.con.execute("SELECT DISTINCT pollutant FROM mesures").fetchall()]
+        thr = [(p, float(THRESHOLDS[norm_pollutant_key(p)])) for p in pols if norm_pollutant_key(p) in THRESHOLDS]
+        self.con.execute("CREATE TABLE seuils (pollutant VARCHAR, seuil DOUBLE)")
+        if thr:
+            self.con.executemany("INSERT INTO seuils VALUES (?, ?)", thr)
+
+    def _query(self, sql, params=()):
+        # un curseur par requête : la connexion est partagée entre sessions (threads)
+        return self.con.cursor().execute(sql, list(params)).df()
+
+    @staticmethod
+    def _where(pollutants=None, years=None, months=None, hour_range=None):
+        clauses, params = [], []
+        for col, values in [("pollutant", pollutants), ("annee", years), ("mois", months)]:
+            if values is not None:
+                values = list(values)
+                if not values:
+                    clauses.append("FALSE")
+                    continue
+                clauses.append(f"m.{col} IN ({', '.join('?' * len(values))})")
+                params += [str(v) if col == "pollutant" else int(v) for v in values]
+        if hour_range is not None:
+            clauses.append("m.heure BETWEEN ? AND ?")
+            params += [int(hour_range[0]), int(hour_range[1])]
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _cube(self, keys, **sel):
+        """Partiels du cube (sum/count/min/max/dépassements) groupés par `keys`."""
+        where, params = self._where(**sel)
+        cols = ", ".join(f"m.{k}" for k in keys)
+        out = self._query(f"""
+            SELECT {cols},
+                   sum(m.value::DOUBLE) AS sum, count(m.value) AS count,
+                   min(m.value) AS min, max(m.value) AS max,
+                   count(*) FILTER (WHERE m.value > s.seuil) AS depassements
+            FROM mesures m LEFT JOIN seuils s ON m.pollutant = s.pollutant
+            {where}
+            GROUP BY {cols}
+            ORDER BY {cols}
+        """, params)
+        return enforce_schema(out).astype(CUBE_SCHEMA)
+
+    # Interface FilterEngine
+    def values(self, col):
+        return [r[0] for r in self.con.cursor().execute(
+            f"SELECT DISTINCT {col} FROM mesures WHERE {col} IS NOT NULL ORDER BY 1").fetchall()]
+
+    def filter(self, pollutants=None, years=None, months=None, hour_range=None):
+        """Cube de la sélection (une ligne par station × heure), calculé par DuckDB."""
+        return self._cube(["annee", "mois", "jour", "heure", "pollutant", "station_code"],
+                          pollutants=pollutants, years=years, months=months, hour_range=hour_range)
+
+    # Interface HourRangeIndex
+    def range_cube(self, pollutants=None, years=None, months=None, hour_range=(0, 23)):
+        return self._cube(["pollutant", "annee", "mois", "station_code"],
+                          pollutants=pollutants, years=years, months=months, hour_range=hour_range)
+
+    def hourly_cells(self, pollutants=None, years=None, months=None, hour_range=(0, 23)):
+        return self._cube(["pollutant", "annee", "mois", "station_code", "heure"],
+                          pollutants=pollutants, years=years, months=months, hour_range=hour_range)
+
+    def tables(self, pollutants=None, years=None, months=None, hour_range=(0, 23)):
+        """Mêmes sorties que utils.prep.make_tables."""
+        sel = dict(pollutants=pollutants, years=years, months=months, hour_range=hour_range)
+        tables = summary_tables(self.range_cube(**sel))
+        where, params = self._where(**sel)
+        tables["kpis"]["nb_days"] = int(self.con.cursor().execute(
+            f"SELECT count(DISTINCT m.jour) FROM mesures m {where}", params).fetchone()[0])
+        tables["hourly"] = hourly_table(self.hourly_cells(**sel))
+        return tables
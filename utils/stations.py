@@ -0,0 +1,170 @@
+# utils/stations.py
+# Dimension stations (une ligne par station) + index spatial en grille (plus proches voisins, rayon)
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils.io import to_arrow
+from utils.prep import _norm, enforce_schema
+
+STATION_COLUMNS = ["station_code", "station_name", "code_zas", "zas", "implantation_type", "influence_type"]
+EARTH_KM = 6371.0088
+KM_PER_DEG = np.pi * EARTH_KM / 180
+GRID_DEG = 0.5      # case de l'index spatial (≈ 55 km en latitude)
+
+def _pick(columns, names, path):
+    for n in names:
+        if n in columns:
+            return n
+    raise ValueError(f"{path} : aucune colonne parmi {names}")
+
+def read_sites(path):
+    """Coordonnées par site (liste des stations Geod'air : code site, latitude, longitude),
+    None si le fichier n'existe pas. Séparateur détecté, en-têtes normalisés."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    df = pd.read_csv(path, sep=None, engine="python", encoding="utf-8-sig", dtype=str)
+    df.columns = [_norm(c) for c in df.columns]
+    code = _pick(df.columns, ("code_site", "code_station", "station_code", "code"), path)
+    lat = _pick(df.columns, ("latitude", "lat", "y"), path)
+    lon = _pick(df.columns, ("longitude", "lon", "x"), path)
+    num = lambda s: pd.to_numeric(s.str.replace(",", ".", regex=False), errors="coerce")
+    return pd.DataFrame({"station_code": df[code].str.strip(), "lat": num(df[lat]), "lon": num(df[lon])}) \
+             .dropna().drop_duplicates("station_code", keep="last")
+
+def station_table(df, zas_coords=None, sites=None):
+    """Dimension stations depuis des lignes nettoyées : attributs de la dernière ligne de
+    chaque station, puis coordonnées du site (`sites`) si connues, sinon du centroïde de sa
+    ZAS (`zas_coords`, {code_zas: (lat, lon)}), sinon celles déjà présentes dans `df`.
+    La colonne `geo` indique la provenance : "site", "zas" ou None.
+    """
+    cols = [c for c in STATION_COLUMNS + ["lat", "lon"] if c in df.columns]
+    dim = df[cols].drop_duplicates("station_code", keep="last").reset_index(drop=True)
+    for c in dim.select_dtypes("category"):
+        dim[c] = dim[c].cat.remove_unused_categories()
+    if "lat" not in dim.columns:
+        dim["lat"] = dim["lon"] = np.nan
+    dim["geo"] = np.where(dim["lat"].notna(), "zas", None)
+
+    code = dim["station_code"].astype(str)
+    if zas_coords is not None and "code_zas" in dim.columns:
+        zas = pd.DataFrame.from_dict(zas_coords, orient="index", columns=["lat", "lon"])
+        z = dim["code_zas"].astype(str)
+        dim["lat"], dim["lon"] = z.map(zas["lat"]), z.map(zas["lon"])
+        dim["geo"] = np.where(dim["lat"].notna(), "zas", None)
+    if sites is not None:
+        s = sites.set_index("station_code")
+        lat, lon = code.map(s["lat"]), code.map(s["lon"])
+        has = lat.notna().to_numpy()
+        dim.loc[has, "lat"], dim.loc[has, "lon"], dim.loc[has, "geo"] = lat[has], lon[has], "site"
+    return enforce_schema(dim)
+
+def combine_stations(tables):
+    """Fusionne des dimensions partielles (blocs, fichiers) : la plus récente l'emporte."""
+    tables = [t for t in tables if t is not None and not t.empty]
+    if not tables:
+        return None
+    dim = pd.concat([t.astype({c: str for c in t.select_dtypes("category")}) for t in tables],
+                    ignore_index=True)
+    return enforce_schema(dim.drop_duplicates("station_code", keep="last").reset_index(drop=True))
+
+def save_stations(dim, path="data/processed/stations.parquet"):
+    """Écrit la dimension stations (remplacement atomique : l'app peut la relire à tout moment)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(to_arrow(dim), tmp)
+    tmp.replace(path)
+
+def read_stations(path="data/processed/stations.parquet"):
+    """Relit la dimension stations (None si elle n'a pas encore été construite)."""
+    path = Path(path)
+    return enforce_schema(pd.read_parquet(path)) if path.exists() else None
+
+def attach_coords(df, dim):
+    """Ajoute lat/lon aux lignes par jointure sur station_code : table de correspondance sur
+    les catégories, indexée par les codes (aucun appel Python par ligne)."""
+    key = df["station_code"]
+    if not isinstance(key.dtype, pd.CategoricalDtype):
+        key = key.astype("category")
+    d = dim.assign(station_code=dim["station_code"].astype(str)).set_index("station_code")
+    d = d.reindex(key.cat.categories.astype(str))
+    codes = key.cat.codes.to_numpy()
+    for c in ("lat", "lon"):
+        lut = np.append(d[c].to_numpy(dtype="float64"), np.nan)    # code -1 → NaN
+        df[c] = lut[codes]
+    return df
+
+def haversine_km(lat0, lon0, lat, lon):
+    """Distance orthodromique (km) d'un point à des tableaux de points (degrés)."""
+    lat0, lon0, lat, lon = map(np.radians, (lat0, lon0, lat, lon))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+class SpatialIndex:
+    """Index en grille régulière sur les stations géolocalisées.
+
+    within() ne calcule les distances que pour les cases qui recouvrent le cercle ; nearest()
+    élargit le rayon (×2) jusqu'à trouver `n` stations — exact, car toute station hors du
+    cercle est plus loin que celles qu'il contient.
+    """
+    def __init__(self, stations, cell=GRID_DEG):
+        self.stations = stations.dropna(subset=["lat", "lon"]).reset_index(drop=True)
+        self.cell = cell
+        self.lat = self.stations["lat"].to_numpy(dtype="float64")
+        self.lon = self.stations["lon"].to_numpy(dtype="float64")
+        ci = np.floor(self.lat / cell).astype(int)
+        cj = np.floor(self.lon / cell).astype(int)
+        order = np.lexsort((cj, ci))
+        keys = np.column_stack([ci[order], cj[order]])
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)]) if len(keys) else []
+        bounds = np.r_[starts, len(keys)]
+        self.cells = {tuple(keys[s]): order[s:e] for s, e in zip(bounds[:-1], bounds[1:])}
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _result(self, idx, dist):
+        o = np.argsort(dist, kind="stable")
+        return self.stations.iloc[idx[o]].assign(distance_km=dist[o]).reset_index(drop=True)
+
+    def within(self, lat, lon, radius_km):
+        """Stations à moins de `radius_km` du point, triées par distance (colonne distance_km)."""
+        dlat = radius_km / KM_PER_DEG
+        dlon = min(180.0, dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        i0, i1 = int(np.floor((lat - dlat) / self.cell)), int(np.floor((lat + dlat) / self.cell))
+        j0, j1 = int(np.floor((lon - dlon) / self.cell)), int(np.floor((lon + dlon) / self.cell))
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):     # grand rayon : on parcourt les cases
+            parts = [v for (i, j), v in self.cells.items() if i0 <= i <= i1 and j0 <= j <= j1]
+        else:
+            parts = [self.cells[k] for k in ((i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+                     if k in self.cells]
+        idx = np.concatenate(parts) if parts else np.array([], dtype=int)
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        keep = dist <= radius_km
+        return self._result(idx[keep], dist[keep])
+
+    def nearest(self, lat, lon, n=5):
+        """Les `n` stations les plus proches du point (colonne distance_km)."""
+        radius = self.cell * KM_PER_DEG
+        while True:
+            res = self.within(lat, lon, radius)
+            if len(res) >= n or radius >= np.pi * EARTH_KM:
+                return res.head(n)
+            radius *= 2
+
+def clusters(stations, cell=GRID_DEG):
+    """Agrégation spatiale côté serveur pour la carte : une ligne par case de `cell` degrés
+    (centre de gravité, nombre de stations, une station représentative)."""
+    geo = stations.dropna(subset=["lat", "lon"])
+    if geo.empty:
+        return pd.DataFrame(columns=["lat", "lon", "stations", "exemple"])
+    key = [np.floor(geo["lat"].to_numpy() / cell), np.floor(geo["lon"].to_numpy() / cell)]
+    name = "station_name" if "station_name" in geo.columns else "station_code"
+    return (geo.assign(exemple=geo[name].astype(str))
+               .groupby(key, sort=False)
+               .agg(lat=("lat", "mean"), lon=("lon", "mean"), stations=("station_code", "size"),
+                    exemple=("exemple", "first"))
+               .reset_index(drop=True))
@@ -0,0 +1,168 @@
+# utils/synth.py
+# Générateur de fichiers E2 synthétiques (même format que les CSV Geod'air) pour les benchmarks
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+E2_COLUMNS = [
+    "Date de début", "Date de fin", "Organisme", "code zas", "Zas", "code site", "nom site",
+    "type d'implantation", "Polluant", "type d'influence", "discriminant", "Réglementaire",
+    "type d'évaluation", "procédure de mesure", "type de valeur", "valeur", "valeur brute",
+    "unité de mesure", "taux de saisie", "couverture temporelle", "couverture de données",
+    "code qualité", "validité",
+]
+DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+# (code zas, zas, organisme) : codes présents dans ZAS_COORDS (merge_data.py)
+ZONES = [
+    ("FR44ZAG02", "ZAG METZ", "ATMO GRAND EST"),
+    ("FR44ZAG03", "ZAG STRASBOURG", "ATMO GRAND EST"),
+    ("FR11ZAS01", "ZAS PARIS", "AIRPARIF"),
+    ("FR11ZAS02", "ZAS SEINE-SAINT-DENIS", "AIRPARIF"),
+    ("FR32ZAH01", "ZAH LILLE", "ATMO HAUTS DE FRANCE"),
+    ("FR28ZAN01", "ZAN ROUEN", "ATMO NORMANDIE"),
+    ("FR53ZAB01", "ZAB RENNES", "AIR BREIZH"),
+    ("FR52ZAP01", "ZAP NANTES", "AIR PAYS DE LA LOIRE"),
+    ("FR75ZAA01", "ZAA BORDEAUX", "ATMO NOUVELLE-AQUITAINE"),
+    ("FR76ZAO01", "ZAO TOULOUSE", "ATMO OCCITANIE"),
+    ("FR84ZAR01", "ZAR LYON", "ATMO AUVERGNE-RHÔNE-ALPES"),
+    ("FR84ZAR02", "ZAR GRENOBLE", "ATMO AUVERGNE-RHÔNE-ALPES"),
+    ("FR93ZAP01", "ZAP MARSEILLE", "ATMO SUD"),
+    ("FR93ZAP02", "ZAP NICE", "ATMO SUD"),
+]
+IMPLANTATIONS = (["Urbaine", "Périurbaine", "Rurale régionale", "Rurale près des villes", "Rurale nationale"],
+                 [0.68, 0.20, 0.05, 0.04, 0.03])
+INFLUENCES = (["Fond", "Trafic", "Industrielle"], [0.69, 0.21, 0.10])
+EVALUATIONS = (["mesures fixes", "mesures indicatives", "estimation objective"], [0.89, 0.09, 0.02])
+
+# polluant : (probabilité qu'une station le mesure, médiane, dispersion log-normale, profil, unité)
+POLLUTANTS = {
+    "NO2":        (0.75, 6.6, 0.8, "trafic", "µg-m3"),
+    "NOX as NO2": (0.75, 8.5, 1.0, "trafic", "µg-m3"),
+    "NO":         (0.75, 1.1, 1.2, "trafic", "µg-m3"),
+    "PM10":       (0.70, 10.1, 0.6, "trafic", "µg-m3"),
+    "PM2.5":      (0.50, 4.9, 0.6, "trafic", "µg-m3"),
+    "O3":         (0.30, 60.9, 0.4, "ozone", "µg-m3"),
+    "SO2":        (0.16, 0.9, 1.0, "plat", "µg-m3"),
+    "CO":         (0.03, 0.17, 0.5, "trafic", "mg-m3"),
+    "C6H6":       (0.01, 0.29, 1.0, "trafic", "µg-m3"),
+}
+_HOURS = np.arange(24)
+PROFILES = {
+    # pics du matin et du soir (trafic), maximum l'après-midi (ozone)
+    "trafic": 1 + 0.6 * np.exp(-((_HOURS - 7.5) ** 2) / 4) + 0.4 * np.exp(-((_HOURS - 19.5) ** 2) / 4),
+    "ozone": 0.6 + 0.8 * np.exp(-((_HOURS - 15) ** 2) / 12),
+    "plat": np.ones(24),
+}
+RENTREE = 1.25          # septembre : surcroît des polluants de trafic
+INVALID_RATE = 0.03     # validité -1
+MISSING_RATE = 0.01     # valeur vide (validité -1)
+REPRISE_RATE = 0.07     # code qualité R (reprise) au lieu de A
+
+def stations(n, seed=0):
+    """Catalogue de `n` stations avec leurs attributs et les polluants qu'elles mesurent."""
+    rng = np.random.default_rng(seed)
+    zones = rng.integers(len(ZONES), size=n)
+    cat = pd.DataFrame({
+        "code site": [f"FR{10001 + i:05d}" for i in range(n)],
+        "nom site": [f"{ZONES[z][1][4:].title()}-Site{i:04d}" for i, z in enumerate(zones)],
+        "code zas": [ZONES[z][0] for z in zones],
+        "Zas": [ZONES[z][1] for z in zones],
+        "Organisme": [ZONES[z][2] for z in zones],
+        "type d'implantation": rng.choice(IMPLANTATIONS[0], n, p=IMPLANTATIONS[1]),
+        "type d'influence": rng.choice(INFLUENCES[0], n, p=INFLUENCES[1]),
+        "type d'évaluation": rng.choice(EVALUATIONS[0], n, p=EVALUATIONS[1]),
+        "niveau": rng.lognormal(0, 0.3, n),     # station plus ou moins exposée
+    })
+    series = []
+    for pol, (p, *_rest) in POLLUTANTS.items():
+        has = rng.random(n) < p
+        has[0] = has[0] or pol in ("NO2", "PM10")   # au moins une série pour la paire par défaut
+        series.append(pd.DataFrame({"station": np.flatnonzero(has), "Polluant": pol}))
+    return cat, pd.concat(series, ignore_index=True).sort_values(["station", "Polluant"], ignore_index=True)
+
+def calendar(n_days, start_year=2024):
+    """`n_days` jours répartis sur août et septembre d'au moins deux années consécutives
+    (mois et années comparés par l'application), dans l'ordre chronologique."""
+    n_years = max(2, -(-n_days // 61))
+    pool = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(f"{y}-08-01", f"{y}-09-30", freq="D") for y in range(start_year, start_year + n_years)
+    ]))
+    return pool[np.unique(np.linspace(0, len(pool) - 1, n_days).round().astype(int))]
+
+def e2_day(day, catalog, series, rng):
+    """Lignes E2 d'une journée : 24 heures × séries (station, polluant)."""
+    n_series = len(series)
+    st_idx = np.repeat(series["station"].to_numpy(), 24)
+    pol = np.repeat(series["Polluant"].to_numpy(), 24)
+    hour = np.tile(_HOURS, n_series)
+
+    median = np.array([POLLUTANTS[p][1] for p in POLLUTANTS])
+    sigma = np.array([POLLUTANTS[p][2] for p in POLLUTANTS])
+    profile = np.stack([PROFILES[POLLUTANTS[p][3]] for p in POLLUTANTS])
+    units = np.array([POLLUTANTS[p][4] for p in POLLUTANTS])
+    trafic = np.array([POLLUTANTS[p][3] == "trafic" for p in POLLUTANTS])
+    p_idx = pd.Categorical(pol, categories=list(POLLUTANTS)).codes
+
+    level = catalog["niveau"].to_numpy()[st_idx] * profile[p_idx, hour]
+    if day.month == 9:
+        level = np.where(trafic[p_idx], level * RENTREE, level)
+    raw = median[p_idx] * level * rng.lognormal(0, sigma[p_idx] / 2, len(hour))
+    raw = raw + rng.normal(0, 0.05 * median[p_idx])     # bruit capteur (valeurs négatives possibles)
+
+    invalid = rng.random(len(hour)) < INVALID_RATE
+    missing = rng.random(len(hour)) < MISSING_RATE
+    value = np.round(raw, 1).astype(object)
+    value[missing] = ""
+    raw_txt = np.round(raw, 3).astype(object)
+    raw_txt[missing] = ""
+
+    debut = pd.date_range(day, periods=24, freq="h").strftime(DATE_FORMAT).to_numpy()
+    fin = pd.date_range(day + pd.Timedelta(hours=1), periods=24, freq="h").strftime(DATE_FORMAT).to_numpy()
+    attrs = catalog.drop(columns="niveau").iloc[st_idx].reset_index(drop=True)
+
+    out = pd.DataFrame({
+        "Date de début": debut[hour],
+        "Date de fin": fin[hour],
+        **{c: attrs[c] for c in ["Organisme", "code zas", "Zas", "code site", "nom site", "type d'implantation"]},
+        "Polluant": pol,
+        "type d'influence": attrs["type d'influence"],
+        "discriminant": "A",
+        "Réglementaire": "Oui",
+        "type d'évaluation": attrs["type d'évaluation"],
+        "procédure de mesure": [f"Auto {p} Conf app SYNTH" for p in pol],
+        "type de valeur": "moyenne horaire validée",
+        "valeur": value,
+        "valeur brute": raw_txt,
+        "unité de mesure": units[p_idx],
+        "taux de saisie": "",
+        "couverture temporelle": "",
+        "couverture de données": "",
+        "code qualité": np.where(rng.random(len(hour)) < REPRISE_RATE, "R", "A"),
+        "validité": np.where(invalid | missing, -1, 1),
+    })
+    return out[E2_COLUMNS]
+
+def write_e2(root, n_rows, seed=0, n_stations=None, start_year=2024):
+    """Écrit `n_rows` lignes E2 synthétiques dans `root`, un fichier FR_E2_AAAA-MM-JJ.csv par jour
+    (séparateur ;), en mémoire bornée à une journée. Retourne la liste des fichiers.
+
+    Par défaut le nombre de stations croît avec `n_rows` (10 à 2 500) : les gros volumes
+    couvrent plusieurs étés plutôt que des journées démesurées ; les petits gardent au moins
+    deux années × deux mois.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    n_stations = n_stations or int(np.clip(n_rows // 2000, 10, 2500))
+    catalog, series = stations(n_stations, seed)
+    rng = np.random.default_rng(seed + 1)
+
+    per_day = 24 * len(series)
+    paths, left = [], int(n_rows)
+    for day in calendar(-(-left // per_day), start_year):
+        df = e2_day(day, catalog, series, rng).iloc[:left]
+        path = root / f"FR_E2_{day:%Y-%m-%d}.csv"
+        df.to_csv(path, sep=";", index=False)
+        paths.append(path)
+        left -= len(df)
+    return paths
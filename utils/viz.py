@@ -1,26 +1,101 @@
 # utils/viz.py
+import numpy as np
 import streamlit as st
 import pandas as pd
 import altair as alt
 
+from utils.perf import timed, note
+
+# Budgets de points envoyés au navigateur (au-delà : sous-échantillonnage / binning côté serveur)
+MAX_LINE_POINTS = 1000     # par série
+MAX_SCATTER_POINTS = 5000  # au total
+HEATMAP_BINS = 40
+
 def _empty(df, cols):
     return df is None or df.empty or not set(cols).issubset(df.columns)
 
-def line_chart(df, x, y, color = None, title = "", height = 320):
+def _payload_bytes(df):
+    """Taille estimée des données envoyées (mémoire des colonnes, sans sérialiser) : proche du
+    flux Arrow pour des colonnes numériques, sous-estimée pour les chaînes."""
+    return int(df.memory_usage(index=False, deep=False).sum())
+
+def _show(chart, data, kind):
+    """Affiche le graphique (données en Arrow via st.altair_chart) ; la mesure en cours
+    (décorateur `timed`) reçoit le type de rendu, les lignes envoyées et la taille estimée."""
+    st.altair_chart(chart, use_container_width=True)
+    note(chart=kind, rows_out=len(data), payload_bytes=_payload_bytes(data))
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets : indices de `n_out` points qui préservent la forme
+    de la courbe (x trié). Retourne tous les indices si la série est déjà assez courte."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def downsample_lines(df, x, y, color=None, max_points=MAX_LINE_POINTS):
+    """LTTB par série (une série par valeur de `color`)."""
+    groups = df.groupby(color, observed=True, sort=False) if color else [(None, df)]
+    parts = []
+    for _, g in groups:
+        g = g.sort_values(x)
+        if len(g) > max_points:
+            xs = g[x].astype("int64") if pd.api.types.is_datetime64_any_dtype(g[x]) else g[x]
+            g = g.iloc[lttb(xs.to_numpy(), g[y].to_numpy(), max_points)]
+        parts.append(g)
+    return pd.concat(parts, ignore_index=True) if parts else df
+
+def bin_2d(df, x, y, color=None, bins=HEATMAP_BINS):
+    """Histogramme 2D (effectifs par case), calculé côté serveur, par valeur de `color`."""
+    d = df[[x, y] + ([color] if color else [])].dropna(subset=[x, y])
+    x_edges = np.linspace(d[x].min(), d[x].max(), bins + 1)
+    y_edges = np.linspace(d[y].min(), d[y].max(), bins + 1)
+    groups = d.groupby(color, observed=True, sort=True) if color else [(None, d)]
+    parts = []
+    for key, g in groups:
+        counts, _, _ = np.histogram2d(g[x].to_numpy(float), g[y].to_numpy(float), bins=[x_edges, y_edges])
+        ix, iy = np.nonzero(counts)
+        part = pd.DataFrame({
+            "x0": x_edges[ix], "x1": x_edges[ix + 1],
+            "y0": y_edges[iy], "y1": y_edges[iy + 1],
+            "n": counts[ix, iy].astype(int),
+        })
+        if color:
+            part[color] = key
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+@timed()
+def line_chart(df, x, y, color = None, title = "", height = 320, x_type = "Q"):
     if _empty(df, [x, y] + ([color] if color else [])):
         st.info("Pas assez de données pour la courbe.")
         return
+    df = downsample_lines(df, x, y, color)
     enc = {
-        "x": alt.X(f"{x}:Q", title=x.replace("_", " ").title()),
+        "x": alt.X(f"{x}:{x_type}", title=x.replace("_", " ").title()),
         "y": alt.Y(f"{y}:Q", title=y.replace("_", " ").title()),
         "tooltip": [x, y] + ([color] if color else []),
     }
 
     if color:
         enc["color"] = alt.Color(f"{color}:N", title=color.replace("_", " ").title())
-    chart = alt.Chart(df).mark_line(point=True).encode(**enc).properties(title=title, height=height)
-    st.altair_chart(chart, use_container_width=True)
+    chart = alt.Chart(df).mark_line(point=len(df) <= 200).encode(**enc).properties(title=title, height=height)
+    _show(chart, df, "line")
 
+@timed()
 def bar_chart(df, x, y, color = None, title = "", height = 300):
     if _empty(df, [x, y] + ([color] if color else [])):
         st.info("Pas assez de données pour l’histogramme.")
@@ -35,4 +110,48 @@ def bar_chart(df, x, y, color = None, title = "", height = 300):
         enc["tooltip"].append(color)
     chart = alt.Chart(df).mark_bar().encode(**enc).properties(title=title, height=height)
     labels = chart.mark_text(dy=-6).encode(text=f"{y}:Q")
-    st.altair_chart(chart + labels, use_container_width=True)
+    _show(chart + labels, df, "bar")
+
+@timed()
+def scatter_chart(df, x, y, color = None, tooltip = None, title = "", height = 350,
+                  max_points = MAX_SCATTER_POINTS):
+    """Nuage de points ; au-delà de `max_points`, carte de densité 2D (effectifs par case)."""
+    if _empty(df, [x, y] + ([color] if color else [])):
+        st.info("Pas assez de données pour le nuage de points.")
+        return
+    if len(df) <= max_points:
+        enc = {"x": alt.X(f"{x}:Q", title=x), "y": alt.Y(f"{y}:Q", title=y),
+               "tooltip": tooltip or [x, y]}
+        if color:
+            enc["color"] = alt.Color(f"{color}:N", title=color.replace("_", " ").title())
+        chart = alt.Chart(df).mark_circle(size=60).encode(**enc).properties(title=title, height=height)
+        _show(chart, df, "scatter")
+        return
+
+    b = bin_2d(df, x, y, color)
+    enc = {
+        "x": alt.X("x0:Q", bin="binned", title=x), "x2": "x1",
+        "y": alt.Y("y0:Q", bin="binned", title=y), "y2": "y1",
+        "color": alt.Color("n:Q", title="Points", scale=alt.Scale(scheme="viridis")),
+        "tooltip": [alt.Tooltip("n:Q", title="Points")] + ([f"{color}:N"] if color else []),
+    }
+    if color:
+        enc["column"] = alt.Column(f"{color}:N", title=color.replace("_", " ").title())
+    chart = alt.Chart(b).mark_rect().encode(**enc).properties(title=title, height=height)
+    _show(chart, b, "heatmap")
+
+@timed()
+def heatmap_chart(df, x, y, value, title = "", height = 320, domain = (-1, 1)):
+    """Carte de chaleur catégorielle (ex. matrice de corrélation en forme longue)."""
+    if _empty(df, [x, y, value]):
+        st.info("Pas assez de données pour la carte de chaleur.")
+        return
+    base = alt.Chart(df).encode(
+        x=alt.X(f"{x}:N", title=None), y=alt.Y(f"{y}:N", title=None),
+        tooltip=[x, y, alt.Tooltip(f"{value}:Q", format=".2f")],
+    )
+    rect = base.mark_rect().encode(
+        color=alt.Color(f"{value}:Q", scale=alt.Scale(scheme="redblue", domain=list(domain), reverse=True))
+    )
+    labels = base.mark_text(fontSize=10).encode(text=alt.Text(f"{value}:Q", format=".2f"))
+    _show((rect + labels).properties(title=title, height=height), df, "heatmap")
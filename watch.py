@@ -0,0 +1,74 @@
+# watch.py
+# Ingestion « live » du flux E2 Up-To-Date : surveille un dossier de dépôt et ingère chaque
+# fichier nouveau ou modifié dans le dataset partitionné (même chemin que --incremental).
+#
+#   python watch.py                          # surveille data/raw, contrôle toutes les 2 s
+#   python watch.py --drop /tmp/e2 --interval 1
+#   python watch.py --once                   # une seule passe (tests, cron)
+#
+# Côté dashboard : AIRQ_LIVE=5 streamlit run app.py (rerun dès que le manifeste change ;
+# seules les partitions réécrites sont relues).
+import argparse
+import time
+from pathlib import Path
+
+from merge_data import MANIFEST_PATH, ingest_file, publish_summaries
+from utils.io import load_manifest, needs_ingest
+
+PATTERN = "FR_E2_*.csv"
+SETTLE = 1.0    # secondes sans modification avant de lire un fichier (copie en cours)
+
+
+def ready(p, settle):
+    """Fichier assez ancien pour ne plus être en cours d'écriture."""
+    try:
+        return time.time() - p.stat().st_mtime >= settle
+    except FileNotFoundError:
+        return False
+
+
+def poll(drop, manifest, settle=SETTLE):
+    """Une passe : ingère les fichiers prêts, nouveaux ou modifiés, puis publie catalogue,
+    rapport qualité et manifeste une seule fois. Retourne le nombre de fichiers ingérés."""
+    n = 0
+    t0 = time.perf_counter()
+    for p in sorted(Path(drop).glob(PATTERN)):
+        if not ready(p, settle) or not needs_ingest(p, manifest):
+            continue
+        try:
+            ingest_file(p, manifest, publish=False)
+        except Exception as e:     # un fichier illisible ne doit pas arrêter la surveillance
+            print(f" {p.name} : échec ({e}), nouvel essai à sa prochaine modification.")
+            manifest[p.name] = {"size": p.stat().st_size, "mtime": p.stat().st_mtime, "sha256": None}
+            continue
+        n += 1
+    if n:
+        publish_summaries(manifest)
+        print(f"   → visible en {time.perf_counter() - t0:.1f} s")
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion continue d'un dossier de dépôt E2.")
+    parser.add_argument("--drop", default="data/raw", help="dossier surveillé (défaut : data/raw)")
+    parser.add_argument("--interval", type=float, default=2.0, help="période de contrôle en secondes")
+    parser.add_argument("--settle", type=float, default=SETTLE,
+                        help="âge minimal (s) d'un fichier avant ingestion")
+    parser.add_argument("--once", action="store_true", help="une seule passe puis sortie")
+    args = parser.parse_args()
+
+    manifest = load_manifest(MANIFEST_PATH)
+    if args.once:
+        print(f"{poll(args.drop, manifest, 0):d} fichier(s) ingéré(s).")
+        return
+    print(f"Surveillance de {args.drop}/{PATTERN} toutes les {args.interval:g} s (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            poll(args.drop, manifest, args.settle)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Arrêt.")
+
+
+if __name__ == "__main__":
+    main()